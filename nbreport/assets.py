@@ -0,0 +1,372 @@
+"""Resolving the asset files of a report repository, and manifests of their
+content.
+"""
+
+__all__ = ('AssetResolver', 'AssetEntry', 'normalize_pattern',
+           'read_asset_manifest', 'write_asset_manifest')
+
+from collections import namedtuple
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path, PurePosixPath
+import re
+import stat
+
+from .fsutils import create_temp_file
+
+
+AssetEntry = namedtuple('AssetEntry', ['path', 'size', 'mtime_ns', 'sha256'])
+AssetEntry.__doc__ = """An asset file in a manifest.
+
+Parameters
+----------
+path : `str`
+    POSIX-style path of the file, relative to the root of the report
+    repository.
+size : int
+    Size of the file, in bytes.
+mtime_ns : int
+    Modification time of the file, in nanoseconds since the epoch.
+sha256 : `str`
+    SHA-256 hash of the file's content, as a hexadecimal string.
+"""
+
+
+class AssetResolver:
+    """Find the asset files of a report repository, given the rules of the
+    ``assets`` field in ``nbreport.yaml``.
+
+    Parameters
+    ----------
+    patterns : sequence of `str`
+        Asset rules. A rule that contains ``*`` is a glob pattern, relative
+        to the repository's root, where ``*`` matches within a path segment
+        and ``**`` matches any number of directories. Other rules name a
+        file, or a directory whose files are all assets.
+    exclude : sequence of `str`, optional
+        Rules, with the same syntax as ``patterns``, for files that aren't
+        assets even though they match ``patterns``.
+
+    Raises
+    ------
+    ValueError
+        Raised if a rule isn't a relative path inside the repository.
+
+    Notes
+    -----
+    All rules are compiled into one regular expression. The repository is
+    then walked once with `os.scandir`, starting from the directories that
+    the rules are anchored to, and each file's path is matched against the
+    expression. Each file is found once, however many rules match it. The
+    ``.git`` directory is never searched.
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, patterns, exclude=None):
+        super().__init__()
+        self._patterns = [normalize_pattern(p) for p in patterns]
+        self._exclude = [normalize_pattern(p) for p in exclude or []]
+        self._pattern_res = [re.compile(_translate_pattern(p), re.DOTALL)
+                             for p in self._patterns]
+        self._matcher = _compile_patterns(self._patterns)
+        self._exclude_matcher = _compile_patterns(self._exclude)
+
+    def __repr__(self):
+        return '{0}({1!r}, exclude={2!r})'.format(
+            self.__class__.__name__, self._patterns, self._exclude)
+
+    def match(self, path):
+        """Test if a path is an asset.
+
+        Parameters
+        ----------
+        path : `str`
+            POSIX-style path, relative to the repository's root.
+
+        Returns
+        -------
+        `bool`
+            `True` if the path matches a rule and no exclude rule.
+        """
+        if self._matcher is None or self._matcher.match(path) is None:
+            return False
+        return self._exclude_matcher is None \
+            or self._exclude_matcher.match(path) is None
+
+    def resolve(self, root):
+        """Find the asset files in a repository.
+
+        Parameters
+        ----------
+        root : `pathlib.Path` or `str`
+            Root directory of the report repository.
+
+        Returns
+        -------
+        paths : `list` of `pathlib.Path`
+            Paths of the asset files, sorted.
+        """
+        root = Path(root)
+        return [root / relpath for relpath, _ in self._iter_assets(root)]
+
+    def build_manifest(self, root, previous=None):
+        """Build a manifest of the asset files in a repository.
+
+        Parameters
+        ----------
+        root : `pathlib.Path` or `str`
+            Root directory of the report repository.
+        previous : sequence of `AssetEntry`, optional
+            An earlier manifest of the repository, for example from
+            `read_asset_manifest`. Files whose size and modification time
+            are unchanged since this manifest aren't hashed again.
+
+        Returns
+        -------
+        manifest : `list` of `AssetEntry`
+            Entries for the asset files, sorted by path.
+        """
+        root = Path(root)
+        previous_entries = {entry.path: entry for entry in previous or []}
+        manifest = []
+        hashed_count = 0
+        for relpath, file_stat in self._iter_assets(root):
+            entry = previous_entries.get(relpath)
+            if entry is None or entry.size != file_stat.st_size \
+                    or entry.mtime_ns != file_stat.st_mtime_ns:
+                entry = AssetEntry(relpath, file_stat.st_size,
+                                   file_stat.st_mtime_ns,
+                                   _hash_file(root / relpath))
+                hashed_count += 1
+            manifest.append(entry)
+        self._logger.debug('Hashed %d of %d asset files in %s',
+                           hashed_count, len(manifest), root)
+        return manifest
+
+    def _iter_assets(self, root):
+        """Yield the relative path and status of each asset file, sorted by
+        path.
+        """
+        assets = {}
+        for relpath, file_stat in self._walk(root):
+            if self.match(relpath):
+                assets[relpath] = file_stat
+
+        for pattern, pattern_re in zip(self._patterns, self._pattern_res):
+            if not any(pattern_re.match(relpath) for relpath in assets):
+                self._logger.warning(
+                    'Asset rule %r does not match any files', pattern)
+
+        for relpath in sorted(assets):
+            yield relpath, assets[relpath]
+
+    def _walk(self, root):
+        # Start walking from the literal directories that the rules are
+        # anchored to, skipping any that are inside another one
+        starts = []
+        for prefix in sorted(set(_get_static_prefix(p)
+                                 for p in self._patterns)):
+            if not any(_is_within(prefix, start) for start in starts):
+                starts.append(prefix)
+
+        visited = set()
+        for start in starts:
+            path = os.path.join(str(root), start) if start else str(root)
+            try:
+                start_stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.S_ISREG(start_stat.st_mode):
+                yield start, start_stat
+            elif stat.S_ISDIR(start_stat.st_mode):
+                yield from self._scan(path, start, start_stat, visited)
+
+    def _scan(self, path, relpath, dir_stat, visited):
+        stack = [(path, relpath, dir_stat)]
+        while stack:
+            path, relpath, dir_stat = stack.pop()
+            # Don't follow symlinks into a directory twice
+            dir_key = (dir_stat.st_dev, dir_stat.st_ino)
+            if dir_key in visited:
+                continue
+            visited.add(dir_key)
+            try:
+                entries = list(os.scandir(path))
+            except OSError as e:
+                self._logger.warning('Could not list %s: %s', path, e)
+                continue
+            for entry in entries:
+                entry_relpath = relpath + '/' + entry.name \
+                    if relpath else entry.name
+                try:
+                    if entry.is_dir():
+                        if entry.name != '.git':
+                            stack.append((entry.path, entry_relpath,
+                                          entry.stat()))
+                    elif entry.is_file():
+                        yield entry_relpath, entry.stat()
+                except OSError:
+                    # Removed while walking, or a broken symlink
+                    continue
+
+
+def read_asset_manifest(path):
+    """Read an asset manifest file.
+
+    Parameters
+    ----------
+    path : `pathlib.Path` or `str`
+        Path of the manifest file, written by `write_asset_manifest`.
+
+    Returns
+    -------
+    manifest : `list` of `AssetEntry`
+        Entries of the manifest. The list is empty if the file doesn't exist
+        or can't be read.
+    """
+    try:
+        with open(str(path)) as fp:
+            data = json.load(fp)
+        return [AssetEntry(**entry) for entry in data['assets']]
+    except (OSError, ValueError, KeyError, TypeError):
+        return []
+
+
+def write_asset_manifest(manifest, path):
+    """Write an asset manifest file.
+
+    Parameters
+    ----------
+    manifest : sequence of `AssetEntry`
+        Entries of the manifest.
+    path : `pathlib.Path` or `str`
+        Path of the manifest file. The file is written atomically.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {'assets': [entry._asdict() for entry in manifest]}
+    fd, temp_path = create_temp_file(path)
+    with os.fdopen(fd, 'w') as fp:
+        json.dump(data, fp, indent=1)
+    os.replace(temp_path, str(path))
+
+
+def normalize_pattern(pattern):
+    """Normalize an asset rule, or another path relative to the root of a
+    report repository.
+
+    Parameters
+    ----------
+    pattern : `str` or `pathlib.PurePath`
+        The rule, which may contain ``*`` wildcards.
+
+    Returns
+    -------
+    normalized : `str`
+        POSIX-style rule, without ``./`` prefixes or trailing slashes.
+
+    Raises
+    ------
+    ValueError
+        Raised if the rule is empty, absolute, or escapes the repository
+        with ``..``.
+    """
+    pattern = str(pattern).replace(os.sep, '/')
+    pure_path = PurePosixPath(pattern)
+    if pure_path.is_absolute() or '..' in pure_path.parts:
+        raise ValueError(
+            'Asset rule {0!r} is not a relative path inside the '
+            'repository.'.format(pattern))
+    # Removes "./" prefixes and trailing slashes
+    normalized = str(pure_path)
+    if normalized == '.':
+        raise ValueError('Asset rule {0!r} is empty.'.format(pattern))
+    return normalized
+
+
+def _is_glob(pattern):
+    return '*' in pattern
+
+
+def _get_static_prefix(pattern):
+    """Get the leading path segments of a rule that don't contain
+    wildcards.
+    """
+    if not _is_glob(pattern):
+        return pattern
+    segments = []
+    for segment in pattern.split('/'):
+        if any(char in segment for char in '*?['):
+            break
+        segments.append(segment)
+    return '/'.join(segments)
+
+
+def _is_within(path, directory):
+    return directory == '' or path == directory \
+        or path.startswith(directory + '/')
+
+
+def _translate_pattern(pattern):
+    """Translate a rule into a regular expression for relative paths.
+    """
+    if not _is_glob(pattern):
+        # A file, or a directory and its contents
+        return re.escape(pattern) + r'(?:/.*)?\Z'
+
+    segments = pattern.split('/')
+    regex = ''
+    for index, segment in enumerate(segments):
+        is_last = index == len(segments) - 1
+        if segment == '**':
+            regex += '.*' if is_last else '(?:[^/]+/)*'
+        else:
+            regex += _translate_segment(segment)
+            if not is_last:
+                regex += '/'
+    return regex + r'\Z'
+
+
+def _translate_segment(segment):
+    """Translate a glob pattern for a single path segment.
+    """
+    regex = ''
+    index = 0
+    while index < len(segment):
+        char = segment[index]
+        index += 1
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[':
+            end = segment.find(']', index + 1)
+            if end == -1:
+                regex += re.escape(char)
+                continue
+            chars = segment[index:end]
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+            regex += '[' + chars.replace('\\', '\\\\') + ']'
+            index = end + 1
+        else:
+            regex += re.escape(char)
+    return regex
+
+
+def _compile_patterns(patterns):
+    if not patterns:
+        return None
+    return re.compile('|'.join('(?:{0})'.format(_translate_pattern(p))
+                               for p in patterns), re.DOTALL)
+
+
+def _hash_file(path):
+    file_hash = hashlib.sha256()
+    with open(str(path), 'rb') as fp:
+        for chunk in iter(lambda: fp.read(2 ** 20), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
@@ -0,0 +1,253 @@
+"""A content-addressed store of asset files that report instances share
+through hard links.
+"""
+
+__all__ = ('BlobStore',)
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+import re
+import stat
+import tempfile
+import time
+
+from .userconfig import get_cache_dir
+
+_SHA256_RE = re.compile(r'[0-9a-f]{64}\Z')
+
+
+class BlobStore:
+    """Store of file contents, keyed by their SHA-256 hash.
+
+    Parameters
+    ----------
+    directory : `pathlib.Path` or `str`, optional
+        Directory of the store. Defaults to the ``blobs`` subdirectory of
+        `nbreport.userconfig.get_cache_dir`.
+
+    Notes
+    -----
+    Each blob is stored once, as a read-only file named by its hash (in a
+    subdirectory named by the hash's first two characters). Report
+    instances reference blobs through hard links, so every instance of
+    every report that has the same asset shares one copy of it on disk.
+
+    References are tracked by the filesystem: a blob's link count is the
+    number of instance files that reference it, plus one for the store.
+    `BlobStore.gc` removes blobs that are only linked from the store, which
+    happens once every instance that used them is deleted.
+
+    Since a blob shares its modification time with the instance files that
+    link it, reusing a blob records the time on an empty ``{hash}.used``
+    file next to it, rather than on the blob.
+
+    Blobs can only be linked into instances on the store's filesystem.
+    `nbreport.staging.AssetStager` copies assets into instances on other
+    filesystems instead.
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, directory=None):
+        super().__init__()
+        if directory is None:
+            directory = get_cache_dir() / 'blobs'
+        self._directory = Path(directory)
+
+    def __repr__(self):
+        return "{0}('{1!s}')".format(self.__class__.__name__,
+                                     self._directory)
+
+    @property
+    def directory(self):
+        """Directory of the store (`pathlib.Path`).
+        """
+        return self._directory
+
+    def blob_path(self, sha256):
+        """Get the path of a blob.
+
+        Parameters
+        ----------
+        sha256 : `str`
+            SHA-256 hash of the blob's content, as a hexadecimal string.
+
+        Returns
+        -------
+        path : `pathlib.Path`
+            Path of the blob (whether it exists, or not).
+        """
+        return self._directory / sha256[:2] / sha256
+
+    def add(self, source, sha256=None):
+        """Add a file's content to the store.
+
+        Parameters
+        ----------
+        source : `pathlib.Path` or `str`
+            Path of the file.
+        sha256 : `str`, optional
+            SHA-256 hash of the file's content, if it's already known (for
+            example, from `nbreport.repo.ReportRepo.asset_manifest`). If the
+            store has this blob, the file isn't read. Otherwise, the file is
+            hashed while it's copied into the store.
+
+        Returns
+        -------
+        sha256 : `str`
+            SHA-256 hash of the file's content. If the file was copied, this
+            is the hash of the copied content, even if it differs from
+            ``sha256`` (which is logged as a warning).
+        """
+        if sha256 is not None:
+            path = self.blob_path(sha256)
+            if self._touch(path):
+                return sha256
+
+        self._directory.mkdir(parents=True, exist_ok=True)
+        file_hash = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=str(self._directory),
+                                         suffix='.tmp')
+        try:
+            with open(str(source), 'rb') as source_fp, \
+                    os.fdopen(fd, 'wb') as temp_fp:
+                for chunk in iter(lambda: source_fp.read(2 ** 20), b''):
+                    file_hash.update(chunk)
+                    temp_fp.write(chunk)
+            os.chmod(temp_path, 0o444)
+            if sha256 is not None and sha256 != file_hash.hexdigest():
+                self._logger.warning(
+                    'The content of %s has changed since it was hashed '
+                    '(expected %s, got %s)', source, sha256,
+                    file_hash.hexdigest())
+            sha256 = file_hash.hexdigest()
+            path = self.blob_path(sha256)
+            if self._touch(path):
+                os.unlink(temp_path)
+            else:
+                path.parent.mkdir(exist_ok=True)
+                # Atomic, so concurrent writers of a blob don't conflict
+                os.replace(temp_path, str(path))
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return sha256
+
+    def link(self, sha256, dest):
+        """Link a blob into a report instance.
+
+        Parameters
+        ----------
+        sha256 : `str`
+            SHA-256 hash of the blob, from `BlobStore.add`.
+        dest : `pathlib.Path` or `str`
+            Path of the file in the instance. An existing file is replaced.
+            The parent directory must exist.
+
+        Raises
+        ------
+        OSError
+            Raised if the blob can't be hard linked to ``dest`` (for
+            example, if they're on different filesystems).
+        """
+        try:
+            os.unlink(str(dest))
+        except FileNotFoundError:
+            pass
+        os.link(str(self.blob_path(sha256)), str(dest))
+
+    def gc(self, min_age=3600., dry_run=False):
+        """Remove blobs that no report instance references.
+
+        Parameters
+        ----------
+        min_age : `float`, optional
+            Blobs that were added or reused more recently than this, in
+            seconds, aren't removed. This keeps blobs that are being linked
+            into a new instance by a concurrent process.
+        dry_run : `bool`, optional
+            If `True`, report the blobs that would be removed without
+            removing them.
+
+        Returns
+        -------
+        removed : `dict`
+            Statistics with ``count``, the number of removed blobs, ``size``,
+            the number of bytes reclaimed, and ``kept``, the number of
+            referenced blobs.
+        """
+        removed = {'count': 0, 'size': 0, 'kept': 0}
+        cutoff = time.time() - min_age
+        for path, file_stat in self._list_blobs():
+            use_path = _get_use_path(path)
+            try:
+                last_used = max(file_stat.st_mtime,
+                                os.stat(use_path).st_mtime)
+            except FileNotFoundError:
+                last_used = file_stat.st_mtime
+            if file_stat.st_nlink > 1 or last_used > cutoff:
+                removed['kept'] += 1
+                continue
+            if not dry_run:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                try:
+                    os.unlink(use_path)
+                except FileNotFoundError:
+                    pass
+            self._logger.debug('Removed unreferenced blob %s', path)
+            removed['count'] += 1
+            removed['size'] += file_stat.st_size
+        return removed
+
+    def _touch(self, path):
+        """Record the use of a blob, if it exists, so that `BlobStore.gc`
+        doesn't remove it while it's being linked.
+
+        The blob's own modification time isn't changed, since that would
+        change the modification time of every instance file that links it.
+        """
+        if not path.exists():
+            return False
+        use_path = _get_use_path(str(path))
+        try:
+            fd = os.open(use_path, os.O_WRONLY | os.O_CREAT, 0o666)
+        except PermissionError:
+            # Owned by another user
+            return True
+        try:
+            os.utime(fd)
+        except PermissionError:
+            pass
+        finally:
+            os.close(fd)
+        return True
+
+    def _list_blobs(self):
+        if not self._directory.is_dir():
+            return
+        for subdir in os.scandir(str(self._directory)):
+            if not subdir.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(subdir.path):
+                if _SHA256_RE.match(entry.name) is None:
+                    continue
+                try:
+                    file_stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                if stat.S_ISREG(file_stat.st_mode):
+                    yield entry.path, file_stat
+
+
+def _get_use_path(blob_path):
+    """Get the path of the file that records the last use of a blob.
+    """
+    return blob_path + '.used'
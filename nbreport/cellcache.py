@@ -0,0 +1,230 @@
+"""A content-addressed, on-disk cache of computed notebook cell outputs.
+"""
+
+__all__ = ('CellCache', 'compute_cell_keys')
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import tempfile
+
+import nbformat
+
+from .userconfig import get_cache_dir
+
+
+class CellCache:
+    """Cache of code cell outputs, keyed by the content of the cell and of
+    every code cell above it.
+
+    Parameters
+    ----------
+    directory : `pathlib.Path` or `str`, optional
+        Directory of the cache. Defaults to the ``cells`` subdirectory of
+        `nbreport.userconfig.get_cache_dir`.
+    max_size : int, optional
+        Maximum size of the cache, in bytes. When a new entry makes the cache
+        larger than this, the least-recently used entries are evicted.
+
+    Notes
+    -----
+    Keys for the cache are computed with `compute_cell_keys`. Entries are
+    stored as individual JSON files, so several processes can share a cache
+    directory.
+
+    The cache keeps a running total of its size, so that storing an entry
+    doesn't scan the cache directory. The directory is only scanned the first
+    time an entry is stored, and when the total exceeds ``max_size``.
+    Entries stored by other processes are counted at the next scan.
+
+    Keys don't cover the files or data that a notebook reads, such as the
+    report's assets, so cached outputs are replayed even if those change.
+    Only use the cache for notebooks whose outputs depend on their cells and
+    template context alone.
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, directory=None, max_size=2 ** 28):
+        super().__init__()
+        if directory is None:
+            directory = get_cache_dir() / 'cells'
+        self._directory = Path(directory)
+        self._max_size = max_size
+        # Running total of the size of the entries, or None until scanned
+        self._total_size = None
+
+    def __repr__(self):
+        return "{0}('{1!s}')".format(self.__class__.__name__,
+                                     self._directory)
+
+    @property
+    def directory(self):
+        """Directory of the cache (`pathlib.Path`).
+        """
+        return self._directory
+
+    def _entry_path(self, key):
+        return self._directory / key[:2] / '{0}.json'.format(key)
+
+    def get(self, key):
+        """Get the cached outputs of a cell.
+
+        Parameters
+        ----------
+        key : `str`
+            Cell key, from `compute_cell_keys`.
+
+        Returns
+        -------
+        entry : `dict` or `None`
+            A `dict` with ``outputs`` (a `list` of `nbformat.NotebookNode`)
+            and ``execution_count`` keys, or `None` if the cell isn't cached.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        # Refresh the entry's modification time to track its last use
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return {
+            'outputs': [nbformat.from_dict(output)
+                        for output in data['outputs']],
+            'execution_count': data['execution_count']
+        }
+
+    def put(self, key, cell):
+        """Cache the outputs of a computed code cell.
+
+        Parameters
+        ----------
+        key : `str`
+            Cell key, from `compute_cell_keys`.
+        cell : `nbformat.NotebookNode`
+            The computed code cell.
+        """
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if self._total_size is None:
+            self._total_size = sum(size for _, size, _ in self._list_entries())
+        try:
+            replaced_size = path.stat().st_size
+        except FileNotFoundError:
+            replaced_size = 0
+        data = {
+            'outputs': cell.get('outputs', []),
+            'execution_count': cell.get('execution_count')
+        }
+        # Write atomically so concurrent readers never see partial entries
+        fd, temp_path = tempfile.mkstemp(dir=str(path.parent),
+                                         suffix='.tmp')
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(data, fp)
+        size = os.stat(temp_path).st_size
+        os.replace(temp_path, str(path))
+        self._total_size += size - replaced_size
+        if self._total_size > self._max_size:
+            self._evict()
+
+    def clear(self):
+        """Remove all entries from the cache.
+        """
+        for path, _, _ in self._list_entries():
+            _unlink(path)
+        self._total_size = 0
+
+    def _list_entries(self):
+        entries = []
+        if not self._directory.is_dir():
+            return entries
+        for subdir in os.scandir(str(self._directory)):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        entries = self._list_entries()
+        total_size = sum(size for _, size, _ in entries)
+        self._total_size = total_size
+        if total_size <= self._max_size:
+            return
+        # Oldest (least-recently used) entries first
+        entries.sort(key=lambda entry: entry[2])
+        for path, size, _ in entries:
+            if total_size <= self._max_size:
+                break
+            _unlink(path)
+            total_size -= size
+            self._logger.debug('Evicted cell cache entry %s', path)
+        self._total_size = total_size
+
+
+def compute_cell_keys(notebook, kernel_name=''):
+    """Compute the cache keys of a notebook's code cells.
+
+    Parameters
+    ----------
+    notebook : `nbformat.NotebookNode`
+        The notebook.
+    kernel_name : `str`, optional
+        Name of the Jupyter kernel that computes the notebook. If empty, the
+        kernel named in the notebook's metadata is used.
+
+    Returns
+    -------
+    keys : `list`
+        For each cell in the notebook, either the cell's key (`str`), or
+        `None` if the cell isn't a code cell.
+
+    Notes
+    -----
+    A code cell's key is a SHA-256 hash of the cell's source, the key of the
+    code cell above it, the notebook's template context (the
+    ``nbreport.cookiecutter`` notebook metadata) and the kernel name. Since
+    keys are chained, changing a code cell changes the keys of every code
+    cell below it. Markdown and raw cells don't contribute to keys.
+    """
+    if not kernel_name:
+        kernel_name = notebook.metadata.get('kernelspec', {}).get('name', '')
+    context = notebook.metadata.get('nbreport', {}).get('cookiecutter', {})
+    context_hash = hashlib.sha256(
+        json.dumps(context, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+
+    keys = []
+    parent_key = ''
+    for cell in notebook.cells:
+        if cell.cell_type != 'code':
+            keys.append(None)
+            continue
+        data = json.dumps({
+            'source': cell.source,
+            'parent': parent_key,
+            'context': context_hash,
+            'kernel': kernel_name
+        }, sort_keys=True)
+        parent_key = hashlib.sha256(data.encode('utf-8')).hexdigest()
+        keys.append(parent_key)
+    return keys
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -5,15 +5,27 @@ __all__ = ('compute',)
 
 import click
 
-from ..compute import compute_notebook_file
+from ..cellcache import CellCache
+from ..compute import get_slowest_cells
 from ..instance import ReportInstance
+from .utils import compute_instances, echo_results, raise_for_failures
 
 
 @click.command()
 @click.argument(
-    'instance_path', default=None, required=True, nargs=1,
+    'instance_paths', metavar='INSTANCE_PATH...', required=False, nargs=-1,
     type=click.Path(exists=True, file_okay=False, dir_okay=True)
 )
+@click.option(
+    '--manifest', type=click.File('r'), default=None,
+    help='File listing the paths of report instances to compute, one per '
+         'line. These instances are computed in addition to any '
+         'INSTANCE_PATH arguments.'
+)
+@click.option(
+    '-j', '--jobs', type=click.IntRange(min=1), default=1,
+    help='Number of instances to compute concurrently. Default is 1.'
+)
 @click.option(
     '--timeout', type=int, default=None,
     help='Timeout for computing individual notebook cells. Default is no '
@@ -24,17 +36,161 @@ from ..instance import ReportInstance
     help='Name of the Jupyter kernel to use for computing the notebook. '
          'The default Python kernel is used if this option is not set.'
 )
+@click.option(
+    '--kernel-pool-size', type=int, default=0,
+    help='Number of warm kernels to pre-start for computing notebooks. '
+         'The default, 0, starts a new kernel for each notebook. '
+         'Only used when a process computes several notebooks.'
+)
+@click.option(
+    '--kernel-max-uses', type=int, default=1,
+    help='Number of notebooks a pooled kernel computes before it is '
+         'replaced by a fresh kernel. Between uses, the kernel\'s namespace '
+         'is reset. Default is 1. Only used with --kernel-pool-size.'
+)
+@click.option(
+    '--fork-server', 'use_fork_server', is_flag=True, default=False,
+    help='Start kernels by forking a template process that has already '
+         'imported ipykernel and the modules listed in the "preload" field '
+         'of nbreport.yaml. Forked kernels start much faster than new '
+         'kernel processes. Only available on Linux and macOS.'
+)
+@click.option(
+    '--cache/--no-cache', 'use_cache', default=False,
+    help='Whether or not to replay unchanged cells from the cell output '
+         'cache (in ~/.cache/nbreport/cells) instead of executing them. '
+         'Cells are cached by their source, the cells above them, the '
+         'template context, and the kernel, but not by the report\'s '
+         'assets or other data the notebook reads, so only use --cache for '
+         'notebooks whose outputs don\'t depend on changing data. The cache '
+         'is disabled by default.'
+)
+@click.option(
+    '--checkpoint-cells', type=click.IntRange(min=1), default=10,
+    help='Save a checkpoint of the partially-computed notebook after this '
+         'many cells are computed. Default is 10.'
+)
+@click.option(
+    '--checkpoint-interval', type=float, default=300.,
+    help='Save a checkpoint of the partially-computed notebook after this '
+         'many seconds. Default is 300.'
+)
+@click.option(
+    '--resume', is_flag=True, default=False,
+    help='Resume computing from the checkpoint saved by a previous, failed, '
+         'computation. Cells tagged "state-setup" are re-executed to '
+         'rebuild the kernel\'s state; other computed cells are skipped.'
+)
+@click.option(
+    '--slowest', 'slowest_cell_count', type=click.IntRange(min=0), default=5,
+    help='Number of the slowest cells to list after computing each '
+         'instance. Set to 0 to not list cells. Default is 5.'
+)
+@click.option(
+    '--memory-interval', type=float, default=None,
+    help='Sample the kernel\'s memory usage at this interval, in seconds, '
+         'and record the peak and change in memory of each cell in the '
+         'notebook. Requires psutil (pip install nbreport[memory]).'
+)
+@click.option(
+    '--memory-limit', type=click.IntRange(min=1), default=None,
+    help='Memory ceiling for the kernel, in MiB. A cell that exceeds the '
+         'ceiling is interrupted and marked in the notebook. '
+         'Requires psutil (pip install nbreport[memory]).'
+)
+@click.option(
+    '--profile-cells', type=str, default=None,
+    help='Cells to run under a sampling profiler: "all", or a '
+         'comma-separated list of cell indices (starting from 0). Cells '
+         'tagged "nbreport-profile" are always profiled. Profiles are saved '
+         'next to the instance\'s notebook.'
+)
+@click.option(
+    '--profile-format', type=click.Choice(['collapsed', 'speedscope']),
+    default='collapsed',
+    help='Format of cell profiles: collapsed stacks (for flame graph '
+         'tools) or speedscope JSON. Default is collapsed.'
+)
 @click.pass_context
-def compute(ctx, instance_path, timeout, kernel):
-    """Compute the notebook in a report instance.
+def compute(ctx, instance_paths, manifest, jobs, timeout, kernel,
+            kernel_pool_size, kernel_max_uses, use_fork_server, use_cache,
+            checkpoint_cells,
+            checkpoint_interval, resume, slowest_cell_count, memory_interval,
+            memory_limit, profile_cells, profile_format):
+    """Compute the notebooks in one or more report instances.
 
     **Required arguments**
 
-    ``INSTANCE_PATH``
-        The path to the report repository directory. You can create an
-        instance with the ``nbreport init`` command.
+    ``INSTANCE_PATH...``
+        The paths to report instance directories. You can create an
+        instance with the ``nbreport init`` command. Alternatively, list the
+        instance paths in a file given by the ``--manifest`` option.
+
+    **Batches**
+
+    When several instances are given, each is computed independently and
+    a summary table is printed at the end. Use ``--jobs`` to compute
+    several instances at once. The command fails if any instance fails to
+    compute.
     """
-    instance = ReportInstance(instance_path)
-    compute_notebook_file(instance.ipynb_path, timeout=timeout,
-                          kernel_name=kernel)
+    instance_paths = list(instance_paths)
+    if manifest is not None:
+        instance_paths.extend(line.strip() for line in manifest
+                              if line.strip() and not line.startswith('#'))
+    if len(instance_paths) == 0:
+        raise click.UsageError('Provide at least one INSTANCE_PATH.')
+
+    if profile_cells is not None and profile_cells != 'all':
+        try:
+            profile_cells = [int(index) for index in profile_cells.split(',')]
+        except ValueError:
+            raise click.BadParameter(
+                'Use "all" or a comma-separated list of cell indices.',
+                param_hint='--profile-cells')
+
+    instances = [ReportInstance(path) for path in instance_paths]
+
+    results = compute_instances(
+        instances,
+        jobs=jobs,
+        kernel_pool_size=kernel_pool_size,
+        kernel_max_uses=kernel_max_uses,
+        fork_server=use_fork_server,
+        timeout=timeout,
+        kernel_name=kernel,
+        cell_cache=CellCache() if use_cache else None,
+        checkpoint=True,
+        checkpoint_cells=checkpoint_cells,
+        checkpoint_interval=checkpoint_interval,
+        resume=resume,
+        slowest_cell_count=slowest_cell_count,
+        memory_interval=memory_interval,
+        memory_limit=memory_limit * 2 ** 20 if memory_limit else None,
+        profile_cells=profile_cells,
+        profile_format=profile_format)
+
+    for instance, result in zip(instances, results):
+        if result.success and slowest_cell_count > 0:
+            _echo_slowest_cells(instance)
+
+    if len(results) > 1:
+        echo_results(instances, results)
+    raise_for_failures(results)
     click.echo('Complete.')
+
+
+def _echo_slowest_cells(instance):
+    """Print a table of the slowest cells in an instance's notebook.
+    """
+    slowest_cells = get_slowest_cells(instance.open_notebook())
+    if not slowest_cells:
+        return
+    click.echo('Slowest cells in {0!s}:'.format(instance.ipynb_path))
+    click.echo('  {0:>5} {1:>10}  {2}'.format('Cell', 'Time', 'Source'))
+    for index, wall_time, cell in slowest_cells:
+        lines = cell.source.strip().splitlines()
+        first_line = lines[0] if lines else ''
+        if len(first_line) > 50:
+            first_line = first_line[:47] + '...'
+        click.echo('  {0:>5d} {1:>8.2f} s  {2}'.format(
+            index, wall_time, first_line))
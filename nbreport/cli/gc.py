@@ -0,0 +1,41 @@
+"""Implementation for the ``nbreport gc`` command, which removes asset blobs
+that no report instance references.
+"""
+
+__all__ = ('gc',)
+
+import click
+
+from ..blobstore import BlobStore
+
+
+@click.command()
+@click.option(
+    '--min-age', 'min_age', type=float, default=3600., show_default=True,
+    help='Only remove blobs that haven\'t been used for this many seconds, '
+         'so that instances being created concurrently keep their assets.'
+)
+@click.option(
+    '--dry-run', 'dry_run', is_flag=True,
+    help='Report the blobs that would be removed without removing them.'
+)
+@click.pass_context
+def gc(ctx, min_age, dry_run):
+    """Reclaim disk space from the shared asset store.
+
+    Report instances created with the ``blob`` asset staging strategy share
+    their asset files through a content-addressed store in
+    ``~/.cache/nbreport/blobs``. This command removes the stored files that
+    are no longer part of any instance, for example after instance
+    directories are deleted.
+    """
+    blob_store = BlobStore()
+    removed = blob_store.gc(min_age=min_age, dry_run=dry_run)
+    click.echo(
+        '{verb} {count:d} unreferenced blobs ({size:.1f} MB) from {path!s}; '
+        'kept {kept:d}.'.format(
+            verb='Would remove' if dry_run else 'Removed',
+            count=removed['count'],
+            size=removed['size'] / 1e6,
+            path=blob_store.directory,
+            kept=removed['kept']))
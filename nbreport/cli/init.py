@@ -4,12 +4,13 @@ report instance.
 
 __all__ = ('init',)
 
-from tempfile import TemporaryDirectory
-
 import click
 
+from ..clone import CLONE_STRATEGIES
 from ..repo import ReportRepo
 from ..processing import is_url, create_instance
+from ..staging import STAGING_STRATEGIES
+from .utils import open_git_repo
 
 
 @click.command()
@@ -40,7 +41,32 @@ from ..processing import is_url, create_instance
 @click.option(
     '--git-ref', 'git_repo_ref', type=str, default='master',
     help='If cloning from a Git repository, check out a specific Git ref '
-         '(branch or tag name).'
+         '(branch or tag name, or commit SHA).'
+)
+@click.option(
+    '--git-clone', 'git_clone_strategy', type=click.Choice(CLONE_STRATEGIES),
+    default='full',
+    help='How to clone a Git repository: the whole history (full), only the '
+         'checked-out commit (shallow), the history without file contents '
+         'other than the checked-out commit\'s (blobless), or only the '
+         'report\'s files and assets in the checked-out commit (sparse). '
+         'Default: full.'
+)
+@click.option(
+    '--git-cache/--no-git-cache', 'use_git_cache', default=False,
+    help='Keep a mirror of the Git repository in ~/.cache/nbreport/repos, '
+         'and only fetch new commits when the repository is used again, '
+         'instead of cloning it into a temporary directory. Concurrent '
+         'nbreport commands share the mirror. --git-clone is ignored with '
+         'the cache. Disabled by default.'
+)
+@click.option(
+    '--git-snapshot/--no-git-snapshot', 'use_git_snapshot', default=False,
+    help='Resolve --git-ref to a commit, and create the instance from a '
+         'read-only snapshot of the report at that commit in '
+         '~/.cache/nbreport/snapshots, without cloning or fetching the '
+         'repository if the snapshot exists. The snapshot is created from a '
+         'clone otherwise. Disabled by default.'
 )
 @click.option(
     '--overwrite/--no-overwrite', default=False,
@@ -48,9 +74,21 @@ from ..processing import is_url, create_instance
          'is disable by default. If --dir is not set, overwriting should '
          'not be necessary.'
 )
+@click.option(
+    '--asset-staging', type=click.Choice(STAGING_STRATEGIES), default=None,
+    help='How to stage asset files into the instance: copy them, or share '
+         'them with the repository through hard links, copy-on-write '
+         'reflinks, or symbolic links, or through hard links to the shared '
+         'asset store in ~/.cache/nbreport/blobs (blob). Files are copied if '
+         'the filesystem doesn\'t support the strategy. Defaults to the '
+         '"asset_staging" field of nbreport.yaml, or copy. Symbolic links '
+         'can\'t be used with a Git URL, since the cloned repository is '
+         'deleted.'
+)
 @click.pass_context
 def init(ctx, repo_path_or_url, template_variables, instance_path,
-         git_repo_subdir, git_repo_ref, overwrite):
+         git_repo_subdir, git_repo_ref, git_clone_strategy, use_git_cache,
+         use_git_snapshot, overwrite, asset_staging):
     """Initialize a new report instance.
 
     This command creates a report **instance** from a report **repository**.
@@ -83,17 +121,22 @@ def init(ctx, repo_path_or_url, template_variables, instance_path,
         'github_token': ctx.obj['config']['github']['token'],
         'server': ctx.obj['server'],
         'overwrite': overwrite,
+        'asset_staging': asset_staging,
+        'session': ctx.obj['session'],
     }
 
+    if asset_staging == 'symlink' and is_url(repo_path_or_url):
+        raise click.UsageError(
+            '--asset-staging symlink can\'t be used with a Git URL.')
+
     if is_url(repo_path_or_url):
-        with TemporaryDirectory() as tempdir:
-            report_repo = ReportRepo.git_clone(
-                repo_path_or_url,
-                clone_base_dir=tempdir,
-                subdir=git_repo_subdir,
-                checkout=git_repo_ref
-            )
-        instance = create_instance(report_repo, **create_instance_args)
+        with open_git_repo(repo_path_or_url,
+                           checkout=git_repo_ref,
+                           subdir=git_repo_subdir,
+                           strategy=git_clone_strategy,
+                           use_git_cache=use_git_cache,
+                           use_git_snapshot=use_git_snapshot) as report_repo:
+            instance = create_instance(report_repo, **create_instance_args)
     else:
         report_repo = ReportRepo(repo_path_or_url)
         instance = create_instance(report_repo, **create_instance_args)
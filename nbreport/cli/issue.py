@@ -3,13 +3,19 @@
 
 __all__ = ('issue',)
 
-from tempfile import TemporaryDirectory
+import logging
 
 import click
 
-from nbreport.compute import compute_notebook_file
-from nbreport.processing import create_instance, is_url
+from nbreport.cli.utils import (compute_instances, echo_results,
+                                open_git_repo, raise_for_failures)
+from nbreport.clone import CLONE_STRATEGIES
+from nbreport.encoding import CONTENT_ENCODINGS
+from nbreport.processing import (create_instance, create_instances, is_url,
+                                 read_parameter_matrix)
 from nbreport.repo import ReportRepo
+from nbreport.staging import STAGING_STRATEGIES
+from nbreport.templating import TemplateCache
 
 
 @click.command()
@@ -28,6 +34,18 @@ from nbreport.repo import ReportRepo
          'is created in the current working directory and is named '
          '{{handle}}-{{id}}.'
 )
+@click.option(
+    '--matrix', type=click.Path(exists=True, dir_okay=False), default=None,
+    help='Parameter matrix file for a sweep: a CSV file whose header names '
+         'template variables, or a YAML file with a list of mappings. One '
+         'instance is created and computed for each row, with the row\'s '
+         'values overriding -c/--config values.'
+)
+@click.option(
+    '-j', '--jobs', type=click.IntRange(min=1), default=1,
+    help='Number of --matrix instances to compute concurrently. '
+         'Default is 1.'
+)
 @click.option(
     '--timeout', type=int, default=None,
     help='Timeout for computing individual notebook cells. Default is no '
@@ -38,6 +56,27 @@ from nbreport.repo import ReportRepo
     help='Name of the Jupyter kernel to use for computing the notebook. '
          'The default Python kernel is used if this option is not set.'
 )
+@click.option(
+    '--kernel-pool-size', type=int, default=0,
+    help='Number of warm kernels to pre-start for computing notebooks. '
+         'The default, 0, starts a new kernel for each notebook. '
+         'Only used with --matrix, when a process computes several notebooks.'
+)
+@click.option(
+    '--kernel-max-uses', type=int, default=1,
+    help='Number of notebooks a pooled kernel computes before it is '
+         'replaced by a fresh kernel. Between uses, the kernel\'s namespace '
+         'is reset. Default is 1. Only used with --kernel-pool-size.'
+)
+@click.option(
+    '--fork-server', 'use_fork_server', is_flag=True, default=False,
+    help='Start kernels by forking a template process that has already '
+         'imported ipykernel and the modules listed in the "preload" field '
+         'of nbreport.yaml. Forked kernels start much faster than new '
+         'kernel processes. With --matrix, the cells up to a cell tagged '
+         '"fork-point" are executed once, in the template process, and '
+         'shared by every instance. Only available on Linux and macOS.'
+)
 @click.option(
     '--git-subdir', 'git_repo_subdir', type=str, default=None,
     help='If cloning from a Git repository and the report is not at the root '
@@ -47,11 +86,56 @@ from nbreport.repo import ReportRepo
 @click.option(
     '--git-ref', 'git_repo_ref', type=str, default='master',
     help='If cloning from a Git repository, check out a specific Git ref '
-         '(branch or tag name).'
+         '(branch or tag name, or commit SHA).'
+)
+@click.option(
+    '--git-clone', 'git_clone_strategy', type=click.Choice(CLONE_STRATEGIES),
+    default='full',
+    help='How to clone a Git repository: the whole history (full), only the '
+         'checked-out commit (shallow), the history without file contents '
+         'other than the checked-out commit\'s (blobless), or only the '
+         'report\'s files and assets in the checked-out commit (sparse). '
+         'Default: full.'
+)
+@click.option(
+    '--git-cache/--no-git-cache', 'use_git_cache', default=False,
+    help='Keep a mirror of the Git repository in ~/.cache/nbreport/repos, '
+         'and only fetch new commits when the repository is used again, '
+         'instead of cloning it into a temporary directory. Concurrent '
+         'nbreport commands share the mirror. --git-clone is ignored with '
+         'the cache. Disabled by default.'
+)
+@click.option(
+    '--git-snapshot/--no-git-snapshot', 'use_git_snapshot', default=False,
+    help='Resolve --git-ref to a commit, and create the instance from a '
+         'read-only snapshot of the report at that commit in '
+         '~/.cache/nbreport/snapshots, without cloning or fetching the '
+         'repository if the snapshot exists. The snapshot is created from a '
+         'clone otherwise. Disabled by default.'
+)
+@click.option(
+    '--asset-staging', type=click.Choice(STAGING_STRATEGIES), default=None,
+    help='How to stage asset files into the instance: copy them, or share '
+         'them with the repository through hard links, copy-on-write '
+         'reflinks, or symbolic links, or through hard links to the shared '
+         'asset store in ~/.cache/nbreport/blobs (blob). Files are copied if '
+         'the filesystem doesn\'t support the strategy. Defaults to the '
+         '"asset_staging" field of nbreport.yaml, or copy. Symbolic links '
+         'can\'t be used with a Git URL, since the cloned repository is '
+         'deleted.'
+)
+@click.option(
+    '--content-encoding', type=click.Choice(CONTENT_ENCODINGS),
+    default='identity',
+    help='Compress the notebook while uploading it, with gzip or zstd '
+         '(which requires the zstandard package). The API server must '
+         'accept the encoding. Default: identity (no compression).'
 )
 @click.pass_context
-def issue(ctx, repo_path_or_url, template_variables, instance_path, timeout,
-          kernel, git_repo_subdir, git_repo_ref):
+def issue(ctx, repo_path_or_url, template_variables, instance_path, matrix,
+          jobs, timeout, kernel, kernel_pool_size, kernel_max_uses,
+          use_fork_server, git_repo_subdir, git_repo_ref, git_clone_strategy,
+          use_git_cache, use_git_snapshot, asset_staging, content_encoding):
     """Create, compute, and upload a report instance, all-in-one.
 
     **Required arguments**
@@ -59,41 +143,111 @@ def issue(ctx, repo_path_or_url, template_variables, instance_path, timeout,
     ``REPO_PATH_OR_URL``
         The path to the report repository directory on the file system **or**
         the URL of a remote Git repository.
+
+    **Parameter sweeps**
+
+    With a ``--matrix`` file, the repository is cloned once and an instance
+    is issued for each row of the matrix. The instances are computed
+    concurrently (see ``--jobs``), those that compute successfully are
+    uploaded, and a status table is printed at the end.
     """
     template_variables = dict(template_variables)
 
+    matrix_rows = None
+    if matrix is not None:
+        if instance_path is not None:
+            raise click.UsageError('-d/--dir can\'t be used with --matrix.')
+        try:
+            matrix_rows = read_parameter_matrix(matrix)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--matrix')
+
     create_instance_args = {
         'template_variables': template_variables,
-        'instance_path': instance_path,
         'github_username': ctx.obj['config']['github']['username'],
         'github_token': ctx.obj['config']['github']['token'],
         'server': ctx.obj['server'],
         'overwrite': False,
+        'asset_staging': asset_staging,
+        'session': ctx.obj['session'],
     }
 
+    if asset_staging == 'symlink' and is_url(repo_path_or_url):
+        raise click.UsageError(
+            '--asset-staging symlink can\'t be used with a Git URL.')
+
     if is_url(repo_path_or_url):
-        with TemporaryDirectory() as tempdir:
-            report_repo = ReportRepo.git_clone(
-                repo_path_or_url,
-                clone_base_dir=tempdir,
-                subdir=git_repo_subdir,
-                checkout=git_repo_ref
-            )
-            instance = create_instance(report_repo, **create_instance_args)
+        with open_git_repo(repo_path_or_url,
+                           checkout=git_repo_ref,
+                           subdir=git_repo_subdir,
+                           strategy=git_clone_strategy,
+                           use_git_cache=use_git_cache,
+                           use_git_snapshot=use_git_snapshot) as report_repo:
+            if matrix_rows is None:
+                instance = create_instance(report_repo,
+                                           instance_path=instance_path,
+                                           **create_instance_args)
+            else:
+                instances = create_instances(report_repo, matrix_rows,
+                                             **create_instance_args)
     else:
         report_repo = ReportRepo(repo_path_or_url)
-        instance = create_instance(report_repo, **create_instance_args)
+        # Keep compiled templates between runs on a local repository
+        create_instance_args['template_cache'] = TemplateCache(
+            directory=report_repo.template_cache_dir)
+        if matrix_rows is None:
+            instance = create_instance(report_repo,
+                                       instance_path=instance_path,
+                                       **create_instance_args)
+        else:
+            instances = create_instances(report_repo, matrix_rows,
+                                         **create_instance_args)
+
+    compute_args = {
+        'jobs': jobs,
+        'kernel_pool_size': kernel_pool_size,
+        'kernel_max_uses': kernel_max_uses,
+        'fork_server': use_fork_server,
+        'timeout': timeout,
+        'kernel_name': kernel,
+        'checkpoint': True
+    }
+    if matrix_rows is None:
+        results = compute_instances([instance], **compute_args)
+        raise_for_failures(results)
+        queue_url = _upload(ctx, instance, content_encoding)
+
+        click.echo('Issued report instance {}.'.format(
+            instance.config['instance_handle']))
+        click.echo('Processing status:\n  {}'.format(queue_url))
+        click.echo('Publication URL:\n  {}'.format(
+            instance.config['published_instance_url']))
+        return
 
-    compute_notebook_file(instance.ipynb_path, timeout=timeout,
-                          kernel_name=kernel)
+    results = compute_instances(instances, sweep=True, **compute_args)
+    for index, (instance, result) in enumerate(zip(instances, results)):
+        if not result.success:
+            continue
+        try:
+            _upload(ctx, instance, content_encoding)
+        except Exception as e:
+            # Reported in the status table, without stopping other uploads
+            logging.getLogger(__name__).error(
+                'Failed to upload %s: %s', instance.dirname, e)
+            results[index] = result._replace(
+                success=False,
+                error='Upload failed: {0}: {1}'.format(type(e).__name__, e))
+    echo_results(instances, results, matrix_rows=matrix_rows,
+                 success_status='issued')
+    raise_for_failures(results, action='issue')
 
-    queue_url = instance.upload(
+
+def _upload(ctx, instance, content_encoding):
+    """Upload an instance's computed notebook, returning the queue URL.
+    """
+    return instance.upload(
         github_username=ctx.obj['config']['github']['username'],
         github_token=ctx.obj['config']['github']['token'],
-        server=ctx.obj['server'])
-
-    click.echo('Issued report instance {}.'.format(
-        instance.config['instance_handle']))
-    click.echo('Processing status:\n  {}'.format(queue_url))
-    click.echo('Publication URL:\n  {}'.format(
-        instance.config['published_instance_url']))
+        server=ctx.obj['server'],
+        session=ctx.obj['session'],
+        content_encoding=content_encoding)
@@ -9,8 +9,8 @@ from getpass import getuser
 from socket import gethostname
 
 import click
-import requests
 
+from ..session import get_session
 from ..userconfig import insert_github_config, write_config
 
 
@@ -39,11 +39,13 @@ def login(ctx):
 
     try:
         token_data = request_github_token(
-            github_username, github_password, twofactor=None)
+            github_username, github_password, twofactor=None,
+            session=ctx.obj['session'])
     except GitHubTwoFactorRequired:
         twofactor = click.prompt('Your GitHub two-factor auth code', type=str)
         token_data = request_github_token(
-            github_username, github_password, twofactor=twofactor)
+            github_username, github_password, twofactor=twofactor,
+            session=ctx.obj['session'])
 
     config = insert_github_config(
         ctx.obj['config'],
@@ -58,7 +60,8 @@ def login(ctx):
     )
 
 
-def request_github_token(github_username, github_password, twofactor=None):
+def request_github_token(github_username, github_password, twofactor=None,
+                         session=None):
     """Request a new GitHub personal access token on behalf of a user.
 
     Parameters
@@ -69,6 +72,8 @@ def request_github_token(github_username, github_password, twofactor=None):
         User's GitHub password.
     twofactor : `str`, optional
         The current two-factor code.
+    session : `requests.Session`, optional
+        HTTP session. Defaults to `nbreport.session.get_session`.
 
     Returns
     -------
@@ -107,7 +112,9 @@ def request_github_token(github_username, github_password, twofactor=None):
     }
     if twofactor is not None:
         headers['X-GitHub-OTP'] = str(twofactor)
-    response = requests.post(
+    if session is None:
+        session = get_session()
+    response = session.post(
         'https://api.github.com/authorizations',
         auth=(github_username, github_password),
         headers=headers,
@@ -8,8 +8,10 @@ from pathlib import Path
 
 import click
 
+from ..session import DEFAULT_TIMEOUT, create_session
 from ..userconfig import read_config, get_config_path, create_empty_config
 from .compute import compute
+from .gc import gc
 from .login import login
 from .register import register
 from .init import init
@@ -41,9 +43,29 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
     '--server', default='https://api.lsst.codes',
     help='URL of the API host server. Default: ``https://api.lsst.codes``.'
 )
+@click.option(
+    '--http-pool-size', 'http_pool_size', type=click.IntRange(min=1),
+    default=10, show_default=True,
+    help='Maximum number of HTTP connections kept alive for reuse by each '
+         'server.'
+)
+@click.option(
+    '--http-timeout', 'http_timeout', type=float, default=DEFAULT_TIMEOUT[1],
+    show_default=True,
+    help='Timeout, in seconds, for reading each HTTP response.'
+)
+@click.option(
+    '--http-retries', 'http_retries', type=click.IntRange(min=0), default=3,
+    show_default=True,
+    help='Number of times an HTTP request is retried after a connection '
+         'error, or, if it\'s idempotent, an error response from an '
+         'overloaded server. POST requests aren\'t retried once they\'re '
+         'sent.'
+)
 @click.version_option(message='%(version)s')
 @click.pass_context
-def main(ctx, log_level, config_path, server):
+def main(ctx, log_level, config_path, server, http_pool_size, http_timeout,
+         http_retries):
     """nbreport is a command-line client for LSST's notebook-based report
     system. Use nbreport to initialize, compute, and upload report instances.
     """
@@ -72,8 +94,14 @@ def main(ctx, log_level, config_path, server):
     ctx.obj = {
         'config_path': config_path,
         'config': config,
-        'server': server
+        'server': server,
+        # Shared by the subcommands' HTTP requests to reuse connections
+        'session': create_session(
+            pool_size=http_pool_size,
+            timeout=(DEFAULT_TIMEOUT[0], http_timeout),
+            retries=http_retries)
     }
+    ctx.call_on_close(ctx.obj['session'].close)
 
 
 @main.command()
@@ -99,3 +127,4 @@ main.add_command(compute)
 main.add_command(upload)
 main.add_command(issue)
 main.add_command(test)
+main.add_command(gc)
@@ -7,7 +7,6 @@ __all__ = ('register',)
 from urllib.parse import urljoin
 
 import click
-import requests
 
 from ..repo import ReportRepo
 
@@ -54,7 +53,7 @@ def register(ctx, repo_path):
     click.echo('  Git repository: {}'.format(git_repo))
     click.confirm('Register this report?', abort=True)
 
-    response = requests.post(
+    response = ctx.obj['session'].post(
         urljoin(ctx.obj['server'], '/nbreport/reports/'),
         auth=(github_username, github_token),
         json={
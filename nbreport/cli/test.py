@@ -4,13 +4,18 @@
 __all__ = ('test',)
 
 import logging
-from tempfile import TemporaryDirectory
 
 import click
 
-from ..compute import compute_notebook_file
+from ..cellcache import CellCache
+from ..clone import CLONE_STRATEGIES
 from ..repo import ReportRepo
-from ..processing import is_url, create_instance
+from ..processing import (is_url, create_instance, create_instances,
+                          read_parameter_matrix)
+from ..staging import STAGING_STRATEGIES
+from ..templating import TemplateCache
+from .utils import (compute_instances, echo_results, open_git_repo,
+                    raise_for_failures)
 
 
 @click.command()
@@ -38,6 +43,27 @@ from ..processing import is_url, create_instance
     help='Whether or not to overwrite an existing test instance. Overwriting '
          'is enabled by default.'
 )
+@click.option(
+    '--sync/--no-sync', default=True,
+    help='When overwriting, update an existing test instance in place: only '
+         'changed assets are staged again, removed assets are deleted, and '
+         'the computed notebook is kept unless the notebook, its template '
+         'context, or the configuration changed. With --no-sync, the '
+         'instance directory is deleted and created again. Syncing is '
+         'enabled by default.'
+)
+@click.option(
+    '--matrix', type=click.Path(exists=True, dir_okay=False), default=None,
+    help='Parameter matrix file for a sweep: a CSV file whose header names '
+         'template variables, or a YAML file with a list of mappings. One '
+         'instance is created and computed for each row, with the row\'s '
+         'values overriding -c/--config values.'
+)
+@click.option(
+    '-j', '--jobs', type=click.IntRange(min=1), default=1,
+    help='Number of --matrix instances to compute concurrently. '
+         'Default is 1.'
+)
 @click.option(
     '--timeout', type=int, default=None,
     help='Timeout for computing individual notebook cells. Default is no '
@@ -48,6 +74,37 @@ from ..processing import is_url, create_instance
     help='Name of the Jupyter kernel to use for computing the notebook. '
          'The default Python kernel is used if this option is not set.'
 )
+@click.option(
+    '--kernel-pool-size', type=int, default=0,
+    help='Number of warm kernels to pre-start for computing notebooks. '
+         'The default, 0, starts a new kernel for each notebook. '
+         'Only used with --matrix, when a process computes several notebooks.'
+)
+@click.option(
+    '--kernel-max-uses', type=int, default=1,
+    help='Number of notebooks a pooled kernel computes before it is '
+         'replaced by a fresh kernel. Between uses, the kernel\'s namespace '
+         'is reset. Default is 1. Only used with --kernel-pool-size.'
+)
+@click.option(
+    '--fork-server', 'use_fork_server', is_flag=True, default=False,
+    help='Start kernels by forking a template process that has already '
+         'imported ipykernel and the modules listed in the "preload" field '
+         'of nbreport.yaml. Forked kernels start much faster than new '
+         'kernel processes. With --matrix, the cells up to a cell tagged '
+         '"fork-point" are executed once, in the template process, and '
+         'shared by every instance. Only available on Linux and macOS.'
+)
+@click.option(
+    '--cache/--no-cache', 'use_cache', default=False,
+    help='Whether or not to replay unchanged cells from the cell output '
+         'cache (in ~/.cache/nbreport/cells) instead of executing them. '
+         'Cells are cached by their source, the cells above them, the '
+         'template context, and the kernel, but not by the report\'s '
+         'assets or other data the notebook reads, so only use --cache for '
+         'notebooks whose outputs don\'t depend on changing data. The cache '
+         'is disabled by default.'
+)
 @click.option(
     '--git-subdir', 'git_repo_subdir', type=str, default=None,
     help='If cloning from a Git repository and the report is not at the root '
@@ -57,11 +114,50 @@ from ..processing import is_url, create_instance
 @click.option(
     '--git-ref', 'git_repo_ref', type=str, default='master',
     help='If cloning from a Git repository, check out a specific Git ref '
-         '(branch or tag name).'
+         '(branch or tag name, or commit SHA).'
+)
+@click.option(
+    '--git-clone', 'git_clone_strategy', type=click.Choice(CLONE_STRATEGIES),
+    default='full',
+    help='How to clone a Git repository: the whole history (full), only the '
+         'checked-out commit (shallow), the history without file contents '
+         'other than the checked-out commit\'s (blobless), or only the '
+         'report\'s files and assets in the checked-out commit (sparse). '
+         'Default: full.'
+)
+@click.option(
+    '--git-cache/--no-git-cache', 'use_git_cache', default=False,
+    help='Keep a mirror of the Git repository in ~/.cache/nbreport/repos, '
+         'and only fetch new commits when the repository is used again, '
+         'instead of cloning it into a temporary directory. Concurrent '
+         'nbreport commands share the mirror. --git-clone is ignored with '
+         'the cache. Disabled by default.'
+)
+@click.option(
+    '--git-snapshot/--no-git-snapshot', 'use_git_snapshot', default=False,
+    help='Resolve --git-ref to a commit, and create the instance from a '
+         'read-only snapshot of the report at that commit in '
+         '~/.cache/nbreport/snapshots, without cloning or fetching the '
+         'repository if the snapshot exists. The snapshot is created from a '
+         'clone otherwise. Disabled by default.'
+)
+@click.option(
+    '--asset-staging', type=click.Choice(STAGING_STRATEGIES), default=None,
+    help='How to stage asset files into the instance: copy them, or share '
+         'them with the repository through hard links, copy-on-write '
+         'reflinks, or symbolic links, or through hard links to the shared '
+         'asset store in ~/.cache/nbreport/blobs (blob). Files are copied if '
+         'the filesystem doesn\'t support the strategy. Defaults to the '
+         '"asset_staging" field of nbreport.yaml, or copy. Symbolic links '
+         'can\'t be used with a Git URL, since the cloned repository is '
+         'deleted.'
 )
 @click.pass_context
 def test(ctx, repo_path_or_url, template_variables, instance_path, instance_id,
-         overwrite, timeout, kernel, git_repo_subdir, git_repo_ref):
+         overwrite, sync, matrix, jobs, timeout, kernel, kernel_pool_size,
+         kernel_max_uses, use_fork_server, use_cache, git_repo_subdir,
+         git_repo_ref, git_clone_strategy, use_git_cache, use_git_snapshot,
+         asset_staging):
     """Test a notebook repository by instantiating and computing it, but
     without publishing the result.
 
@@ -76,6 +172,11 @@ def test(ctx, repo_path_or_url, template_variables, instance_path, instance_id,
 
     3. Computes the notebook.
 
+    With a ``--matrix`` file, the repository is cloned once and an instance
+    is created for each row of the matrix, with identifiers
+    ``{id}-1``, ``{id}-2``, and so on. The instances are computed
+    concurrently (see ``--jobs``) and a status table is printed at the end.
+
     **Example**
 
     .. code-block:: bash
@@ -93,24 +194,68 @@ def test(ctx, repo_path_or_url, template_variables, instance_path, instance_id,
     template_variables = dict(template_variables)
     logger.debug('Template variables: %s', template_variables)
 
+    matrix_rows = None
+    if matrix is not None:
+        if instance_path is not None:
+            raise click.UsageError('-d/--dir can\'t be used with --matrix.')
+        try:
+            matrix_rows = read_parameter_matrix(matrix)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--matrix')
+
+    create_args = {
+        'instance_id': instance_id,
+        'template_variables': template_variables,
+        'overwrite': overwrite,
+        'sync': sync,
+        'asset_staging': asset_staging
+    }
+
+    if asset_staging == 'symlink' and is_url(repo_path_or_url):
+        raise click.UsageError(
+            '--asset-staging symlink can\'t be used with a Git URL.')
+
     if is_url(repo_path_or_url):
-        with TemporaryDirectory() as tempdir:
-            report_repo = ReportRepo.git_clone(
-                repo_path_or_url,
-                clone_base_dir=tempdir,
-                subdir=git_repo_subdir,
-                checkout=git_repo_ref
-            )
-            instance = create_instance(
-                report_repo, instance_path=instance_path,
-                instance_id=instance_id,
-                template_variables=template_variables, overwrite=overwrite)
+        with open_git_repo(repo_path_or_url,
+                           checkout=git_repo_ref,
+                           subdir=git_repo_subdir,
+                           strategy=git_clone_strategy,
+                           use_git_cache=use_git_cache,
+                           use_git_snapshot=use_git_snapshot) as report_repo:
+            if matrix_rows is None:
+                instance = create_instance(
+                    report_repo, instance_path=instance_path, **create_args)
+            else:
+                instances = create_instances(report_repo, matrix_rows,
+                                             **create_args)
     else:
         report_repo = ReportRepo(repo_path_or_url)
-        instance = create_instance(
-            report_repo, instance_path=instance_path, instance_id=instance_id,
-            template_variables=template_variables, overwrite=overwrite)
+        # Keep compiled templates between runs on a local repository
+        create_args['template_cache'] = TemplateCache(
+            directory=report_repo.template_cache_dir)
+        if matrix_rows is None:
+            instance = create_instance(
+                report_repo, instance_path=instance_path, **create_args)
+        else:
+            instances = create_instances(report_repo, matrix_rows,
+                                         **create_args)
+
+    compute_args = {
+        'jobs': jobs,
+        'kernel_pool_size': kernel_pool_size,
+        'kernel_max_uses': kernel_max_uses,
+        'fork_server': use_fork_server,
+        'timeout': timeout,
+        'kernel_name': kernel,
+        'cell_cache': CellCache() if use_cache else None,
+        'checkpoint': True
+    }
+    if matrix_rows is None:
+        results = compute_instances([instance], **compute_args)
+        raise_for_failures(results)
+        logger.debug('Computed notebook %s', instance.ipynb_path)
+        return
 
-    compute_notebook_file(instance.ipynb_path, timeout=timeout,
-                          kernel_name=kernel)
-    logger.debug('Computed notebook %s', instance.ipynb_path)
+    results = compute_instances(instances, sweep=True, **compute_args)
+    echo_results(instances, results, matrix_rows=matrix_rows)
+    raise_for_failures(results)
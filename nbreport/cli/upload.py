@@ -5,6 +5,7 @@ __all__ = ('upload',)
 
 import click
 
+from nbreport.encoding import CONTENT_ENCODINGS
 from nbreport.instance import ReportInstance
 
 
@@ -13,8 +14,15 @@ from nbreport.instance import ReportInstance
     'instance_path', default=None, required=True, nargs=1,
     type=click.Path(exists=True, file_okay=False, dir_okay=True)
 )
+@click.option(
+    '--content-encoding', type=click.Choice(CONTENT_ENCODINGS),
+    default='identity',
+    help='Compress the notebook while uploading it, with gzip or zstd '
+         '(which requires the zstandard package). The API server must '
+         'accept the encoding. Default: identity (no compression).'
+)
 @click.pass_context
-def upload(ctx, instance_path):
+def upload(ctx, instance_path, content_encoding):
     """Upload and publish a report instance.
 
     **Required arguments**
@@ -28,7 +36,9 @@ def upload(ctx, instance_path):
     queue_url = instance.upload(
         github_username=ctx.obj['config']['github']['username'],
         github_token=ctx.obj['config']['github']['token'],
-        server=ctx.obj['server'])
+        server=ctx.obj['server'],
+        session=ctx.obj['session'],
+        content_encoding=content_encoding)
 
     click.echo('Upload complete.')
     click.echo('Processing status:\n  {}'.format(queue_url))
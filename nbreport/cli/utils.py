@@ -0,0 +1,182 @@
+"""Helpers shared by the ``nbreport`` subcommands that create and compute
+report instances.
+"""
+
+__all__ = ('open_git_repo', 'compute_instances', 'echo_results',
+           'raise_for_failures')
+
+from contextlib import ExitStack, contextmanager
+
+import click
+
+from ..compute import compute_notebook_files, compute_notebook_sweep
+from ..mirror import RepoCache
+from ..processing import open_remote_repo
+from ..snapshot import SnapshotCache
+
+
+@contextmanager
+def open_git_repo(url, checkout='master', subdir=None, strategy='full',
+                  use_git_cache=False, use_git_snapshot=False):
+    """Open a report repository from a remote Git repository with the
+    ``--git-*`` options of the ``nbreport init``, ``issue``, and ``test``
+    commands.
+
+    This function is a context manager.
+
+    Parameters
+    ----------
+    url : `str`
+        URL of the remote Git repository.
+    checkout : `str`, optional
+        Git ref (branch or tag) to check out (``--git-ref``).
+    subdir : `str`, optional
+        Directory of the report repository within the Git repository
+        (``--git-subdir``).
+    strategy : `str`, optional
+        Name of the clone strategy (``--git-clone``).
+    use_git_cache : `bool`, optional
+        If `True`, the repository is opened from the repository cache
+        (``--git-cache``).
+    use_git_snapshot : `bool`, optional
+        If `True`, the repository is opened from the snapshot of the ref's
+        commit (``--git-snapshot``).
+
+    Yields
+    ------
+    report_repo : `nbreport.repo.ReportRepo`
+        The report repository (see `nbreport.processing.open_remote_repo`).
+
+    Raises
+    ------
+    click.BadParameter
+        Raised if the Git ref can't be resolved to a commit.
+    """
+    repo_cache = RepoCache() if use_git_cache else None
+    snapshot_cache = SnapshotCache() if use_git_snapshot else None
+    with ExitStack() as stack:
+        try:
+            report_repo = stack.enter_context(open_remote_repo(
+                url, checkout=checkout, subdir=subdir, strategy=strategy,
+                repo_cache=repo_cache, snapshot_cache=snapshot_cache))
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--git-ref')
+        yield report_repo
+
+
+def compute_instances(instances, jobs=1, kernel_pool_size=0,
+                      kernel_max_uses=1, fork_server=False, sweep=False,
+                      **compute_args):
+    """Compute the notebooks of report instances with the kernel options of
+    the ``nbreport compute``, ``issue``, and ``test`` commands.
+
+    Parameters
+    ----------
+    instances : sequence of `nbreport.instance.ReportInstance`
+        The report instances.
+    jobs : int, optional
+        Maximum number of notebooks to compute at once.
+    kernel_pool_size : int, optional
+        Size of the kernel pool of each process (see
+        `nbreport.compute.compute_notebook_files`).
+    kernel_max_uses : int, optional
+        Number of notebooks a pooled kernel computes before it's recycled.
+    fork_server : `bool`, optional
+        If `True`, kernels are started from a fork server that has imported
+        the modules listed in the instances' ``preload`` configuration.
+    sweep : `bool`, optional
+        If `True`, and with ``fork_server``, the instances are a parameter
+        sweep whose shared cells are executed only once (see
+        `nbreport.compute.compute_notebook_sweep`).
+    **compute_args
+        Keyword arguments passed to `nbreport.compute.compute_notebook_file`.
+
+    Returns
+    -------
+    results : `list` of `nbreport.compute.ComputeResult`
+        Outcome of computing each instance, in the same order as
+        ``instances``.
+    """
+    # Modules to preload for all of the instances
+    preload = []
+    for instance in instances:
+        if 'preload' in instance.config:
+            preload.extend(name for name in instance.config['preload']
+                           if name not in preload)
+
+    paths = [instance.ipynb_path for instance in instances]
+    if sweep and fork_server and len(paths) > 1:
+        # Execute the cells that the instances share (up to a "fork-point"
+        # cell) only once
+        return compute_notebook_sweep(paths, jobs=jobs, preload=preload,
+                                      **compute_args)
+    return compute_notebook_files(paths, jobs=jobs,
+                                  kernel_pool_size=kernel_pool_size,
+                                  kernel_max_uses=kernel_max_uses,
+                                  fork_server=fork_server, preload=preload,
+                                  **compute_args)
+
+
+def echo_results(instances, results, matrix_rows=None, success_status='ok'):
+    """Print a table of the status of each instance.
+
+    Parameters
+    ----------
+    instances : sequence of `nbreport.instance.ReportInstance`
+        The report instances.
+    results : sequence of `nbreport.compute.ComputeResult`
+        Outcome of each instance, from `compute_instances`.
+    matrix_rows : sequence of `dict`, optional
+        Parameters of each instance of a parameter sweep. If set, the table
+        has the row number and parameters of each instance.
+    success_status : `str`, optional
+        Status shown for successful instances.
+    """
+    if matrix_rows is None:
+        click.echo('{0:<8} {1:>10}  {2}'.format(
+            'Status', 'Duration', 'Instance'))
+        for instance, result in zip(instances, results):
+            click.echo('{0:<8} {1:>8.1f} s  {2!s}'.format(
+                success_status if result.success else 'FAILED',
+                result.duration,
+                instance.dirname))
+        return
+
+    click.echo('{0:>4} {1:<8} {2:>10}  {3:<16} {4}'.format(
+        'Row', 'Status', 'Duration', 'Instance', 'Parameters'))
+    for row_number, (row, instance, result) in enumerate(
+            zip(matrix_rows, instances, results), start=1):
+        click.echo('{0:>4d} {1:<8} {2:>8.1f} s  {3:<16} {4}'.format(
+            row_number,
+            success_status if result.success else 'FAILED',
+            result.duration,
+            instance.config['instance_handle'],
+            ' '.join('{0}={1}'.format(key, value)
+                     for key, value in row.items())))
+
+
+def raise_for_failures(results, action='compute'):
+    """Fail the command if any instance failed.
+
+    Parameters
+    ----------
+    results : sequence of `nbreport.compute.ComputeResult`
+        Outcome of each instance.
+    action : `str`, optional
+        What the instances failed to do, for the error message.
+
+    Raises
+    ------
+    click.ClickException
+        Raised if any instance failed. With a single instance, the message
+        includes the instance's error.
+    """
+    failures = [result for result in results if not result.success]
+    if not failures:
+        return
+    if len(results) == 1:
+        raise click.ClickException('Failed to {0} {1!s}: {2}'.format(
+            action, failures[0].path, failures[0].error))
+    raise click.ClickException(
+        '{0:d} of {1:d} instances failed to {2}.'.format(
+            len(failures), len(results), action))
@@ -0,0 +1,204 @@
+"""Cloning the Git repositories of reports.
+"""
+
+__all__ = ('CLONE_STRATEGIES', 'clone_repository', 'get_directory_size',
+           'resolve_git_ref')
+
+import logging
+import os
+from pathlib import Path
+import re
+import time
+from urllib.parse import urlparse
+
+import git
+from ruamel.yaml import YAML
+
+from .assets import normalize_pattern
+
+_SHA_RE = re.compile(r'[0-9a-f]{40}\Z')
+
+CLONE_STRATEGIES = ('full', 'shallow', 'blobless', 'sparse')
+"""Names of the strategies for cloning a report's Git repository.
+
+``full``
+    Clone the whole history and tree.
+``shallow``
+    Clone only the checked-out commit (``--depth 1``).
+``blobless``
+    Clone the history, but only download the file contents of the
+    checked-out commit (a partial clone, ``--filter=blob:none``).
+``sparse``
+    Clone only the checked-out commit, and only check out the report's
+    notebook, context, and configuration files, and the files matching its
+    ``assets`` rules. Other files in the Git repository are never
+    downloaded, which helps with reports in a subdirectory of a large
+    repository.
+
+The ``blobless`` and ``sparse`` strategies need a Git server that supports
+partial clones (such as GitHub).
+"""
+
+
+def clone_repository(url, clone_dir, checkout='master', strategy='full',
+                     subdir=None):
+    """Clone a report's Git repository.
+
+    Parameters
+    ----------
+    url : `str`
+        URL, or local path, of the Git repository.
+    clone_dir : `pathlib.Path` or `str`
+        Directory to clone the repository into.
+    checkout : `str`, optional
+        Git ref (branch or tag), or full commit SHA, to check out.
+    strategy : `str`, optional
+        Name of the clone strategy (see `CLONE_STRATEGIES`).
+    subdir : `str`, optional
+        Directory of the report repository within the Git repository, if it
+        isn't the root. The ``sparse`` strategy only checks out the report's
+        files in this directory.
+
+    Returns
+    -------
+    repo : `git.Repo`
+        The cloned repository.
+
+    Raises
+    ------
+    ValueError
+        Raised if the strategy is unknown.
+
+    Notes
+    -----
+    The time taken and the size of the downloaded Git objects are logged.
+    """
+    if strategy not in CLONE_STRATEGIES:
+        raise ValueError(
+            'Unknown clone strategy {0!r}. Use one of: {1}.'.format(
+                strategy, ', '.join(CLONE_STRATEGIES)))
+    logger = logging.getLogger(__name__)
+    clone_dir = Path(clone_dir)
+    start_time = time.perf_counter()
+
+    is_sha = _SHA_RE.match(checkout) is not None
+    fetch_args = {}
+    if strategy in ('shallow', 'sparse'):
+        fetch_args['depth'] = 1
+    if strategy in ('blobless', 'sparse'):
+        fetch_args['filter'] = 'blob:none'
+    clone_args = dict(fetch_args)
+    if is_sha:
+        # Commits can't be cloned directly; they're fetched after cloning
+        clone_args['no_checkout'] = True
+    else:
+        clone_args['branch'] = checkout
+    if strategy == 'sparse':
+        clone_args['no_checkout'] = True
+    if strategy != 'full' and urlparse(url).scheme in ('', 'file'):
+        # Local clones copy or link the object files, ignoring --depth and
+        # --filter, unless they use Git's transport
+        clone_args['no_local'] = True
+
+    repo = git.Repo.clone_from(url, str(clone_dir), **clone_args)
+    if is_sha:
+        repo.git.fetch('origin', checkout, **fetch_args)
+
+    if strategy == 'sparse':
+        patterns = _get_sparse_patterns(repo, subdir,
+                                        checkout if is_sha else 'HEAD')
+        logger.debug('Sparse checkout patterns: %s', patterns)
+        repo.git.sparse_checkout('set', '--no-cone', *patterns)
+    if is_sha or strategy == 'sparse':
+        repo.git.checkout(checkout)
+
+    duration = time.perf_counter() - start_time
+    object_size = get_directory_size(clone_dir / '.git' / 'objects')
+    logger.info('Cloned %s (%s, %s strategy) in %.2f s, fetching %.1f MB',
+                url, checkout, strategy, duration, object_size / 1e6)
+    return repo
+
+
+def resolve_git_ref(url, ref):
+    """Resolve a Git ref of a remote repository to a commit SHA, without
+    cloning it.
+
+    Parameters
+    ----------
+    url : `str`
+        URL, or local path, of the Git repository.
+    ref : `str`
+        Branch or tag name, or a commit SHA.
+
+    Returns
+    -------
+    sha : `str`
+        The commit's full SHA. A full SHA is returned as is, without
+        contacting the remote repository.
+
+    Raises
+    ------
+    ValueError
+        Raised if the remote repository doesn't have the ref.
+    """
+    if _SHA_RE.match(ref) is not None:
+        return ref
+    output = git.cmd.Git().ls_remote(url, ref, ref + '^{}')
+    remote_refs = {}
+    for line in output.splitlines():
+        sha, name = line.split('\t', 1)
+        remote_refs[name] = sha
+    # Branches, then tags (peeled to their commits), then full ref names
+    for name in ('refs/heads/' + ref, 'refs/tags/' + ref + '^{}',
+                 'refs/tags/' + ref, ref + '^{}', ref):
+        if name in remote_refs:
+            return remote_refs[name]
+    raise ValueError(
+        'Git ref {0!r} not found in {1}.'.format(ref, url))
+
+
+def get_directory_size(path):
+    """Get the total size of the files in a directory tree.
+
+    Parameters
+    ----------
+    path : `str` or `pathlib.Path`
+        Path of the directory.
+
+    Returns
+    -------
+    size : `int`
+        Total size of the files, in bytes. Symbolic links are counted by
+        their own size, and files that disappear during the walk are
+        skipped.
+    """
+    size = 0
+    for dirpath, _, filenames in os.walk(str(path)):
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                continue
+    return size
+
+
+def _get_sparse_patterns(repo, subdir, rev):
+    """Get the sparse checkout patterns for a report's files, from the
+    ``nbreport.yaml`` file at a revision.
+    """
+    prefix = '/'
+    if subdir:
+        prefix += normalize_pattern(subdir) + '/'
+    try:
+        config_text = repo.git.show(
+            '{0}:{1}nbreport.yaml'.format(rev, prefix[1:]))
+    except git.GitCommandError:
+        # Not a report repository; check out the whole directory
+        return [prefix]
+    config = YAML(typ='safe').load(config_text) or {}
+
+    paths = ['nbreport.yaml', 'cookiecutter.json']
+    if config.get('ipynb'):
+        paths.append(config['ipynb'])
+    paths.extend(config.get('assets') or [])
+    return [prefix + normalize_pattern(path) for path in paths]
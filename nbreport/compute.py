@@ -1,18 +1,78 @@
 """APIs for computing (running) notebooks.
 """
 
-__all__ = ('compute_notebook_file', 'compute_notebook')
+__all__ = ('compute_notebook_file', 'compute_notebook_files',
+           'compute_notebook_sweep', 'compute_notebook', 'get_checkpoint_path',
+           'get_slowest_cells', 'ComputeResult', 'STATE_SETUP_TAG',
+           'FORK_POINT_TAG')
 
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import copy
+import datetime
+import json
 import logging
+from multiprocessing.util import Finalize
+import os
 from pathlib import Path
 from tempfile import TemporaryDirectory
+import time
 import uuid
 
 from nbconvert.preprocessors import ExecutePreprocessor, CellExecutionError
 import nbformat
 
+from .cellcache import compute_cell_keys
+from .forkserver import ForkServer
+from .fsutils import create_temp_file
+from .kernelpool import KernelPool
+from .memory import KernelMemorySampler
+from .profiling import (PROFILE_TAG, get_profiler_setup_code, get_start_code,
+                        get_stop_code, collapsed_to_speedscope)
 
-def compute_notebook_file(path, as_version=None, **compute_args):
+
+STATE_SETUP_TAG = 'state-setup'
+"""Tag for notebook cells that set up kernel state (imports, data loading)
+that later cells rely on.
+
+When only a part of a notebook can be replayed from a cell cache, or when a
+computation is resumed from a checkpoint, cells with this tag are re-executed
+to rebuild the kernel's state while other cells keep their outputs.
+"""
+
+FORK_POINT_TAG = 'fork-point'
+"""Tag for the last notebook cell of the setup that every notebook of a
+parameter sweep shares.
+
+`compute_notebook_sweep` executes the cells up to and including the tagged
+cell only once, and computes the cells below it for each notebook.
+"""
+
+
+ComputeResult = namedtuple('ComputeResult',
+                           ['path', 'success', 'duration', 'error'])
+ComputeResult.__doc__ = """Outcome of computing a notebook file with
+`compute_notebook_files`.
+
+Attributes
+----------
+path : `pathlib.Path`
+    Path of the notebook (ipynb) file.
+success : `bool`
+    `True` if the notebook was computed without errors.
+duration : `float`
+    Time, in seconds, spent computing the notebook.
+error : `str` or `None`
+    Description of the error, if the notebook failed to compute.
+"""
+
+# Kernel pool and fork server of a compute_notebook_files worker process
+_worker_kernel_pool = None
+_worker_fork_server = None
+
+
+def compute_notebook_file(path, as_version=None, checkpoint=False,
+                          resume=False, **compute_args):
     """Compute an ipynb notebook file and save it in place.
 
     Parameters
@@ -23,22 +83,356 @@ def compute_notebook_file(path, as_version=None, **compute_args):
     as_version : int, optional
         Notebook version to coerce the file into. `None` means
         `nbformat.NO_CONVERT`. See the `nbformat.read` documentation.
+    checkpoint : `bool`, optional
+        If `True`, the partially-computed notebook is periodically saved to a
+        checkpoint file next to the notebook (see `get_checkpoint_path`), and
+        also when a cell fails. The checkpoint file is removed once the
+        notebook is computed successfully.
+    resume : `bool`, optional
+        If `True`, and a checkpoint file exists, resume computing from the
+        checkpoint. Cells that were computed before the checkpoint keep their
+        outputs and are not executed again, except those with the
+        ``state-setup`` tag (`STATE_SETUP_TAG`), which are re-executed to
+        rebuild the kernel's state. If a cell's source changed since the
+        checkpoint, the notebook is resumed from that cell.
     **compute_args
         Keyword arguments passed to `compute_notebook`.
     """
-    if isinstance(path, Path):
-        path_str = str(path.resolve())
+    logger = logging.getLogger(__name__)
+
+    path = Path(path).resolve()
+    path_str = str(path)
+    checkpoint_path = get_checkpoint_path(path)
 
     if as_version is None:
         as_version = nbformat.NO_CONVERT
 
     notebook = nbformat.read(path_str,
                              as_version=as_version)
+
+    if resume:
+        if checkpoint_path.exists():
+            checkpoint_notebook = nbformat.read(str(checkpoint_path),
+                                                as_version=as_version)
+            notebook, start_cell = _merge_checkpoint(notebook,
+                                                     checkpoint_notebook)
+            logger.info('Resuming %s from cell %d', path, start_cell)
+            compute_args['start_cell'] = start_cell
+        else:
+            logger.warning('No checkpoint found at %s; computing from the '
+                           'first cell.', checkpoint_path)
+
+    if checkpoint or resume:
+        compute_args['checkpoint_path'] = checkpoint_path
+
+    # Cell profiles are saved next to the notebook
+    compute_args.setdefault('profile_dir', path.parent)
+    compute_args.setdefault('profile_name', path.stem)
+
     notebook = compute_notebook(notebook, **compute_args)
     nbformat.write(notebook, path_str)
 
+    if checkpoint_path.exists():
+        checkpoint_path.unlink()
+
+
+def get_checkpoint_path(path):
+    """Get the path of the checkpoint file for a notebook file.
+
+    Parameters
+    ----------
+    path : `pathlib.Path` or `str`
+        Path of the notebook (ipynb) file.
+
+    Returns
+    -------
+    checkpoint_path : `pathlib.Path`
+        Path of the checkpoint file, ``.{{name}}.checkpoint.ipynb``, in the
+        same directory as the notebook.
+    """
+    path = Path(path)
+    return path.with_name('.{0}.checkpoint.ipynb'.format(path.stem))
+
+
+def _merge_checkpoint(notebook, checkpoint_notebook):
+    """Copy outputs of computed cells from a checkpoint into a notebook.
+
+    Returns the notebook and the index of the cell to resume from.
+    """
+    start_cell = checkpoint_notebook.metadata.get(
+        'nbreport_checkpoint', {}).get('next_cell', 0)
+    start_cell = min(start_cell, len(notebook.cells))
+    for index in range(start_cell):
+        cell = notebook.cells[index]
+        try:
+            checkpoint_cell = checkpoint_notebook.cells[index]
+        except IndexError:
+            return notebook, index
+        if cell.cell_type != checkpoint_cell.cell_type \
+                or cell.source != checkpoint_cell.source:
+            return notebook, index
+        if cell.cell_type == 'code':
+            cell.outputs = checkpoint_cell.outputs
+            cell.execution_count = checkpoint_cell.execution_count
+    return notebook, start_cell
+
+
+def compute_notebook_files(paths, jobs=1, kernel_pool_size=0,
+                           kernel_max_uses=1, fork_server=False,
+                           preload=None, **compute_args):
+    """Compute a batch of ipynb notebook files, in parallel, and save each in
+    place.
+
+    Parameters
+    ----------
+    paths : sequence of `pathlib.Path` or `str`
+        Paths of the notebook (ipynb) files.
+    jobs : int, optional
+        Maximum number of notebooks to compute at once. Each concurrent
+        notebook is computed in its own worker process.
+    kernel_pool_size : int, optional
+        If greater than zero, each worker process computes its notebooks with
+        a `~nbreport.kernelpool.KernelPool` of this size, which is warmed
+        before the first notebook is computed. The pool isn't used if each
+        process only computes one notebook, since its kernels would be
+        started for nothing.
+    kernel_max_uses : int, optional
+        Number of notebooks a pooled kernel computes before it is recycled.
+        See `~nbreport.kernelpool.KernelPool`.
+    fork_server : `bool`, optional
+        If `True`, each worker process starts its kernels from a
+        `~nbreport.forkserver.ForkServer`.
+    preload : sequence of `str`, optional
+        Names of modules to import in the fork server's template process, or
+        in pooled kernels, before computing notebooks.
+    **compute_args
+        Keyword arguments passed to `compute_notebook_file`.
+
+    Returns
+    -------
+    results : `list` of `ComputeResult`
+        Outcome of computing each notebook, in the same order as ``paths``.
+        A notebook that fails to compute does not stop the others from being
+        computed.
+    """
+    logger = logging.getLogger(__name__)
+    paths = [Path(path) for path in paths]
+    kernel_name = compute_args.get('kernel_name', '')
+
+    workers = min(jobs, len(paths)) if jobs > 1 else 1
+    if kernel_pool_size > 0 and len(paths) <= workers:
+        logger.warning('Not using a kernel pool, since each process only '
+                       'computes one notebook.')
+        kernel_pool_size = 0
+
+    if workers > 1:
+        with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_compute_worker,
+                initargs=(kernel_pool_size, kernel_max_uses, fork_server,
+                          preload, kernel_name)) as executor:
+            futures = [executor.submit(_compute_in_worker, path, compute_args)
+                       for path in paths]
+            return [future.result() for future in futures]
+
+    fork_server, kernel_pool = _create_kernel_sources(
+        kernel_pool_size, kernel_max_uses, fork_server, preload, kernel_name)
+    try:
+        return [_compute_with_result(path, compute_args,
+                                     kernel_pool=kernel_pool,
+                                     fork_server=fork_server)
+                for path in paths]
+    finally:
+        if kernel_pool is not None:
+            kernel_pool.shutdown()
+        if fork_server is not None:
+            fork_server.shutdown()
+
+
+def _create_kernel_sources(kernel_pool_size, kernel_max_uses, fork_server,
+                           preload, kernel_name):
+    """Create the fork server and kernel pool used by
+    `compute_notebook_files`, and warm the pool.
+    """
+    if fork_server:
+        fork_server = ForkServer(preload=preload)
+    else:
+        fork_server = None
+    kernel_pool = None
+    if kernel_pool_size > 0:
+        # Kernels forked from the fork server already have the modules
+        kernel_pool = KernelPool(size=kernel_pool_size,
+                                 max_uses=kernel_max_uses,
+                                 preload=None if fork_server else preload,
+                                 fork_server=fork_server)
+        try:
+            kernel_pool.warm(kernel_name)
+        except Exception as e:
+            # Computations start their own kernels, and report the error
+            logging.getLogger(__name__).warning(
+                'Could not warm the kernel pool: %s', e)
+    return fork_server, kernel_pool
+
+
+def _init_compute_worker(kernel_pool_size, kernel_max_uses, fork_server,
+                         preload, kernel_name):
+    global _worker_kernel_pool, _worker_fork_server
+    _worker_fork_server, _worker_kernel_pool = _create_kernel_sources(
+        kernel_pool_size, kernel_max_uses, fork_server, preload, kernel_name)
+    # Worker processes don't run atexit handlers. Pooled kernels are shut
+    # down before the fork server.
+    if _worker_fork_server is not None:
+        Finalize(_worker_fork_server, _worker_fork_server.shutdown,
+                 exitpriority=5)
+    if _worker_kernel_pool is not None:
+        Finalize(_worker_kernel_pool, _worker_kernel_pool.shutdown,
+                 exitpriority=10)
+
+
+def _compute_in_worker(path, compute_args):
+    return _compute_with_result(path, compute_args,
+                                kernel_pool=_worker_kernel_pool,
+                                fork_server=_worker_fork_server)
+
+
+def _compute_with_result(path, compute_args, kernel_pool=None,
+                         fork_server=None):
+    logger = logging.getLogger(__name__)
+    start = time.perf_counter()
+    try:
+        compute_notebook_file(path, kernel_pool=kernel_pool,
+                              fork_server=fork_server, **compute_args)
+    except Exception as e:
+        logger.error('Failed to compute %s: %s', path, e)
+        return ComputeResult(path=path, success=False,
+                             duration=time.perf_counter() - start,
+                             error='{0}: {1}'.format(type(e).__name__, e))
+    return ComputeResult(path=path, success=True,
+                         duration=time.perf_counter() - start, error=None)
+
+
+def compute_notebook_sweep(paths, jobs=1, preload=None, **compute_args):
+    """Compute the notebooks of a parameter sweep, executing the setup they
+    share only once, and save each in place.
+
+    Parameters
+    ----------
+    paths : sequence of `pathlib.Path` or `str`
+        Paths of the notebook (ipynb) files. These are usually instances of
+        the same report, rendered with different template variables.
+    jobs : int, optional
+        Maximum number of notebooks to compute at once.
+    preload : sequence of `str`, optional
+        Names of modules to import in the fork server's template process.
+    **compute_args
+        Keyword arguments passed to `compute_notebook_file`.
+
+    Returns
+    -------
+    results : `list` of `ComputeResult`
+        Outcome of computing each notebook, in the same order as ``paths``.
+
+    Notes
+    -----
+    The notebooks must mark the end of their shared setup by tagging a cell
+    with ``fork-point`` (`FORK_POINT_TAG`). The cells up to and including
+    that cell (the *prefix*) must be the same in every notebook; template
+    variables that differ between notebooks must only be used below the
+    fork point.
+
+    The prefix is executed once in the template process of a
+    `~nbreport.forkserver.ForkServer`, in the first notebook's directory.
+    Since the instances of a sweep have the same asset files, the prefix can
+    read assets by their relative paths. Then, for each notebook, a kernel
+    that starts with the prefix's state is forked, in the notebook's own
+    directory, and only the cells below the fork point are executed. Each
+    notebook gets the prefix's outputs.
+
+    If the notebooks don't have a common prefix, they are computed in full
+    with `compute_notebook_files`, using a fork server.
+    """
+    logger = logging.getLogger(__name__)
+    paths = [Path(path).resolve() for path in paths]
+    notebooks = [nbformat.read(str(path), as_version=nbformat.NO_CONVERT)
+                 for path in paths]
+
+    fork_point = _find_fork_point(notebooks)
+    if fork_point is None:
+        logger.warning('The notebooks don\'t share a prefix of cells ending '
+                       'with a %r cell; computing each notebook in full.',
+                       FORK_POINT_TAG)
+        return compute_notebook_files(paths, jobs=jobs, fork_server=True,
+                                      preload=preload, **compute_args)
+
+    # The template process stays in this directory, which outlives the fork
+    # server
+    prefix_dirname = paths[0].parent
+    with ForkServer(preload=preload) as fork_server:
+        start = time.perf_counter()
+        prefix_outputs = {}
+        try:
+            for index, cell in enumerate(notebooks[0].cells[:fork_point + 1]):
+                if cell.cell_type == 'code':
+                    prefix_outputs[index] = fork_server.execute(
+                        cell.source, cwd=prefix_dirname)
+        except RuntimeError as e:
+            logger.error('Failed to compute the shared cells: %s', e)
+            duration = time.perf_counter() - start
+            return [ComputeResult(path=path, success=False,
+                                  duration=duration,
+                                  error='RuntimeError: {0}'.format(e))
+                    for path in paths]
+        logger.info('Computed the shared cells in %.1f s',
+                    time.perf_counter() - start)
+
+        for path, notebook in zip(paths, notebooks):
+            for index, (outputs, execution_count) in prefix_outputs.items():
+                notebook.cells[index].outputs = copy.deepcopy(outputs)
+                notebook.cells[index].execution_count = execution_count
+            nbformat.write(notebook, str(path))
 
-def compute_notebook(notebook, dirname=None, kernel_name='', timeout=None):
+        # The forked kernels already have the prefix's state
+        compute_args = dict(compute_args, start_cell=fork_point + 1,
+                            rerun_state_setup=False)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(_compute_with_result, path,
+                                       compute_args, fork_server=fork_server)
+                       for path in paths]
+            return [future.result() for future in futures]
+
+
+def _find_fork_point(notebooks):
+    """Find the index of the fork point cell, if every notebook has the
+    same cells up to and including it.
+    """
+    first_cells = notebooks[0].cells
+    for index, cell in enumerate(first_cells):
+        if FORK_POINT_TAG in cell.metadata.get('tags', []):
+            fork_point = index
+            break
+    else:
+        return None
+
+    for notebook in notebooks[1:]:
+        if len(notebook.cells) <= fork_point:
+            return None
+        for cell, first_cell in zip(notebook.cells[:fork_point + 1],
+                                    first_cells):
+            if cell.cell_type != first_cell.cell_type \
+                    or cell.source != first_cell.source:
+                return None
+    return fork_point
+
+
+def compute_notebook(notebook, dirname=None, kernel_name='', timeout=None,
+                     kernel_pool=None, fork_server=None, cell_cache=None,
+                     checkpoint_path=None,
+                     checkpoint_cells=10, checkpoint_interval=300.,
+                     start_cell=0, rerun_state_setup=True,
+                     slowest_cell_count=5, memory_interval=None,
+                     memory_limit=None, profile_cells=None, profile_dir=None,
+                     profile_name='notebook', profile_format='collapsed',
+                     profile_interval=0.005):
     """Compute a notebook object.
 
     Parameters
@@ -53,6 +447,69 @@ def compute_notebook(notebook, dirname=None, kernel_name='', timeout=None):
         When not specified, the default Python kernel is used.
     timeout : int, optional
         Cell execution timeout. By default there is no timeout.
+    kernel_pool : `nbreport.kernelpool.KernelPool`, optional
+        Pool of warm kernels. If set, the notebook is computed with a kernel
+        borrowed from the pool instead of a newly-started kernel.
+    fork_server : `nbreport.forkserver.ForkServer`, optional
+        Fork server. If set, and ``kernel_pool`` isn't, the notebook is
+        computed with a kernel forked from the fork server's template
+        process, which starts much faster than a new kernel process.
+    cell_cache : `nbreport.cellcache.CellCache`, optional
+        Cache of cell outputs. If set, computed cells are added to the cache,
+        and unchanged cells are replayed from the cache. See Notes.
+    checkpoint_path : `pathlib.Path` or `str`, optional
+        If set, the partially-computed notebook is saved to this path after
+        every ``checkpoint_cells`` executed cells or ``checkpoint_interval``
+        seconds, whichever comes first, and when a cell fails or times out.
+        The checkpoint records the index of the next cell to compute in the
+        ``nbreport_checkpoint.next_cell`` notebook metadata field.
+    checkpoint_cells : int, optional
+        Number of executed cells between checkpoints. `None` disables
+        cell-count-based checkpoints.
+    checkpoint_interval : float, optional
+        Time, in seconds, between checkpoints. `None` disables time-based
+        checkpoints.
+    start_cell : int, optional
+        Index of the first cell to execute. Cells above it keep their
+        existing outputs, except those with the ``state-setup`` tag
+        (`STATE_SETUP_TAG`), which are executed to rebuild the kernel's
+        state. This is how `compute_notebook_file` resumes a computation.
+    rerun_state_setup : `bool`, optional
+        If `False`, the cells above ``start_cell`` that have the
+        ``state-setup`` tag aren't executed either, because the kernel
+        already has their state. `compute_notebook_sweep` uses this for
+        kernels forked from a fork server that executed those cells.
+    slowest_cell_count : int, optional
+        Number of the slowest cells to list in the notebook's timing summary.
+    memory_interval : float, optional
+        If set, the resident memory (RSS) of the kernel's process tree is
+        sampled at this interval, in seconds, while each cell runs. Memory
+        sampling requires the optional ``psutil`` package.
+    memory_limit : int, optional
+        Memory ceiling, in bytes, for the kernel's process tree. If a cell
+        exceeds the ceiling, the kernel is interrupted (and killed if that
+        doesn't free memory) and the cell is marked with a
+        ``memory_limit_exceeded`` field in its ``nbreport`` metadata. Setting
+        a ceiling enables memory sampling (every 0.1 seconds unless
+        ``memory_interval`` is set).
+    profile_cells : `str` or sequence of int, optional
+        Cells to run under a sampling profiler inside the kernel: either
+        ``'all'`` (every code cell) or a sequence of cell indices. Cells
+        with the ``nbreport-profile`` tag (`nbreport.profiling.PROFILE_TAG`)
+        are also profiled. Profiling requires ``profile_dir``.
+    profile_dir : `pathlib.Path` or `str`, optional
+        Directory where cell profiles are saved. `compute_notebook_file` sets
+        this to the notebook's directory. If `None`, cells aren't profiled.
+    profile_name : `str`, optional
+        Prefix of profile file names, usually the notebook's file name
+        without its extension. Profiles are named
+        ``{profile_name}-cell{index}.collapsed`` or
+        ``{profile_name}-cell{index}.speedscope.json``.
+    profile_format : `str`, optional
+        Format of profiles: ``'collapsed'`` (collapsed stacks, for flame
+        graph tools) or ``'speedscope'`` (speedscope JSON).
+    profile_interval : float, optional
+        Sampling interval of the profiler, in seconds.
 
     Returns
     -------
@@ -63,19 +520,418 @@ def compute_notebook(notebook, dirname=None, kernel_name='', timeout=None):
     ------
     nbconvert.preprocessors.CellExecutionError
         Raised if there is an error running the notebook itself.
+
+    Notes
+    -----
+    With a ``cell_cache``, if every code cell is in the cache (for example,
+    when only Markdown cells changed) the cached outputs are replayed without
+    starting a kernel.
+
+    Otherwise, cells are executed, starting from the first changed cell,
+    if the notebook marks the cells that set up kernel state with the
+    ``state-setup`` tag (`STATE_SETUP_TAG`). Unchanged cells above the first
+    changed cell are replayed from the cache, except those with the
+    ``state-setup`` tag, which are re-executed to rebuild the kernel's state.
+    If no cells are tagged, every cell is executed, since any of them could
+    set up state that later cells need.
+
+    Each executed code cell gets timing information in its ``nbreport``
+    metadata field:
+
+    ``wall_time``
+        Time, in seconds, from sending the cell to the kernel until its
+        outputs were received.
+    ``queued``, ``started``, ``completed``
+        ISO 8601 timestamps of when the cell was sent to the kernel, when the
+        kernel started executing it, and when execution was complete.
+    ``output_bytes``
+        Size of the cell's outputs, in bytes of JSON.
+    ``peak_rss``, ``delta_rss``
+        With memory sampling, the peak RSS of the kernel while the cell ran,
+        and the change in RSS from the start to the end of the cell, in
+        bytes.
+    ``profile``
+        For profiled cells, the file name of the cell's profile, relative to
+        ``profile_dir``.
+
+    The notebook's ``nbreport.compute`` metadata field summarizes the
+    computation with the ``total_time`` and ``kernel_startup_time`` (in
+    seconds) and the ``slowest_cells``, a list of the cell ``index`` and
+    ``wall_time`` of the slowest cells. See also `get_slowest_cells`. Its
+    ``replayed`` field is `True` if every cell was replayed from the
+    ``cell_cache``, in which case no kernel was started, the
+    ``kernel_startup_time`` is `None`, and ``slowest_cells`` is empty.
     """
-    preprocessor = ExecutePreprocessor(
+    logger = logging.getLogger(__name__)
+
+    start_time = time.perf_counter()
+
+    preprocessor = _ExecutePreprocessor(
         timeout=timeout,
-        kernel_name=kernel_name)
+        kernel_name=kernel_name,
+        cell_cache=cell_cache,
+        checkpoint_path=checkpoint_path,
+        checkpoint_cells=checkpoint_cells,
+        checkpoint_interval=checkpoint_interval,
+        memory_interval=memory_interval,
+        memory_limit=memory_limit,
+        profile_cells=profile_cells,
+        profile_dir=profile_dir,
+        profile_name=profile_name,
+        profile_format=profile_format,
+        profile_interval=profile_interval)
+
+    if preprocessor.plan_replay(notebook):
+        logger.info('All cells replayed from the cell cache.')
+        notebook = preprocessor.replay(notebook)
+        notebook.metadata.setdefault('nbreport', {})['compute'] = {
+            'total_time': time.perf_counter() - start_time,
+            'kernel_startup_time': None,
+            'slowest_cells': [],
+            'replayed': True
+        }
+        return notebook
+    preprocessor.plan_resume(notebook, start_cell,
+                             rerun_state_setup=rerun_state_setup)
 
     if dirname is None:
         with TemporaryDirectory() as temp_dirname:
-            return _run_preprocessor(preprocessor, notebook, temp_dirname)
+            notebook = _run_preprocessor(preprocessor, notebook,
+                                         temp_dirname,
+                                         kernel_pool=kernel_pool,
+                                         fork_server=fork_server)
     else:
-        return _run_preprocessor(preprocessor, notebook, dirname)
+        notebook = _run_preprocessor(preprocessor, notebook, dirname,
+                                     kernel_pool=kernel_pool,
+                                     fork_server=fork_server)
+
+    cell_times = [
+        (index, cell.metadata['nbreport']['wall_time'])
+        for index, cell in enumerate(notebook.cells)
+        if index in preprocessor.timed_cells]
+    cell_times.sort(key=lambda item: item[1], reverse=True)
+    notebook.metadata.setdefault('nbreport', {})['compute'] = {
+        'total_time': time.perf_counter() - start_time,
+        'kernel_startup_time': preprocessor.kernel_startup_time,
+        'slowest_cells': [{'index': index, 'wall_time': wall_time}
+                          for index, wall_time
+                          in cell_times[:slowest_cell_count]],
+        'replayed': False
+    }
+    return notebook
+
+
+def get_slowest_cells(notebook):
+    """Get the slowest cells of a computed notebook.
+
+    Parameters
+    ----------
+    notebook : `nbformat.NotebookNode`
+        Notebook computed by `compute_notebook`.
+
+    Returns
+    -------
+    cells : `list` of `tuple`
+        The slowest cells, slowest first, as ``(index, wall_time, cell)``
+        tuples. ``index`` is the index of the cell in the notebook,
+        ``wall_time`` is the time, in seconds, the cell took to compute, and
+        ``cell`` is the `~nbformat.NotebookNode` of the cell. The list is
+        empty if the notebook has no timing summary.
+    """
+    summary = notebook.metadata.get('nbreport', {}).get('compute', {})
+    return [(item['index'], item['wall_time'], notebook.cells[item['index']])
+            for item in summary.get('slowest_cells', [])]
+
+
+class _ExecutePreprocessor(ExecutePreprocessor):
+    """Execute preprocessor that replays unchanged cells instead of
+    executing them, checkpoints progress, and instruments executed cells.
+    """
+
+    def __init__(self, cell_cache=None, checkpoint_path=None,
+                 checkpoint_cells=None, checkpoint_interval=None,
+                 memory_interval=None, memory_limit=None, profile_cells=None,
+                 profile_dir=None, profile_name='notebook',
+                 profile_format='collapsed', profile_interval=0.005, **kw):
+        super().__init__(**kw)
+        self.cell_cache = cell_cache
+        self.cell_keys = []
+        self.replayed_cells = {}
+
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_cells = checkpoint_cells
+        self.checkpoint_interval = checkpoint_interval
+        self._cells_since_checkpoint = 0
+        self._last_checkpoint_time = time.monotonic()
+
+        self.timed_cells = set()
+        self.kernel_startup_time = None
+        self._preprocess_start_time = None
+
+        self.memory_interval = memory_interval
+        self.memory_limit = memory_limit
+        self.memory_sampler = None
+
+        if profile_format not in ('collapsed', 'speedscope'):
+            raise ValueError(
+                'Unknown profile format {!r}'.format(profile_format))
+        if profile_cells is None:
+            profile_cells = ()
+        elif profile_cells != 'all':
+            profile_cells = set(profile_cells)
+        self.profile_cells = profile_cells
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.profile_name = profile_name
+        self.profile_format = profile_format
+        self.profile_interval = profile_interval
+        self._profiler_installed = False
 
+    def preprocess(self, nb, resources=None, km=None):
+        self._preprocess_start_time = time.perf_counter()
+        self._profiler_installed = False
+        try:
+            return super().preprocess(nb, resources, km=km)
+        finally:
+            if self.memory_sampler is not None:
+                self.memory_sampler.stop()
+                self.memory_sampler = None
 
-def _run_preprocessor(preprocessor, notebook, dirname):
+    def plan_replay(self, notebook):
+        """Decide which cells are replayed from the cell cache.
+
+        Returns `True` if every code cell can be replayed.
+        """
+        self.replayed_cells = {}
+        if self.cell_cache is None:
+            return False
+
+        self.cell_keys = compute_cell_keys(notebook,
+                                           kernel_name=self.kernel_name)
+        hits = {}
+        for index, key in enumerate(self.cell_keys):
+            if key is None:
+                continue
+            entry = self.cell_cache.get(key)
+            if entry is None:
+                # Keys are chained, so no cell below is cached either
+                break
+            hits[index] = entry
+
+        code_cell_count = sum(1 for key in self.cell_keys if key is not None)
+        if len(hits) == code_cell_count:
+            self.replayed_cells = hits
+            return True
+
+        state_cells = set(
+            index for index, cell in enumerate(notebook.cells)
+            if STATE_SETUP_TAG in cell.metadata.get('tags', []))
+        if state_cells:
+            self.replayed_cells = {index: entry
+                                   for index, entry in hits.items()
+                                   if index not in state_cells}
+        return False
+
+    def plan_resume(self, notebook, start_cell, rerun_state_setup=True):
+        """Keep the outputs of cells above ``start_cell``, except for
+        ``state-setup`` cells, which are executed if ``rerun_state_setup``
+        is `True`.
+        """
+        for index, cell in enumerate(notebook.cells[:start_cell]):
+            if cell.cell_type != 'code' or index in self.replayed_cells:
+                continue
+            if rerun_state_setup \
+                    and STATE_SETUP_TAG in cell.metadata.get('tags', []):
+                continue
+            self.replayed_cells[index] = None
+
+    def replay(self, notebook):
+        """Replay cached outputs into the notebook without executing it.
+        """
+        for index, entry in self.replayed_cells.items():
+            _replay_cell(notebook.cells[index], entry)
+        return notebook
+
+    def preprocess_cell(self, cell, resources, index):
+        if self.kernel_startup_time is None:
+            self.kernel_startup_time = \
+                time.perf_counter() - self._preprocess_start_time
+
+        if index in self.replayed_cells:
+            _replay_cell(cell, self.replayed_cells[index])
+            return cell, self.resources
+
+        if cell.cell_type != 'code':
+            return super().preprocess_cell(cell, resources, index)
+
+        if self.memory_sampler is None and (
+                self.memory_interval is not None
+                or self.memory_limit is not None):
+            self.memory_sampler = KernelMemorySampler(
+                self.km,
+                interval=self.memory_interval or 0.1,
+                limit=self.memory_limit)
+            self.memory_sampler.start()
+        if self.memory_sampler is not None:
+            self.memory_sampler.begin_cell()
+
+        profile_path = None
+        if self._is_profiled(cell, index):
+            profile_path = self._start_profiler(index)
+
+        queued = _timestamp()
+        start_time = time.perf_counter()
+        try:
+            try:
+                cell, resources = super().preprocess_cell(cell, resources,
+                                                          index)
+            finally:
+                # Saving the profile isn't part of the cell's wall time
+                end_time = time.perf_counter()
+                completed = _timestamp()
+                if profile_path is not None:
+                    profile_path = self._stop_profiler(profile_path)
+        except Exception:
+            # Includes cell errors, timeouts, and dead kernels
+            if self.memory_sampler is not None \
+                    and self.memory_sampler.limit_exceeded:
+                cell.metadata.setdefault('nbreport', {})[
+                    'memory_limit_exceeded'] = True
+                self.log.error('Cell %d exceeded the memory limit', index)
+            if self.checkpoint_path is not None:
+                self.write_checkpoint(index)
+            raise
+
+        wall_time = end_time - start_time
+        execution = cell.metadata.get('execution', {})
+        cell_metadata = {
+            'wall_time': wall_time,
+            'queued': queued,
+            'started': execution.get('iopub.status.busy', queued),
+            'completed': execution.get('shell.execute_reply', completed),
+            'output_bytes': len(json.dumps(cell.outputs))
+        }
+        if self.memory_sampler is not None:
+            peak_rss, delta_rss = self.memory_sampler.end_cell()
+            cell_metadata['peak_rss'] = peak_rss
+            cell_metadata['delta_rss'] = delta_rss
+        if profile_path is not None:
+            cell_metadata['profile'] = profile_path.name
+        cell.metadata['nbreport'] = cell_metadata
+        self.timed_cells.add(index)
+
+        if self.cell_cache is not None:
+            self.cell_cache.put(self.cell_keys[index], cell)
+
+        if self.checkpoint_path is not None:
+            self._cells_since_checkpoint += 1
+            elapsed = time.monotonic() - self._last_checkpoint_time
+            cells_due = (self.checkpoint_cells is not None and
+                         self._cells_since_checkpoint >= self.checkpoint_cells)
+            time_due = (self.checkpoint_interval is not None and
+                        elapsed >= self.checkpoint_interval)
+            if cells_due or time_due:
+                self.write_checkpoint(index + 1)
+        return cell, resources
+
+    def _is_profiled(self, cell, index):
+        if self.profile_dir is None:
+            return False
+        return (self.profile_cells == 'all'
+                or index in self.profile_cells
+                or PROFILE_TAG in cell.metadata.get('tags', []))
+
+    def _start_profiler(self, index):
+        """Start the in-kernel profiler, returning the path of the collapsed
+        stacks file it will write.
+        """
+        if not self._profiler_installed:
+            self._execute_silently(get_profiler_setup_code())
+            self._profiler_installed = True
+        self._execute_silently(get_start_code(self.profile_interval))
+        return self.profile_dir / '{0}-cell{1:d}.collapsed'.format(
+            self.profile_name, index)
+
+    def _stop_profiler(self, collapsed_path):
+        """Stop the in-kernel profiler and save the profile, returning the
+        path of the profile file (or `None` if it couldn't be saved).
+        """
+        try:
+            self._execute_silently(get_stop_code(collapsed_path))
+        except Exception as e:
+            self.log.warning('Could not save cell profile: %s', e)
+            return None
+        if self.profile_format == 'collapsed':
+            return collapsed_path
+
+        speedscope_path = collapsed_path.with_name(
+            collapsed_path.stem + '.speedscope.json')
+        with open(collapsed_path) as fp:
+            profile = collapsed_to_speedscope(
+                fp, name=collapsed_path.stem,
+                interval=self.profile_interval)
+        with open(speedscope_path, 'w') as fp:
+            json.dump(profile, fp)
+        collapsed_path.unlink()
+        return speedscope_path
+
+    def _execute_silently(self, code):
+        """Execute code in the kernel without recording it in the notebook.
+        """
+        msg_id = self.kc.execute(code, silent=True, store_history=False)
+        reply = self.wait_for_reply(msg_id)
+        if reply is None or reply['content']['status'] != 'ok':
+            raise RuntimeError('Error running nbreport code in the kernel')
+
+    def write_checkpoint(self, next_cell):
+        """Save the partially-computed notebook to the checkpoint path.
+
+        Parameters
+        ----------
+        next_cell : int
+            Index of the first cell that isn't computed.
+        """
+        self.nb.metadata['nbreport_checkpoint'] = {'next_cell': next_cell}
+        try:
+            _write_notebook_atomic(self.nb, self.checkpoint_path)
+        finally:
+            del self.nb.metadata['nbreport_checkpoint']
+        self._cells_since_checkpoint = 0
+        self._last_checkpoint_time = time.monotonic()
+        self.log.debug('Checkpointed notebook at cell %d', next_cell)
+
+
+def _timestamp():
+    """Current time as an ISO 8601 string, in the format used by Jupyter.
+    """
+    return datetime.datetime.now(datetime.timezone.utc).isoformat() \
+        .replace('+00:00', 'Z')
+
+
+def _replay_cell(cell, entry):
+    if entry is None:
+        # Keep the cell's existing outputs
+        return
+    cell.outputs = entry['outputs']
+    cell.execution_count = entry['execution_count']
+
+
+def _write_notebook_atomic(notebook, path):
+    """Write a notebook so that the file at ``path`` is always complete.
+    """
+    path = Path(path)
+    fd, temp_path = create_temp_file(path)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+            nbformat.write(notebook, fp)
+        os.replace(temp_path, str(path))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def _run_preprocessor(preprocessor, notebook, dirname, kernel_pool=None,
+                      fork_server=None):
     logger = logging.getLogger(__name__)
     metadata = {
         'metadata': {
@@ -83,7 +939,21 @@ def _run_preprocessor(preprocessor, notebook, dirname):
         }
     }
     try:
-        preprocessor.preprocess(notebook, metadata)
+        if kernel_pool is not None:
+            with kernel_pool.kernel(preprocessor.kernel_name,
+                                    cwd=dirname) as km:
+                _preprocess_with_kernel(preprocessor, notebook, metadata, km)
+        elif fork_server is not None:
+            # The preprocessor starts the kernel, but doesn't shut it down
+            # since it doesn't own the kernel manager.
+            km = fork_server.kernel_manager(preprocessor.kernel_name)
+            try:
+                _preprocess_with_kernel(preprocessor, notebook, metadata, km)
+            finally:
+                if km.has_kernel:
+                    km.shutdown_kernel(now=True)
+        else:
+            preprocessor.preprocess(notebook, metadata)
 
     except CellExecutionError:
         uid = uuid.uuid4()
@@ -98,3 +968,14 @@ def _run_preprocessor(preprocessor, notebook, dirname):
         raise
 
     return notebook
+
+
+def _preprocess_with_kernel(preprocessor, notebook, metadata, km):
+    try:
+        preprocessor.preprocess(notebook, metadata, km=km)
+    finally:
+        # The preprocessor doesn't clean up its client when it doesn't own
+        # the kernel.
+        if preprocessor.kc is not None:
+            preprocessor.kc.stop_channels()
+            preprocessor.kc = None
@@ -0,0 +1,83 @@
+"""Streaming compression of request bodies for HTTP ``Content-Encoding``.
+
+The ``zstd`` encoding requires the optional ``zstandard`` package, which is
+installed with ``pip install nbreport[zstd]``.
+"""
+
+__all__ = ('CONTENT_ENCODINGS', 'iter_encoded')
+
+import zlib
+
+CONTENT_ENCODINGS = ('identity', 'gzip', 'zstd')
+"""Names of the supported HTTP content encodings.
+
+``identity``
+    No compression.
+``gzip``
+    gzip compression, from the standard library.
+``zstd``
+    Zstandard compression, which is faster than gzip for a similar ratio.
+    Requires the ``zstandard`` package.
+"""
+
+
+def iter_encoded(fp, content_encoding='identity', chunk_size=2 ** 20):
+    """Read a file in chunks, compressing each chunk as it's read.
+
+    Parameters
+    ----------
+    fp : file object
+        Binary file object to read.
+    content_encoding : `str`, optional
+        Name of the content encoding (see `CONTENT_ENCODINGS`).
+    chunk_size : `int`, optional
+        Number of bytes read from ``fp`` at a time.
+
+    Yields
+    ------
+    chunk : `bytes`
+        The next chunk of the encoded content. Only about one chunk of the
+        file is held in memory at a time, so the generator can be passed as
+        the ``data`` of a `requests` request to stream a large file.
+
+    Raises
+    ------
+    ValueError
+        Raised if the content encoding is unknown.
+    ImportError
+        Raised if the ``zstd`` encoding is used, but the ``zstandard``
+        package isn't installed.
+    """
+    compressor = _get_compressor(content_encoding)
+    for chunk in iter(lambda: fp.read(chunk_size), b''):
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    if compressor is not None:
+        chunk = compressor.flush()
+        if chunk:
+            yield chunk
+
+
+def _get_compressor(content_encoding):
+    """Get a compression object, with ``compress`` and ``flush`` methods, for
+    a content encoding, or `None` for the ``identity`` encoding.
+    """
+    if content_encoding == 'identity':
+        return None
+    elif content_encoding == 'gzip':
+        # A gzip header and trailer, rather than a raw zlib stream
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif content_encoding == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                'The zstd content encoding requires zstandard. Install it '
+                'with "pip install nbreport[zstd]".')
+        return zstandard.ZstdCompressor().compressobj()
+    else:
+        raise ValueError(
+            'Unknown content encoding {0!r}. Use one of: {1}.'.format(
+                content_encoding, ', '.join(CONTENT_ENCODINGS)))
@@ -0,0 +1,551 @@
+"""A fork server that starts IPython kernels by forking a template process.
+
+Starting a kernel normally means starting a new Python interpreter, importing
+ipykernel, and then importing whatever the notebook needs. The fork server
+does that work once, in a long-lived template process, and then forks a new
+kernel process from the template for each notebook. The forked kernel
+inherits the template's imported modules, so it is ready in milliseconds.
+
+The fork server relies on ``os.fork``, so it is only available on POSIX
+platforms (Linux and macOS).
+
+The template process can also execute code, with `ForkServer.execute`,
+before it forks kernels. Kernels forked afterwards start with the
+namespace that code created. `nbreport.compute.compute_notebook_sweep` uses
+this to execute the setup cells that a sweep's notebooks share only once.
+"""
+
+__all__ = ('ForkServer', 'ForkServerProvisioner')
+
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from jupyter_client.manager import KernelManager
+from jupyter_client.provisioning import LocalProvisioner
+import nbformat
+from traitlets import Instance
+
+
+class ForkServer:
+    """A template process, with ipykernel and other modules already imported,
+    that forks new IPython kernels.
+
+    Parameters
+    ----------
+    preload : sequence of `str`, optional
+        Names of modules that the template process imports before it forks
+        any kernels. Every forked kernel starts with these modules already
+        in ``sys.modules``. Usually these are the expensive imports of the
+        report's notebook (``numpy``, ``pandas``, ``astropy``) and are
+        declared by the ``preload`` field of the report's ``nbreport.yaml``
+        file.
+
+    Notes
+    -----
+    The template process is started with the first kernel. Use the fork
+    server as a context manager, or call `ForkServer.shutdown`, to stop the
+    template process once computations are done. Forked kernels exit when
+    the template process stops, so they are never left behind, even if
+    nbreport itself crashes.
+
+    Forked kernels always run in nbreport's own Python environment, whatever
+    the ``argv`` of their kernel spec, so only Python kernels are supported.
+
+    Modules that start threads or open network connections when they're
+    imported may not work correctly in forked kernels, and should not be
+    preloaded.
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, preload=None):
+        super().__init__()
+        if not hasattr(os, 'fork'):
+            raise RuntimeError('The fork server requires os.fork, which is '
+                               'not available on this platform.')
+        self._preload = list(preload) if preload else []
+        self._process = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def __repr__(self):
+        return '{0}(preload={1!r})'.format(self.__class__.__name__,
+                                           self._preload)
+
+    @property
+    def preload(self):
+        """Names of the modules imported by the template process
+        (`list` of `str`).
+        """
+        return list(self._preload)
+
+    @property
+    def is_running(self):
+        """`True` if the template process is running (`bool`).
+        """
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """Start the template process, if it isn't running already.
+
+        Raises
+        ------
+        RuntimeError
+            Raised if the template process fails to start, for example
+            because a preloaded module can't be imported.
+        """
+        with self._lock:
+            self._start()
+
+    def fork(self, argv, cwd=None, env=None):
+        """Fork a new kernel from the template process.
+
+        Parameters
+        ----------
+        argv : sequence of `str`
+            Command-line arguments for the kernel's
+            ``ipykernel.kernelapp.IPKernelApp``, including the ``-f`` argument
+            with the path of the connection file.
+        cwd : `pathlib.Path` or `str`, optional
+            Working directory of the kernel.
+        env : `dict`, optional
+            Environment variables of the kernel. By default, the kernel
+            inherits the template process's environment.
+
+        Returns
+        -------
+        pid : int
+            Process ID of the kernel. The kernel is the leader of a new
+            process group, whose ID is also ``pid``.
+        """
+        reply = self._request({
+            'op': 'fork',
+            'argv': [str(arg) for arg in argv],
+            'cwd': str(cwd) if cwd is not None else None,
+            'env': dict(env) if env is not None else None
+        })
+        if 'error' in reply:
+            raise RuntimeError(
+                'Fork server could not start a kernel: {0}'.format(
+                    reply['error']))
+        self._logger.debug('Forked kernel %d', reply['pid'])
+        return reply['pid']
+
+    def execute(self, source, cwd=None):
+        """Execute the source of a code cell in the template process.
+
+        Kernels forked after this inherit the variables, imports, and other
+        state that the code created, and continue its execution count.
+
+        Parameters
+        ----------
+        source : `str`
+            Source of the code cell. IPython syntax, such as magics, is
+            supported.
+        cwd : `pathlib.Path` or `str`, optional
+            Working directory for executing the code. The template process
+            stays in this directory afterwards.
+
+        Returns
+        -------
+        outputs : `list` of `nbformat.NotebookNode`
+            Outputs of the cell. Printed text is collected per stream, so it
+            isn't interleaved with the cell's displays as it would be in a
+            kernel.
+        execution_count : int
+            Execution count of the cell.
+
+        Raises
+        ------
+        RuntimeError
+            Raised if the code raises an exception.
+        """
+        reply = self._request({
+            'op': 'execute',
+            'source': source,
+            'cwd': str(cwd) if cwd is not None else None
+        })
+        if 'error' in reply:
+            raise RuntimeError(
+                'Error executing code in the fork server: {0}'.format(
+                    reply['error']))
+        outputs = [nbformat.from_dict(output) for output in reply['outputs']]
+        return outputs, reply['execution_count']
+
+    def kernel_manager(self, kernel_name=''):
+        """Create a kernel manager whose kernels are forked by this fork
+        server.
+
+        Parameters
+        ----------
+        kernel_name : `str`, optional
+            Name of the Jupyter kernel. An empty string designates the
+            default Python kernel. The kernel spec must be for a Python
+            kernel.
+
+        Returns
+        -------
+        km : `jupyter_client.manager.KernelManager`
+            A kernel manager, with a `ForkServerProvisioner`. The kernel
+            isn't started yet.
+        """
+        if kernel_name:
+            km = KernelManager(kernel_name=kernel_name)
+        else:
+            km = KernelManager()
+        if km.kernel_spec.language.lower() != 'python':
+            raise ValueError(
+                'The fork server only supports Python kernels, not '
+                '{!r}'.format(kernel_name))
+        km.kernel_id = str(uuid.uuid4())
+        km.provisioner = ForkServerProvisioner(
+            kernel_id=km.kernel_id,
+            kernel_spec=km.kernel_spec,
+            fork_server=self,
+            parent=km)
+        return km
+
+    def shutdown(self, timeout=5.):
+        """Stop the template process.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Time, in seconds, to wait for the template process to exit before
+            it is killed.
+        """
+        with self._lock:
+            process = self._process
+            self._process = None
+        if process is None:
+            return
+        # The template process exits when its input is closed
+        process.stdin.close()
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+    def _request(self, request):
+        with self._lock:
+            self._start()
+            self._process.stdin.write(
+                json.dumps(request).encode('utf-8') + b'\n')
+            self._process.stdin.flush()
+            return self._read_reply()
+
+    def _start(self):
+        if self.is_running:
+            return
+        start_time = time.perf_counter()
+        # Make sure the template can import nbreport, even if it isn't
+        # installed, or is installed elsewhere
+        env = os.environ.copy()
+        package_dir = os.path.dirname(os.path.dirname(__file__))
+        env['PYTHONPATH'] = os.pathsep.join(
+            [package_dir] + [path for path
+                             in env.get('PYTHONPATH', '').split(os.pathsep)
+                             if path])
+        self._process = subprocess.Popen(
+            [sys.executable, '-m', __name__] + self._preload,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env)
+        reply = self._read_reply()
+        if 'error' in reply:
+            self._process.wait()
+            self._process = None
+            raise RuntimeError(
+                'Fork server failed to start: {0}'.format(reply['error']))
+        self._logger.debug('Started fork server (pid %d) in %.2f s',
+                           self._process.pid,
+                           time.perf_counter() - start_time)
+
+    def _read_reply(self):
+        line = self._process.stdout.readline()
+        if not line:
+            self._process.wait()
+            self._process = None
+            return {'error': 'the template process exited unexpectedly'}
+        return json.loads(line.decode('utf-8'))
+
+
+class ForkServerProvisioner(LocalProvisioner):
+    """Kernel provisioner that launches kernels with a `ForkServer`.
+
+    `ForkServer.kernel_manager` creates kernel managers with this
+    provisioner. Apart from launching, the kernel is managed like one
+    launched by jupyter_client's default ``LocalProvisioner``, through its
+    process ID and process group.
+    """
+
+    fork_server = Instance(ForkServer)
+
+    async def launch_kernel(self, cmd, **kwargs):
+        pid = self.fork_server.fork(
+            _get_kernel_argv(cmd, self.parent),
+            cwd=kwargs.get('cwd'),
+            env=kwargs.get('env'))
+        self.process = _ForkedProcess(pid)
+        self.pid = pid
+        self.pgid = pid
+        self.cwd = kwargs.get('cwd', os.getcwd())
+        return self.connection_info
+
+
+class _ForkedProcess:
+    """Stand-in for a `subprocess.Popen` object, for a kernel process that is
+    a child of the fork server's template process rather than of this
+    process.
+
+    The template process reaps its children, so the exit status of the
+    kernel isn't available; `returncode` is ``0`` once the kernel exited.
+    """
+
+    stdin = None
+    stdout = None
+    stderr = None
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, 0)
+            except ProcessLookupError:
+                self.returncode = 0
+            except PermissionError:
+                # The process exists, but belongs to another user
+                pass
+        return self.returncode
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() > deadline:
+                raise subprocess.TimeoutExpired(str(self.pid), timeout)
+            time.sleep(0.01)
+        return self.returncode
+
+    def send_signal(self, signum):
+        if self.poll() is None:
+            os.kill(self.pid, signum)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+def _get_kernel_argv(cmd, km):
+    """Get the IPKernelApp arguments from a kernel launch command.
+    """
+    cmd = list(cmd)
+    if '-f' in cmd:
+        return cmd[cmd.index('-f'):]
+    return ['-f', km.connection_file]
+
+
+def _serve(preload):
+    """Run the template process.
+
+    Requests (JSON objects) are read from standard input, one per line, and
+    a JSON reply is written to standard output for each:
+
+    - ``fork`` requests (with ``argv``, ``cwd`` and ``env`` keys) fork a
+      kernel. The reply is ``{"pid": pid}``.
+    - ``execute`` requests (with ``source`` and ``cwd`` keys) execute code in
+      the namespace that forked kernels start with. The reply has
+      ``outputs`` and ``execution_count`` keys.
+
+    The template process exits when standard input is closed.
+    """
+    # Keep the original standard output for replies; the template's (and
+    # kernels') other output goes to standard error.
+    reply_fp = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+
+    # Like ipykernel_launcher, don't leave the template's working directory
+    # on the path; IPython adds the kernel's working directory instead.
+    if sys.path and sys.path[0] in ('', os.getcwd()):
+        del sys.path[0]
+
+    try:
+        import ipykernel.kernelapp  # noqa: F401
+        for name in preload:
+            __import__(name)
+    except Exception as e:
+        _write_reply(reply_fp, {'error': '{0}: {1}'.format(
+            type(e).__name__, e)})
+        return
+    # Kernels are reaped automatically, so they don't become zombies
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    _write_reply(reply_fp, {'ready': True})
+
+    # IPython shell for execute requests, created with the first one
+    shell = None
+
+    for line in sys.stdin.buffer:
+        request = json.loads(line.decode('utf-8'))
+        if request['op'] == 'execute':
+            if shell is None:
+                shell = _create_shell()
+            _write_reply(reply_fp, _execute(shell, request))
+            continue
+
+        try:
+            pid = os.fork()
+        except OSError as e:
+            _write_reply(reply_fp, {'error': str(e)})
+            continue
+        if pid == 0:
+            reply_fp.close()
+            _run_kernel(request, shell)
+        _write_reply(reply_fp, {'pid': pid})
+
+
+def _create_shell():
+    """Create the template process's IPython shell, which collects the
+    results of cells rather than printing them.
+    """
+    from IPython.core.displayhook import DisplayHook
+    from IPython.core.interactiveshell import InteractiveShell
+    from traitlets.config import Config
+
+    class CollectingDisplayHook(DisplayHook):
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.results = []
+
+        def start_displayhook(self):
+            pass
+
+        def write_output_prompt(self):
+            pass
+
+        def write_format_data(self, format_dict, md_dict=None):
+            self.results.append((format_dict, md_dict or {}))
+
+        def finish_displayhook(self):
+            pass
+
+    config = Config()
+    config.HistoryManager.enabled = False
+    shell = InteractiveShell.instance(
+        config=config, displayhook_class=CollectingDisplayHook, user_ns={},
+        colors='NoColor')
+    # Like a kernel, import modules from the working directory
+    if '' not in sys.path:
+        sys.path.insert(0, '')
+    return shell
+
+
+def _execute(shell, request):
+    """Execute code in the template process's shell.
+    """
+    from IPython.utils.capture import capture_output
+    from jupyter_client.jsonutil import json_default
+
+    if request['cwd'] is not None:
+        os.chdir(request['cwd'])
+    shell.displayhook.results = []
+    with capture_output() as captured:
+        result = shell.run_cell(request['source'], store_history=True)
+
+    outputs = []
+    for name in ('stdout', 'stderr'):
+        text = getattr(captured, name)
+        if text:
+            outputs.append({'output_type': 'stream', 'name': name,
+                            'text': text})
+    for output in captured.outputs:
+        outputs.append({'output_type': 'display_data', 'data': output.data,
+                        'metadata': output.metadata})
+    for data, metadata in shell.displayhook.results:
+        outputs.append({'output_type': 'execute_result', 'data': data,
+                        'metadata': metadata,
+                        'execution_count': result.execution_count})
+    # Round-trip through JSON to encode binary data such as images
+    reply = json.loads(json.dumps({
+        'outputs': outputs,
+        'execution_count': result.execution_count
+    }, default=json_default))
+
+    error = result.error_before_exec or result.error_in_exec
+    if error is not None:
+        reply['error'] = '{0}: {1}'.format(type(error).__name__, error)
+    return reply
+
+
+def _run_kernel(request, shell=None):
+    """Run a kernel in a forked child of the template process.
+
+    If the template process executed code with a ``shell``, the kernel
+    starts with the shell's namespace and execution count.
+    """
+    status = 1
+    try:
+        os.setsid()
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.close(devnull)
+
+        if request['env'] is not None:
+            os.environ.clear()
+            os.environ.update(request['env'])
+        if request['cwd'] is not None:
+            os.chdir(request['cwd'])
+
+        from ipykernel.kernelapp import IPKernelApp
+        if shell is None:
+            app = IPKernelApp.instance()
+        else:
+            # Make way for the kernel's own shell
+            shell.clear_instance()
+            app = IPKernelApp.instance(user_ns=shell.user_ns)
+        # Exit if the template process exits. This is set from the
+        # JPY_PARENT_PID environment variable when ipykernel is imported,
+        # which is before the fork.
+        app.initialize(
+            request['argv']
+            + ['--IPKernelApp.parent_handle={0:d}'.format(os.getppid())])
+        if shell is not None:
+            app.shell.execution_count = shell.execution_count
+        app.start()
+        status = 0
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        # Never return to the template's request loop
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)
+
+
+def _write_reply(fp, reply):
+    fp.write(json.dumps(reply) + '\n')
+    fp.flush()
+
+
+if __name__ == '__main__':
+    _serve(sys.argv[1:])
@@ -0,0 +1,61 @@
+"""Filesystem helpers for writing files atomically.
+"""
+
+__all__ = ('create_temp_file',)
+
+import os
+from pathlib import Path
+import secrets
+import stat
+
+
+def create_temp_file(path, suffix='.tmp'):
+    """Create a temporary file that will atomically replace a file, with
+    the file's permissions.
+
+    Parameters
+    ----------
+    path : `pathlib.Path` or `str`
+        Path of the file that the temporary file will replace (with
+        `os.replace`). The temporary file is created in the same directory.
+    suffix : `str`, optional
+        Suffix of the temporary file's name.
+
+    Returns
+    -------
+    fd : `int`
+        File descriptor of the temporary file, open for writing.
+    temp_path : `str`
+        Path of the temporary file.
+
+    Notes
+    -----
+    Unlike `tempfile.mkstemp`, which creates files that only their owner
+    can read, the temporary file has the permissions of the file at
+    ``path``, or, if there isn't one, the default permissions of a new file
+    (given the process's umask). Replacing a file therefore keeps its
+    permissions.
+    """
+    path = Path(path)
+    while True:
+        temp_path = str(path.parent / '.{0}.{1}{2}'.format(
+            path.name, secrets.token_hex(4), suffix))
+        try:
+            # The umask applies to the mode of new files
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                         0o666)
+        except FileExistsError:
+            continue
+        break
+    try:
+        mode = stat.S_IMODE(os.stat(str(path)).st_mode)
+    except FileNotFoundError:
+        pass
+    else:
+        try:
+            os.fchmod(fd, mode)
+        except BaseException:
+            os.close(fd)
+            os.unlink(temp_path)
+            raise
+    return fd, temp_path
@@ -3,16 +3,24 @@
 
 __all__ = ('ReportInstance',)
 
+import hashlib
+import json
 import logging
+import os
 from pathlib import Path
 import shutil
+import stat
 from urllib.parse import urljoin
 
 import nbformat
-import requests
 
+from .encoding import iter_encoded
+from .fsutils import create_temp_file
 from .repo import ReportConfig
-from .templating import render_notebook, load_template_environment
+from .session import get_session
+from .staging import AssetStager
+from .templating import (render_notebook, render_many,
+                         load_template_environment, load_template_context)
 
 
 class ReportInstance:
@@ -37,6 +45,10 @@ class ReportInstance:
             raise OSError(
                 'Report instance not found at {}'.format(self._dirname))
 
+        # Cached configuration, and paths derived from it (see reload)
+        self._config = None
+        self._ipynb_path = None
+
     @property
     def dirname(self):
         """Directory path of the report instance (`pathlib.Path`).
@@ -59,14 +71,34 @@ class ReportInstance:
     @property
     def ipynb_path(self):
         """Path to notebook file (`pathlib.Path`).
+
+        The path is cached; see `ReportInstance.reload`.
         """
-        return self.dirname / self.config['ipynb']
+        if self._ipynb_path is None:
+            self._ipynb_path = self.dirname / self.config['ipynb']
+        return self._ipynb_path
 
     @property
     def config(self):
         """Report instance configuration (``ReportConfig``).
+
+        The same `~nbreport.repo.ReportConfig`, which holds the parsed
+        ``nbreport.yaml`` file in memory, is returned every time; see
+        `ReportInstance.reload`.
+        """
+        if self._config is None:
+            self._config = ReportConfig(self.config_path)
+        return self._config
+
+    def reload(self):
+        """Discard the cached configuration and the notebook path derived
+        from it (`ReportInstance.ipynb_path`).
+
+        Call this method after changing the ``ipynb`` key of the
+        ``nbreport.yaml`` file, so that the next access reads it again.
         """
-        return ReportConfig(self.config_path)
+        self._config = None
+        self._ipynb_path = None
 
     def open_notebook(self):
         """Open the instance's notebook file.
@@ -84,7 +116,9 @@ class ReportInstance:
     @classmethod
     def from_report_repo(self, report_repo, instance_dirname, instance_id,
                          context=None, overwrite=False,
-                         published_instance_url=None, ltd_edition_url=None):
+                         published_instance_url=None, ltd_edition_url=None,
+                         template_cache=None, asset_staging=None,
+                         sync=False):
         """Create a new instance of a report from a report repository.
 
         This creates the instance directory on the filesystem and renders
@@ -113,32 +147,91 @@ class ReportInstance:
             URL where the instance is published on LSST the Docs.
         ltd_edition_url : `str`, optional
             URL of the instance's edition resource in the LSST the Docs API.
+        template_cache : `nbreport.templating.TemplateCache`, optional
+            Cache of compiled notebook templates. See `ReportInstance.render`.
+        asset_staging : `str`, optional
+            Strategy for staging asset files into the instance (see
+            `nbreport.staging.STAGING_STRATEGIES`). By default, the
+            ``asset_staging`` field of the repository's ``nbreport.yaml`` is
+            used, or ``'copy'`` if it isn't set. The notebook, context, and
+            configuration files are always copied.
+        sync : `bool`, optional
+            If `True`, and ``overwrite`` is `True`, an existing instance
+            directory is updated in place, instead of being deleted and
+            created again. See Notes.
 
         Returns
         -------
         `ReportInstance`
             New instance of a report.
+
+        Notes
+        -----
+        With ``sync``, the instance records the state of its files in
+        ``.nbreport/sync.json``. When the instance is synced again:
+
+        - Asset files whose content (in the repository's
+          `~nbreport.repo.ReportRepo.asset_manifest`) and size and
+          modification time (in the instance) are unchanged are kept. Other
+          assets are staged again, and assets that were removed from the
+          repository are deleted from the instance.
+        - The notebook, context, and configuration files, including any
+          computed outputs in the notebook, are kept if the repository's
+          files, the template context, and the instance metadata are
+          unchanged. Otherwise, or if ``context`` is `None`, they're copied
+          (and the notebook is rendered again).
+        - Other files in the instance, such as files written by the
+          notebook, are kept.
         """
         if not isinstance(instance_dirname, Path):
             instance_dirname = Path(instance_dirname)
 
-        if instance_dirname.exists():
+        sync = sync and (overwrite or not instance_dirname.exists())
+        if instance_dirname.exists() and not sync:
             if overwrite:
                 shutil.rmtree(instance_dirname)
             else:
                 raise OSError(
                     'Directory already exists: {}'.format(instance_dirname))
 
-        instance_dirname.mkdir()
+        if asset_staging is None:
+            asset_staging = report_repo.config['asset_staging'] \
+                if 'asset_staging' in report_repo.config else 'copy'
+        stager = AssetStager(asset_staging)
+
+        instance_dirname.mkdir(exist_ok=sync)
 
-        # Copy files into the instance
         repo_paths = [
             report_repo.context_path,
             report_repo.ipynb_path,
             report_repo.config_path
         ]
-        repo_paths.extend(report_repo.asset_paths)
+
+        keep_notebook = False
+        if sync:
+            sync_state_path = instance_dirname / '.nbreport' / 'sync.json'
+            sync_state = _read_sync_state(sync_state_path)
+            # An unrendered notebook is rendered later by the caller, so
+            # it's always replaced
+            notebook_key = None
+            if context is not None:
+                notebook_key = _compute_notebook_key(
+                    repo_paths, context,
+                    [instance_id, published_instance_url, ltd_edition_url])
+            keep_notebook = (
+                notebook_key is not None
+                and sync_state['notebook'] == notebook_key
+                and all((instance_dirname
+                         / source_path.relative_to(report_repo.dirname))
+                        .exists()
+                        for source_path in repo_paths
+                        if source_path.exists()))
+
+        # Copy files into the instance. These are modified in place, so
+        # they're always copied (unless a synced instance is up to date).
         for source_path in repo_paths:
+            if keep_notebook:
+                continue
             if not source_path.exists():
                 self._logger.warning(
                     'Configured asset %s does not exist (skipping)',
@@ -149,20 +242,105 @@ class ReportInstance:
             if not dest_path.parent.is_dir():
                 dest_path.parent.mkdir(parents=True)
             shutil.copy(source_path, dest_path)
+            # Files from read-only snapshots are modified in the instance
+            dest_mode = dest_path.stat().st_mode
+            if not dest_mode & stat.S_IWUSR:
+                dest_path.chmod(stat.S_IMODE(dest_mode) | stat.S_IWUSR)
+
+        if sync:
+            sync_state['assets'] = self._sync_assets(
+                report_repo, instance_dirname, stager, repo_paths,
+                sync_state['assets'])
+            # Rendering invalidates the notebook until it's recorded below
+            sync_state['notebook'] = notebook_key if keep_notebook else None
+            _write_sync_state(sync_state, sync_state_path)
+        else:
+            # Stage the assets. Blobs are keyed by the hashes in the
+            # repository's manifest, so unchanged assets aren't read again.
+            hashes = None
+            if stager.strategy == 'blob':
+                hashes = {report_repo.dirname / entry.path: entry.sha256
+                          for entry in report_repo.asset_manifest}
+            stager.stage(
+                ((source_path,
+                  instance_dirname
+                  / source_path.relative_to(report_repo.dirname))
+                 for source_path in report_repo.asset_paths
+                 if source_path not in repo_paths),
+                hashes=hashes)
 
         instance = ReportInstance(instance_dirname)
-        instance.config['instance_id'] = instance_id
-        instance.config['instance_handle'] = '{handle}-{instance_id}'.format(
-            **instance.config)
-        instance.config['published_instance_url'] = published_instance_url
-        instance.config['ltd_edition_url'] = ltd_edition_url
-
-        if context is not None:
-            instance.render(context=context)
+        config = instance.config
+        with config.transaction():
+            config['instance_id'] = instance_id
+            config['instance_handle'] = '{0}-{1}'.format(config['handle'],
+                                                         instance_id)
+            config['published_instance_url'] = published_instance_url
+            config['ltd_edition_url'] = ltd_edition_url
+            if report_repo.git_commit is not None:
+                config['git_commit'] = report_repo.git_commit
+
+        if context is not None and not keep_notebook:
+            instance.render(context=context, template_cache=template_cache)
+
+        if sync and not keep_notebook:
+            sync_state['notebook'] = notebook_key
+            _write_sync_state(sync_state, sync_state_path)
 
         return instance
 
-    def render(self, context=None):
+    @classmethod
+    def _sync_assets(cls, report_repo, instance_dirname, stager, repo_paths,
+                     previous):
+        """Stage the assets that changed since an instance was last synced,
+        and delete the assets that were removed from the repository.
+
+        Returns the new state of the instance's assets: a `dict`, keyed by
+        relative path, of the content's hash and the instance file's size
+        and modification time.
+        """
+        manifest = [entry for entry in report_repo.asset_manifest
+                    if report_repo.dirname / entry.path not in repo_paths]
+
+        files = []
+        unchanged = 0
+        for entry in manifest:
+            dest = instance_dirname / entry.path
+            state = previous.get(entry.path)
+            if state is not None and state['sha256'] == entry.sha256:
+                try:
+                    dest_stat = os.stat(str(dest))
+                except OSError:
+                    pass
+                else:
+                    if state['size'] == dest_stat.st_size \
+                            and state['mtime_ns'] == dest_stat.st_mtime_ns:
+                        unchanged += 1
+                        continue
+            files.append((report_repo.dirname / entry.path, dest))
+        stager.stage(files,
+                     hashes={report_repo.dirname / entry.path: entry.sha256
+                             for entry in manifest})
+
+        current_paths = set(entry.path for entry in manifest)
+        removed = [relpath for relpath in previous
+                   if relpath not in current_paths]
+        for relpath in removed:
+            _remove_file(instance_dirname, relpath)
+
+        cls._logger.info(
+            'Synced assets of %s: %d staged, %d removed, %d unchanged',
+            instance_dirname, len(files), len(removed), unchanged)
+
+        state = {}
+        for entry in manifest:
+            dest_stat = os.stat(str(instance_dirname / entry.path))
+            state[entry.path] = {'sha256': entry.sha256,
+                                 'size': dest_stat.st_size,
+                                 'mtime_ns': dest_stat.st_mtime_ns}
+        return state
+
+    def render(self, context=None, template_cache=None):
         """Render the notebook from the template in the notebook
 
         Parameters
@@ -171,6 +349,9 @@ class ReportInstance:
             Key-value pairs that override the default template context in
             the context file (``cookiecutter.json`,
             `ReportInstance.context_path`).
+        template_cache : `nbreport.templating.TemplateCache`, optional
+            Cache of compiled notebook templates. By default, templates are
+            cached in memory for the lifetime of the process.
 
         Notes
         -----
@@ -178,11 +359,61 @@ class ReportInstance:
         cannot be re-rendered.
         """
         notebook = self.open_notebook()
+        context, jinja_env = load_template_environment(
+            context_path=self.context_path,
+            extra_context=context,
+            system_context=self._get_system_context())
+        notebook = render_notebook(notebook, context, jinja_env,
+                                   template_cache=template_cache)
+        self._write_rendered_notebook(notebook, context)
 
-        # Add some notebook metadata to the template context as "system"
-        # as opposed to the extra_context that comes from cookiecutter.json
+    @classmethod
+    def render_many(cls, instances, contexts=None, template_cache=None):
+        """Render the notebooks of several instances of the same report.
+
+        Parameters
+        ----------
+        instances : sequence of `ReportInstance`
+            Unrendered instances created from the same report repository.
+        contexts : sequence of `dict`, optional
+            For each instance, key-value pairs that override the default
+            template context in the instance's context file. If `None`, every
+            instance is rendered with the default context.
+        template_cache : `nbreport.templating.TemplateCache`, optional
+            Cache of compiled notebook templates. By default, templates are
+            cached in memory for the lifetime of the process.
+
+        Notes
+        -----
+        This is equivalent to calling `ReportInstance.render` for each
+        instance, but the template notebook is only read (from the first
+        instance) and compiled once, with `nbreport.templating.render_many`.
+        """
+        instances = list(instances)
+        if contexts is None:
+            contexts = [None] * len(instances)
+        if len(instances) == 0:
+            return
+
+        full_contexts = [
+            load_template_context(
+                context_path=instance.context_path,
+                extra_context=context,
+                system_context=instance._get_system_context())
+            for instance, context in zip(instances, contexts)]
+        notebooks = render_many(instances[0].open_notebook(), full_contexts,
+                                template_cache=template_cache)
+        for instance, context, notebook in zip(instances, full_contexts,
+                                               notebooks):
+            instance._write_rendered_notebook(notebook, context)
+
+    def _get_system_context(self):
+        """Get notebook metadata for the template context as "system"
+        context, as opposed to the extra_context that comes from
+        cookiecutter.json.
+        """
         system_context = {}
-        config_data = dict(self.config)  # optimization for bulk reading
+        config_data = dict(self.config.items())
         copy_keys = ['handle', 'title', 'git_repo', 'git_repo_subdir',
                      'instance_id', 'instance_handle']
         for key in copy_keys:
@@ -191,27 +422,27 @@ class ReportInstance:
             except KeyError:
                 msg = ('Missing nbreport.yaml config key %r; can\'t add it '
                        'to the template context.')
-                self._logger.warning(msg)
-
-        context, jinja_env = load_template_environment(
-            context_path=self.context_path,
-            extra_context=context,
-            system_context=system_context)
+                self._logger.warning(msg, key)
+        return system_context
 
+    def _write_rendered_notebook(self, notebook, context):
+        """Record the template context in the configuration and notebook
+        metadata, and write the rendered notebook.
+        """
         # Add the cookiecutter context to the config
-        self.config.update({'cookiecutter': context['cookiecutter']})
-
-        notebook = render_notebook(notebook, context, jinja_env)
+        config = self.config
+        config.update({'cookiecutter': context['cookiecutter']})
 
         # Add config to the notebook metadata
         # Need to remove ruamel.yaml's special typing to be JSON-serializable
-        config_dict = dict(self.config)
+        config_dict = dict(config.items())
         config_dict['cookiecutter'] = dict(config_dict['cookiecutter'])
         notebook.metadata.update({'nbreport': config_dict})
 
         nbformat.write(notebook, str(self.ipynb_path))
 
-    def upload(self, *, github_username, github_token, server):
+    def upload(self, *, github_username, github_token, server, session=None,
+               content_encoding='identity'):
         """Upload the notebook to the api.lsst.codes/nbreport service
         for publication.
 
@@ -225,12 +456,27 @@ class ReportInstance:
             this token.
         server : `str`
             URL of the nbreport API server.
+        session : `requests.Session`, optional
+            HTTP session. Share a session (see
+            `nbreport.session.create_session`) between uploads to reuse its
+            connections. Defaults to `nbreport.session.get_session`.
+        content_encoding : `str`, optional
+            Compress the notebook with this HTTP content encoding (see
+            `nbreport.encoding.CONTENT_ENCODINGS`) while it's uploaded. The
+            server must accept the encoding.
 
         Returns
         -------
         queue_url : `str`
             URL to the nbreport API where you can obtain the status of a
             report instance upload and publication.
+
+        Notes
+        -----
+        The notebook is streamed from its file, rather than read into memory,
+        so large notebooks can be uploaded with little memory. Compressed
+        notebooks are sent with chunked transfer encoding, since their size
+        isn't known in advance.
         """
         url = urljoin(
             server,
@@ -242,16 +488,73 @@ class ReportInstance:
             'Content-Type': 'application/x-ipynb+json'
         }
 
+        if session is None:
+            session = get_session()
         with open(self.ipynb_path, 'rb') as fp:
-            nb_data = fp.read()
-
-        response = requests.post(
-            url,
-            headers=headers,
-            data=nb_data,
-            auth=(github_username, github_token)
-        )
+            if content_encoding == 'identity':
+                # Streamed from the file, with its size as Content-Length
+                nb_data = fp
+            else:
+                headers['Content-Encoding'] = content_encoding
+                nb_data = iter_encoded(fp, content_encoding=content_encoding)
+            response = session.post(
+                url,
+                headers=headers,
+                data=nb_data,
+                auth=(github_username, github_token)
+            )
         response.raise_for_status()
 
         data = response.json()
         return data['queue_url']
+
+
+def _compute_notebook_key(paths, context, metadata):
+    """Compute a hash of the files and values that an instance's rendered
+    notebook is created from.
+    """
+    key_hash = hashlib.sha256()
+    for path in paths:
+        try:
+            key_hash.update(path.read_bytes())
+        except FileNotFoundError:
+            pass
+        key_hash.update(b'\0')
+    key_hash.update(json.dumps([context, metadata], sort_keys=True,
+                               default=str).encode('utf-8'))
+    return key_hash.hexdigest()
+
+
+def _read_sync_state(path):
+    try:
+        with open(str(path)) as fp:
+            data = json.load(fp)
+        return {'notebook': data['notebook'], 'assets': dict(data['assets'])}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {'notebook': None, 'assets': {}}
+
+
+def _write_sync_state(state, path):
+    path.parent.mkdir(exist_ok=True)
+    fd, temp_path = create_temp_file(path)
+    with os.fdopen(fd, 'w') as fp:
+        json.dump(state, fp, indent=1, sort_keys=True)
+    os.replace(temp_path, str(path))
+
+
+def _remove_file(root, relpath):
+    """Remove a file from a directory, and its parent directories up to the
+    root if they become empty.
+    """
+    path = root / relpath
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+    for parent in path.parents:
+        if parent == root:
+            break
+        try:
+            parent.rmdir()
+        except OSError:
+            break
@@ -0,0 +1,333 @@
+"""A pool of pre-started Jupyter kernels for computing notebooks.
+"""
+
+__all__ = ('KernelPool',)
+
+from collections import defaultdict, deque
+from contextlib import contextmanager
+import logging
+import threading
+
+from jupyter_client.manager import KernelManager
+
+
+class KernelPool:
+    """A pool of warm (pre-started) Jupyter kernels, keyed by kernel name.
+
+    Parameters
+    ----------
+    size : int, optional
+        Number of idle kernels to keep ready for each kernel name.
+    max_uses : int, optional
+        Number of notebooks a kernel computes before it is shut down and
+        replaced by a fresh kernel. The default, ``1``, gives every notebook
+        a kernel with a pristine namespace. With larger values, the kernel's
+        namespace is reset between notebooks instead.
+    preload : sequence of `str`, optional
+        Names of modules that are imported in each kernel as soon as it
+        starts, so that a compute call doesn't pay for those imports.
+    startup_timeout : int, optional
+        Time, in seconds, to wait for a new kernel to become ready.
+    fork_server : `nbreport.forkserver.ForkServer`, optional
+        If set, new kernels are forked from this fork server's template
+        process instead of being started as new processes.
+
+    Notes
+    -----
+    Kernels in the pool must be IPython (Python language) kernels since the
+    pool runs Python code in a kernel to set its working directory and to
+    reset its namespace between uses.
+
+    Kernels that are recycled by `KernelPool.release` are replaced in a
+    background thread, so that the replacement kernel starts while the next
+    notebook is prepared instead of delaying the caller. `KernelPool.acquire`
+    waits for a kernel that is being started rather than starting another
+    one.
+
+    Use the pool as a context manager, or call `KernelPool.shutdown`, to
+    stop all of the pool's kernels once computations are done.
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, size=1, max_uses=1, preload=None, startup_timeout=60,
+                 fork_server=None):
+        super().__init__()
+        if size < 0:
+            raise ValueError('Kernel pool size must be >= 0')
+        if max_uses < 1:
+            raise ValueError('Kernel max_uses must be >= 1')
+        self._size = size
+        self._max_uses = max_uses
+        self._preload = list(preload) if preload else []
+        self._startup_timeout = startup_timeout
+        self._fork_server = fork_server
+
+        self._lock = threading.Lock()
+        # Notified when a kernel is added to the pool, or fails to start
+        self._kernel_ready = threading.Condition(self._lock)
+        self._idle = defaultdict(deque)
+        # Number of kernels being started for the pool, by kernel name
+        self._starting = defaultdict(int)
+        self._refill_threads = []
+        self._closed = False
+        self._uses = {}
+        self._kernel_names = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def __repr__(self):
+        return '{0}(size={1:d}, max_uses={2:d})'.format(
+            self.__class__.__name__, self._size, self._max_uses)
+
+    @property
+    def size(self):
+        """Number of idle kernels kept ready for each kernel name (`int`).
+        """
+        return self._size
+
+    @property
+    def max_uses(self):
+        """Number of notebooks a kernel computes before it is recycled
+        (`int`).
+        """
+        return self._max_uses
+
+    def warm(self, kernel_name=''):
+        """Start kernels until the pool holds ``size`` idle kernels for a
+        kernel name.
+
+        Parameters
+        ----------
+        kernel_name : `str`, optional
+            Name of the Jupyter kernel. An empty string designates the
+            default Python kernel.
+
+        Notes
+        -----
+        Kernels that are already being started in the background count
+        towards ``size``, so this method may return before they're ready.
+        """
+        while True:
+            with self._lock:
+                if self._closed or len(self._idle[kernel_name]) \
+                        + self._starting[kernel_name] >= self._size:
+                    return
+                self._starting[kernel_name] += 1
+            km = None
+            try:
+                km = self._start_kernel(kernel_name)
+            finally:
+                with self._lock:
+                    self._starting[kernel_name] -= 1
+                    closed = self._closed
+                    if km is not None and not closed:
+                        self._idle[kernel_name].append(km)
+                    self._kernel_ready.notify_all()
+            if closed:
+                if km is not None:
+                    self._discard(km)
+                return
+
+    def acquire(self, kernel_name='', cwd=None):
+        """Take a kernel out of the pool.
+
+        Parameters
+        ----------
+        kernel_name : `str`, optional
+            Name of the Jupyter kernel. An empty string designates the
+            default Python kernel.
+        cwd : `pathlib.Path` or `str`, optional
+            Working directory for the kernel.
+
+        Returns
+        -------
+        km : `jupyter_client.manager.KernelManager`
+            The manager of a running kernel. Return the kernel to the pool
+            with `KernelPool.release` once the computation is done.
+        """
+        with self._lock:
+            # Wait for a kernel that is being started, rather than starting
+            # another one
+            while not self._idle[kernel_name] and self._starting[kernel_name]:
+                self._kernel_ready.wait()
+            try:
+                km = self._idle[kernel_name].popleft()
+            except IndexError:
+                km = None
+
+        if km is None or not km.is_alive():
+            if km is not None:
+                self._discard(km)
+            self._logger.debug('No warm %r kernel available; starting one',
+                               kernel_name)
+            km = self._start_kernel(kernel_name)
+
+        if cwd is not None:
+            _execute(
+                km,
+                'import os as _nbreport_os\n'
+                '_nbreport_os.chdir({0!r})\n'
+                'del _nbreport_os\n'.format(str(cwd)),
+                timeout=self._startup_timeout)
+        return km
+
+    def release(self, km):
+        """Return a kernel, obtained with `KernelPool.acquire`, to the pool.
+
+        The kernel is reset for its next use, or shut down and replaced if
+        it reached ``max_uses`` or is no longer alive. Replacement kernels
+        are started in a background thread.
+
+        Parameters
+        ----------
+        km : `jupyter_client.manager.KernelManager`
+            The kernel's manager.
+        """
+        kernel_name = self._kernel_names[km]
+        self._uses[km] += 1
+
+        if self._uses[km] < self._max_uses and km.is_alive():
+            try:
+                self._reset_kernel(km)
+            except RuntimeError:
+                self._logger.warning('Could not reset kernel; recycling it')
+            else:
+                with self._lock:
+                    self._idle[kernel_name].append(km)
+                return
+
+        self._discard(km)
+        self._refill(kernel_name)
+
+    @contextmanager
+    def kernel(self, kernel_name='', cwd=None):
+        """Borrow a kernel from the pool within a ``with`` block.
+
+        Parameters
+        ----------
+        kernel_name : `str`, optional
+            Name of the Jupyter kernel. An empty string designates the
+            default Python kernel.
+        cwd : `pathlib.Path` or `str`, optional
+            Working directory for the kernel.
+
+        Yields
+        ------
+        km : `jupyter_client.manager.KernelManager`
+            The manager of a running kernel.
+        """
+        km = self.acquire(kernel_name, cwd=cwd)
+        try:
+            yield km
+        finally:
+            self.release(km)
+
+    def shutdown(self):
+        """Shut down all idle kernels in the pool, waiting for kernels that
+        are being started.
+        """
+        with self._lock:
+            self._closed = True
+            threads = list(self._refill_threads)
+            self._refill_threads.clear()
+        for thread in threads:
+            thread.join()
+        with self._lock:
+            kernels = [km for idle in self._idle.values() for km in idle]
+            self._idle.clear()
+        for km in kernels:
+            self._discard(km)
+
+    def _refill(self, kernel_name):
+        """Start kernels for a kernel name in a background thread, up to the
+        pool's size.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._refill_threads = [thread for thread in self._refill_threads
+                                    if thread.is_alive()]
+            thread = threading.Thread(target=self._run_refill,
+                                      args=(kernel_name,), daemon=True,
+                                      name='nbreport-kernel-pool-refill')
+            self._refill_threads.append(thread)
+            # Started under the lock, so shutdown never joins an unstarted
+            # thread
+            thread.start()
+
+    def _run_refill(self, kernel_name):
+        try:
+            self.warm(kernel_name)
+        except Exception as e:
+            # acquire starts a kernel itself if the pool is empty
+            self._logger.warning('Could not start a pooled %r kernel: %s',
+                                 kernel_name, e)
+
+    def _start_kernel(self, kernel_name):
+        if self._fork_server is not None:
+            km = self._fork_server.kernel_manager(kernel_name)
+        elif kernel_name:
+            km = KernelManager(kernel_name=kernel_name)
+        else:
+            km = KernelManager()
+        if km.kernel_spec.language.lower() != 'python':
+            raise ValueError(
+                'KernelPool only supports Python kernels, not {!r}'.format(
+                    kernel_name))
+
+        km.start_kernel()
+        self._kernel_names[km] = kernel_name
+        self._uses[km] = 0
+        try:
+            self._preload_modules(km)
+        except Exception:
+            self._discard(km)
+            raise
+        self._logger.debug('Started pooled %r kernel', kernel_name)
+        return km
+
+    def _preload_modules(self, km):
+        if self._preload:
+            code = '\n'.join('import {0}'.format(name)
+                             for name in self._preload)
+            _execute(km, code, timeout=self._startup_timeout)
+
+    def _reset_kernel(self, km):
+        _execute(
+            km,
+            'get_ipython().reset(new_session=True)\n',
+            timeout=self._startup_timeout)
+        # Re-importing is cheap since the modules are still in sys.modules.
+        self._preload_modules(km)
+
+    def _discard(self, km):
+        self._kernel_names.pop(km, None)
+        self._uses.pop(km, None)
+        try:
+            km.shutdown_kernel(now=True)
+        except RuntimeError:
+            # Kernel was already dead
+            pass
+
+
+def _execute(km, code, timeout=None):
+    """Execute code silently in a kernel and wait for it to finish.
+    """
+    kc = km.client()
+    kc.start_channels()
+    try:
+        kc.wait_for_ready(timeout=timeout)
+        reply = kc.execute_interactive(
+            code, silent=True, store_history=False, timeout=timeout)
+    finally:
+        kc.stop_channels()
+    if reply['content']['status'] != 'ok':
+        raise RuntimeError(
+            'Error running setup code in a pooled kernel: {0}: {1}'.format(
+                reply['content'].get('ename'),
+                reply['content'].get('evalue')))
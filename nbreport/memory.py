@@ -0,0 +1,157 @@
+"""Memory (RSS) sampling of Jupyter kernel processes.
+
+This module requires the optional ``psutil`` package, which is installed
+with ``pip install nbreport[memory]``.
+"""
+
+__all__ = ('KernelMemorySampler',)
+
+import logging
+import signal
+import threading
+
+
+class KernelMemorySampler:
+    """Sample the resident set size (RSS) of a kernel's process tree in a
+    background thread, and enforce a memory ceiling.
+
+    Parameters
+    ----------
+    km : `jupyter_client.manager.KernelManager`
+        Manager of the running kernel.
+    interval : float, optional
+        Time, in seconds, between samples.
+    limit : int, optional
+        Memory ceiling, in bytes, for the kernel's process tree. When the
+        ceiling is exceeded, the kernel is interrupted. If the memory usage
+        stays above the ceiling for ``kill_after`` more samples, the kernel
+        is killed. `None` means there is no ceiling.
+    kill_after : int, optional
+        Number of samples, after interrupting the kernel, to wait before
+        killing it.
+
+    Notes
+    -----
+    Use `KernelMemorySampler.begin_cell` and `KernelMemorySampler.end_cell`
+    around each cell's execution to measure the cell's peak and change in
+    RSS.
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, km, interval=0.1, limit=None, kill_after=20):
+        super().__init__()
+        try:
+            import psutil
+        except ImportError:
+            raise ImportError(
+                'Memory sampling requires psutil. Install it with '
+                '"pip install nbreport[memory]".')
+        self._psutil = psutil
+
+        self._process = psutil.Process(km.provisioner.pid)
+        self._interval = interval
+        self._limit = limit
+        self._kill_after = kill_after
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._start_rss = 0
+        self._peak_rss = 0
+        self._samples_over_limit = 0
+        # True if the ceiling was exceeded during the current cell
+        self.limit_exceeded = False
+
+    def start(self):
+        """Start sampling in a background thread.
+        """
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='nbreport-memory-sampler')
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sample(self):
+        """Measure the current RSS of the kernel's process tree.
+
+        Returns
+        -------
+        rss : int
+            Resident set size, in bytes. Zero if the kernel process has
+            exited.
+        """
+        try:
+            processes = [self._process]
+            processes.extend(self._process.children(recursive=True))
+        except self._psutil.Error:
+            return 0
+        rss = 0
+        for process in processes:
+            try:
+                rss += process.memory_info().rss
+            except self._psutil.Error:
+                # Process exited between listing and measuring
+                pass
+        return rss
+
+    def begin_cell(self):
+        """Reset the peak RSS measurement at the start of a cell.
+        """
+        rss = self.sample()
+        with self._lock:
+            self._start_rss = rss
+            self._peak_rss = rss
+            self._samples_over_limit = 0
+            self.limit_exceeded = False
+
+    def end_cell(self):
+        """Finish measuring a cell.
+
+        Returns
+        -------
+        peak_rss : int
+            Peak RSS, in bytes, while the cell ran.
+        delta_rss : int
+            Change in RSS, in bytes, from the start to the end of the cell.
+        """
+        rss = self.sample()
+        with self._lock:
+            self._peak_rss = max(self._peak_rss, rss)
+            return self._peak_rss, rss - self._start_rss
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            rss = self.sample()
+            with self._lock:
+                self._peak_rss = max(self._peak_rss, rss)
+                if self._limit is None or rss <= self._limit:
+                    continue
+                self._samples_over_limit += 1
+                over_count = self._samples_over_limit
+                self.limit_exceeded = True
+
+            if over_count == 1:
+                self._logger.error(
+                    'Kernel memory (%d bytes) exceeds the limit (%d bytes); '
+                    'interrupting the kernel.', rss, self._limit)
+                self._signal(signal.SIGINT)
+            elif over_count == self._kill_after + 1:
+                self._logger.error(
+                    'Kernel memory (%d bytes) still exceeds the limit after '
+                    'an interrupt; killing the kernel.', rss)
+                self._signal(signal.SIGKILL)
+
+    def _signal(self, signum):
+        # Signal the process directly rather than through the kernel
+        # manager, which isn't safe to use from this thread.
+        try:
+            self._process.send_signal(signum)
+        except self._psutil.Error:
+            pass
@@ -0,0 +1,347 @@
+"""A persistent cache of mirrors of remote report repositories.
+"""
+
+__all__ = ('RepoCache',)
+
+from contextlib import contextmanager
+import hashlib
+import logging
+import os
+from pathlib import Path
+import re
+import shutil
+import time
+from urllib.parse import urlparse
+
+import git
+
+from .clone import get_directory_size
+from .repo import ReportRepo
+from .userconfig import get_cache_dir
+
+
+class RepoCache:
+    """Cache of bare Git mirrors of remote report repositories, with a
+    working tree for each Git ref that reports are created from.
+
+    Parameters
+    ----------
+    directory : `pathlib.Path` or `str`, optional
+        Directory of the cache. Defaults to the ``repos`` subdirectory of
+        `nbreport.userconfig.get_cache_dir`.
+    max_age : `float`, optional
+        Mirrors that haven't been used for this many seconds are evicted
+        (see `RepoCache.evict`).
+    max_size : int, optional
+        Maximum size of the cache, in bytes. When the cache is larger than
+        this, the least-recently used mirrors are evicted.
+    evict_interval : `float`, optional
+        Minimum time between the evictions that `RepoCache.open` runs, in
+        seconds. Evicting measures the size of every mirror, so it's only
+        run this often, rather than whenever a repository is opened.
+
+    Notes
+    -----
+    Each remote URL has a directory in the cache, with a bare mirror of the
+    repository (``mirror.git``), and a working tree of the mirror for each
+    Git ref (``worktrees/{ref}``). The first use of a URL clones the mirror;
+    later uses only fetch new commits.
+
+    Processes that share the cache coordinate through a lock file in each
+    URL's directory. Fetching and updating working trees takes an exclusive
+    lock, while reading a working tree holds a shared lock, so that the
+    working tree isn't updated, or the mirror evicted, while it's in use.
+    Since changing the exclusive lock into a shared one isn't atomic, the
+    working tree is checked again once the shared lock is held, and updated
+    again if another process changed it in between. File locking requires
+    a POSIX system.
+
+    The time of the last eviction is recorded in the ``last-evict`` file of
+    the cache's directory.
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, directory=None, max_age=30 * 24 * 3600.,
+                 max_size=2 ** 32, evict_interval=3600.):
+        super().__init__()
+        if directory is None:
+            directory = get_cache_dir() / 'repos'
+        self._directory = Path(directory)
+        self._max_age = max_age
+        self._max_size = max_size
+        self._evict_interval = evict_interval
+
+    def __repr__(self):
+        return "{0}('{1!s}')".format(self.__class__.__name__,
+                                     self._directory)
+
+    @property
+    def directory(self):
+        """Directory of the cache (`pathlib.Path`).
+        """
+        return self._directory
+
+    def get_mirror_dir(self, url):
+        """Get the cache directory for a remote repository.
+
+        Parameters
+        ----------
+        url : `str`
+            URL of the remote Git repository.
+
+        Returns
+        -------
+        path : `pathlib.Path`
+            Directory of the mirror and its working trees (whether it
+            exists, or not). The name combines the repository's name with a
+            hash of its URL.
+        """
+        name = os.path.splitext(urlparse(url).path.rstrip('/')
+                                .split('/')[-1])[0]
+        name = re.sub(r'[^A-Za-z0-9._-]', '_', name) or 'repo'
+        url_hash = hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
+        return self._directory / '{0}-{1}'.format(name, url_hash)
+
+    @contextmanager
+    def open(self, url, checkout='master', subdir=None):
+        """Open a report repository from the cache, fetching or cloning it
+        as needed.
+
+        This method is a context manager.
+
+        Parameters
+        ----------
+        url : `str`
+            URL of the remote Git repository.
+        checkout : `str`, optional
+            Git ref (branch or tag) to check out.
+        subdir : `str`, optional
+            Directory of the report repository within the Git repository, if
+            it isn't the root.
+
+        Yields
+        ------
+        report_repo : `nbreport.repo.ReportRepo`
+            The report repository, in the ref's working tree. The working
+            tree must not be modified, and is only valid within the
+            context.
+        """
+        mirror_dir = self.get_mirror_dir(url)
+        lock_path = mirror_dir / 'lock'
+        while True:
+            lock_fd = _acquire_lock(lock_path, blocking=True)
+            try:
+                worktree_path, sha = self._update(url, mirror_dir, checkout)
+                # Let other processes read the working tree too. Another
+                # process can take the exclusive lock while it's converted,
+                # so check that the working tree is still the same.
+                _flock(lock_fd, shared=True)
+                if _is_current(lock_fd, lock_path) \
+                        and _get_head(worktree_path) == sha:
+                    break
+            except BaseException:
+                os.close(lock_fd)
+                raise
+            os.close(lock_fd)
+            self._logger.debug('Working tree of %s changed while locking, '
+                               'updating again', url)
+
+        try:
+            if subdir is None:
+                yield ReportRepo(worktree_path, git_commit=sha)
+            else:
+                yield ReportRepo(worktree_path / subdir, git_commit=sha)
+        finally:
+            os.close(lock_fd)
+        self._evict_if_due(keep=mirror_dir)
+
+    def _update(self, url, mirror_dir, checkout):
+        """Clone or fetch the mirror, and check out a ref in its working
+        tree. Requires the exclusive lock.
+
+        Returns the working tree's path and the commit's SHA.
+        """
+        start_time = time.perf_counter()
+        mirror_path = mirror_dir / 'mirror.git'
+        if mirror_path.is_dir():
+            mirror = git.Repo(str(mirror_path))
+            mirror.git.fetch('--prune', 'origin')
+            action = 'Fetched'
+        else:
+            if mirror_path.exists():
+                shutil.rmtree(str(mirror_path))
+            mirror = git.Repo.clone_from(url, str(mirror_path), mirror=True)
+            action = 'Cloned'
+        sha = mirror.git.rev_parse('{0}^{{commit}}'.format(checkout))
+
+        worktree_path = mirror_dir / 'worktrees' / _get_ref_dirname(checkout)
+        if not (worktree_path / '.git').exists():
+            if worktree_path.exists():
+                shutil.rmtree(str(worktree_path))
+            mirror.git.worktree('prune')
+            worktree_path.parent.mkdir(exist_ok=True)
+            mirror.git.worktree('add', '--detach', str(worktree_path), sha)
+        else:
+            worktree = git.Repo(str(worktree_path))
+            if worktree.head.commit.hexsha != sha:
+                worktree.git.checkout('--force', '--detach', sha)
+                worktree.git.clean('-ffd')
+
+        self._logger.info('%s %s into the repository cache and checked out '
+                          '%s (%s) in %.2f s', action, url, checkout, sha[:8],
+                          time.perf_counter() - start_time)
+        return worktree_path, sha
+
+    def evict(self, max_age=None, max_size=None):
+        """Evict mirrors that are old, or that make the cache too large.
+
+        Parameters
+        ----------
+        max_age : `float`, optional
+            Mirrors that haven't been used for this many seconds are
+            evicted. Defaults to the cache's ``max_age``.
+        max_size : int, optional
+            Maximum size of the cache, in bytes. Defaults to the cache's
+            ``max_size``.
+
+        Returns
+        -------
+        evicted : `list` of `pathlib.Path`
+            Directories of the evicted mirrors.
+
+        Notes
+        -----
+        Mirrors that another process is using are never evicted.
+        """
+        if max_age is None:
+            max_age = self._max_age
+        if max_size is None:
+            max_size = self._max_size
+        return self._evict(max_age, max_size)
+
+    def _evict_if_due(self, keep=None):
+        """Evict mirrors if the last eviction was at least
+        ``evict_interval`` seconds ago.
+        """
+        try:
+            last_evicted = os.stat(
+                str(self._directory / 'last-evict')).st_mtime
+        except FileNotFoundError:
+            last_evicted = 0.
+        if time.time() - last_evicted < self._evict_interval:
+            return []
+        return self._evict(self._max_age, self._max_size, keep=keep)
+
+    def _evict(self, max_age, max_size, keep=None):
+        if not self._directory.is_dir():
+            return []
+        (self._directory / 'last-evict').touch()
+
+        # Mirrors with their last use (the lock file's modification time)
+        mirrors = []
+        for entry in os.scandir(str(self._directory)):
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                last_used = os.stat(os.path.join(entry.path, 'lock')).st_mtime
+            except FileNotFoundError:
+                last_used = 0.
+            mirrors.append((last_used, Path(entry.path),
+                            get_directory_size(entry.path)))
+        # Least-recently used first
+        mirrors.sort(key=lambda mirror: mirror[0])
+
+        total_size = sum(size for _, _, size in mirrors)
+        cutoff = time.time() - max_age
+        evicted = []
+        for last_used, mirror_dir, size in mirrors:
+            if mirror_dir == keep \
+                    or (last_used >= cutoff and total_size <= max_size):
+                continue
+            with _lock(mirror_dir / 'lock', blocking=False) as lock_fd:
+                if lock_fd is None:
+                    # In use
+                    continue
+                shutil.rmtree(str(mirror_dir))
+            total_size -= size
+            evicted.append(mirror_dir)
+            self._logger.info('Evicted %s from the repository cache',
+                              mirror_dir)
+        return evicted
+
+
+@contextmanager
+def _lock(path, blocking=True):
+    """Take an exclusive lock on a lock file, creating it if needed, and
+    refresh its modification time.
+
+    Yields the file descriptor, or `None` if ``blocking`` is `False` and
+    another process holds the lock.
+    """
+    fd = _acquire_lock(path, blocking)
+    if fd is None:
+        yield None
+        return
+    try:
+        yield fd
+    finally:
+        os.close(fd)
+
+
+def _acquire_lock(path, blocking):
+    while True:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            is_locked = _flock(fd, blocking=blocking)
+            # The file may have been removed (by evict) while waiting
+            is_current = _is_current(fd, path)
+        except BaseException:
+            os.close(fd)
+            raise
+        if is_locked and is_current:
+            os.utime(fd)
+            return fd
+        os.close(fd)
+        if not is_locked:
+            return None
+
+
+def _is_current(fd, path):
+    """Check that a lock file descriptor is still for the file at a path.
+    """
+    try:
+        return os.path.samestat(os.fstat(fd), os.stat(str(path)))
+    except FileNotFoundError:
+        return False
+
+
+def _get_head(worktree_path):
+    """Get the SHA of the commit checked out in a working tree, or `None` if
+    it can't be read.
+    """
+    try:
+        return git.Repo(str(worktree_path)).head.commit.hexsha
+    except (OSError, ValueError, git.exc.GitError):
+        return None
+
+
+def _flock(fd, shared=False, blocking=True):
+    import fcntl
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+        operation |= fcntl.LOCK_NB
+    try:
+        fcntl.flock(fd, operation)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _get_ref_dirname(ref):
+    """Get a directory name for a Git ref.
+    """
+    name = re.sub(r'[^A-Za-z0-9._-]', '_', ref)
+    ref_hash = hashlib.sha256(ref.encode('utf-8')).hexdigest()[:8]
+    return '{0}-{1}'.format(name, ref_hash)
@@ -1,16 +1,23 @@
 """High-level functions that carry out work for the CLI subcommands.
 """
 
-__all__ = ('is_url', 'create_instance')
+__all__ = ('is_url', 'open_remote_repo', 'create_instance',
+           'create_instances', 'read_parameter_matrix')
 
+from contextlib import contextmanager
+import csv
 import logging
 import pathlib
+from tempfile import TemporaryDirectory
 from urllib.parse import urlparse, urljoin
 
 import click
-import requests
+from ruamel.yaml import YAML
 
+from .clone import resolve_git_ref
 from .instance import ReportInstance
+from .repo import ReportRepo
+from .session import get_session
 
 
 def is_url(path_or_url):
@@ -33,9 +40,69 @@ def is_url(path_or_url):
         return False
 
 
+@contextmanager
+def open_remote_repo(url, checkout='master', subdir=None, strategy='full',
+                     repo_cache=None, snapshot_cache=None):
+    """Open a report repository from a remote Git repository.
+
+    This function is a context manager.
+
+    Parameters
+    ----------
+    url : `str`
+        URL of the remote Git repository.
+    checkout : `str`, optional
+        Git ref (branch or tag) to check out.
+    subdir : `str`, optional
+        Directory of the report repository within the Git repository, if it
+        isn't the root.
+    strategy : `str`, optional
+        Name of the clone strategy (see `nbreport.clone.CLONE_STRATEGIES`).
+        Not used with a ``repo_cache``.
+    repo_cache : `nbreport.mirror.RepoCache`, optional
+        If set, the report repository is opened from this cache of mirrors,
+        which only fetches new commits if the repository was used before.
+        Otherwise, the repository is cloned into a temporary directory.
+    snapshot_cache : `nbreport.snapshot.SnapshotCache`, optional
+        If set, ``checkout`` is resolved to a commit, and the report
+        repository is opened from the commit's snapshot, without cloning or
+        fetching. If the commit doesn't have a snapshot, the repository is
+        cloned (or opened from ``repo_cache``) and a snapshot is added.
+
+    Yields
+    ------
+    report_repo : `nbreport.repo.ReportRepo`
+        The report repository. It's only valid within the context. Its
+        `~nbreport.repo.ReportRepo.git_commit` is the checked-out commit.
+    """
+    if snapshot_cache is not None:
+        git_commit = resolve_git_ref(url, checkout)
+        report_repo = snapshot_cache.get(git_commit, subdir=subdir)
+        if report_repo is None:
+            # Clone the resolved commit, in case the ref moves meanwhile
+            if repo_cache is None:
+                checkout = git_commit
+            with open_remote_repo(url, checkout=checkout, subdir=subdir,
+                                  strategy=strategy,
+                                  repo_cache=repo_cache) as clone:
+                report_repo = snapshot_cache.add(clone, subdir=subdir)
+        yield report_repo
+    elif repo_cache is not None:
+        with repo_cache.open(url, checkout=checkout,
+                             subdir=subdir) as report_repo:
+            yield report_repo
+    else:
+        with TemporaryDirectory() as tempdir:
+            yield ReportRepo.git_clone(url, clone_base_dir=tempdir,
+                                       checkout=checkout, subdir=subdir,
+                                       strategy=strategy)
+
+
 def create_instance(report_repo, instance_id=None, template_variables=None,
                     instance_path=None, overwrite=False,
-                    github_username=None, github_token=None, server=None):
+                    github_username=None, github_token=None, server=None,
+                    template_cache=None, asset_staging=None, sync=False,
+                    session=None):
     """Create a report instance.
 
     Parameters
@@ -65,6 +132,22 @@ def create_instance(report_repo, instance_id=None, template_variables=None,
     server : `str`, optional
         Hostname of the api.lsst.codes, or equivalent, service. Only required
         if ``instance_id`` is None.
+    template_cache : `nbreport.templating.TemplateCache`, optional
+        Cache of compiled notebook templates, used when rendering the
+        instance. Share a cache between instances of the same repository to
+        avoid compiling the same templates again.
+    asset_staging : `str`, optional
+        Strategy for staging asset files into the instance (see
+        `nbreport.staging.STAGING_STRATEGIES`). By default, the repository's
+        ``asset_staging`` configuration is used, or files are copied.
+    sync : `bool`, optional
+        If `True`, and ``overwrite`` is `True`, an existing instance directory
+        is updated in place (see
+        `nbreport.instance.ReportInstance.from_report_repo`).
+    session : `requests.Session`, optional
+        HTTP session for reserving the instance with the server. Share a
+        session (see `nbreport.session.create_session`) between instances to
+        reuse its connections. Defaults to `nbreport.session.get_session`.
 
     Returns
     -------
@@ -77,7 +160,7 @@ def create_instance(report_repo, instance_id=None, template_variables=None,
     if instance_id is None:
         # Register instance with server
         instance_data = _reserve_instance(report_repo, server, github_username,
-                                          github_token)
+                                          github_token, session=session)
         instance_id = instance_data.pop('instance_id')
     else:
         instance_data = {}
@@ -90,13 +173,115 @@ def create_instance(report_repo, instance_id=None, template_variables=None,
 
     instance = ReportInstance.from_report_repo(
         report_repo, instance_path, instance_id, overwrite=overwrite,
-        context=template_variables, **instance_data)
+        context=template_variables, template_cache=template_cache,
+        asset_staging=asset_staging, sync=sync, **instance_data)
     logger.debug('Created instance %s at %s', instance, instance_path)
 
     return instance
 
 
-def _reserve_instance(report_repo, server, github_username, github_token):
+def create_instances(report_repo, matrix, instance_id=None,
+                     template_variables=None, **create_instance_args):
+    """Create a report instance for each row of a parameter matrix.
+
+    Parameters
+    ----------
+    report_repo : `nbreport.repo.ReportRepo`
+        Report repository.
+    matrix : sequence of `dict`
+        Template variables for each instance, such as from
+        `read_parameter_matrix`.
+    instance_id : `str`, optional
+        Base identifier of the instances. Each instance's identifier is
+        ``{instance_id}-{row}``, where ``row`` is the row number, starting
+        from 1. Leave as `None` to reserve a new instance for each row with
+        the server.
+    template_variables : `dict`, optional
+        Template variables shared by all instances. Values from each row of
+        the ``matrix`` override these.
+    **create_instance_args
+        Other keyword arguments passed to `create_instance`. The
+        ``instance_path`` argument isn't supported since each instance gets
+        its own, default, path.
+
+    Returns
+    -------
+    instances : `list` of `nbreport.instance.ReportInstance`
+        The report instances, in the same order as the ``matrix`` rows.
+    """
+    template_cache = create_instance_args.pop('template_cache', None)
+
+    # Create the instances first, and then render all of their notebooks
+    # at once so that the templates are only compiled once
+    instances = []
+    contexts = []
+    for row_number, row in enumerate(matrix, start=1):
+        row_variables = dict(template_variables or {})
+        row_variables.update(row)
+        if instance_id is None:
+            row_instance_id = None
+        else:
+            row_instance_id = '{0}-{1:d}'.format(instance_id, row_number)
+        instances.append(create_instance(
+            report_repo, instance_id=row_instance_id,
+            template_variables=None, **create_instance_args))
+        contexts.append(row_variables)
+
+    ReportInstance.render_many(instances, contexts,
+                               template_cache=template_cache)
+    return instances
+
+
+def read_parameter_matrix(path):
+    """Read a parameter matrix file, which lists the template variables of
+    the instances in a parameter sweep.
+
+    Parameters
+    ----------
+    path : `pathlib.Path` or `str`
+        Path of a CSV file (with a ``.csv`` extension), whose header row
+        names the template variables, or of a YAML file (with a ``.yaml``
+        or ``.yml`` extension) that contains a list of mappings of template
+        variables.
+
+    Returns
+    -------
+    matrix : `list` of `dict`
+        Template variables for each row of the matrix.
+
+    Raises
+    ------
+    ValueError
+        Raised if the file's format isn't supported or its content isn't a
+        list of rows.
+    """
+    path = pathlib.Path(path)
+    suffix = path.suffix.lower()
+    if suffix == '.csv':
+        with open(path, newline='') as fp:
+            matrix = [dict(row) for row in csv.DictReader(fp)]
+        for row_number, row in enumerate(matrix, start=1):
+            if None in row or None in row.values():
+                raise ValueError(
+                    'Row {0:d} of {1!s} doesn\'t match the header'.format(
+                        row_number, path))
+        return matrix
+    elif suffix in ('.yaml', '.yml'):
+        with open(path) as fp:
+            data = YAML(typ='safe').load(fp)
+        if not isinstance(data, list) \
+                or not all(isinstance(row, dict) for row in data):
+            raise ValueError(
+                '{0!s} must contain a list of mappings'.format(path))
+        return [dict(row) for row in data]
+    else:
+        raise ValueError(
+            'Unsupported parameter matrix file {0!s}; use a .csv, .yaml, or '
+            '.yml file'.format(path))
+
+
+def _reserve_instance(report_repo, server, github_username, github_token,
+                      session=None):
     """Reserve a new instance ID from api.lsst.codes/nbreport.
 
     This function is only intended to be used by `create_instance`.
@@ -111,6 +296,8 @@ def _reserve_instance(report_repo, server, github_username, github_token):
         GitHub username.
     github_token : `str`
         Personal access token for the GitHub user.
+    session : `requests.Session`, optional
+        HTTP session. Defaults to `nbreport.session.get_session`.
 
     Returns
     -------
@@ -131,7 +318,9 @@ def _reserve_instance(report_repo, server, github_username, github_token):
 
     url = urljoin(server, '/nbreport/reports/{product}/instances/'.format(
         product=ltd_product))
-    response = requests.post(url, auth=(github_username, github_token))
+    if session is None:
+        session = get_session()
+    response = session.post(url, auth=(github_username, github_token))
     response.raise_for_status()
     data = response.json()
     instance_data = {
@@ -0,0 +1,202 @@
+"""Sampling profiler for notebook cells, which runs inside the kernel.
+
+The profiler samples the call stack of the kernel's main thread from a
+background thread, and writes the samples in the "collapsed stacks" format
+used by flame graph tools. `collapsed_to_speedscope` converts collapsed
+stacks to the `speedscope <https://www.speedscope.app>`_ JSON format.
+"""
+
+__all__ = ('PROFILE_TAG', 'get_profiler_setup_code', 'get_start_code',
+           'get_stop_code', 'collapsed_to_speedscope')
+
+import re
+
+
+PROFILE_TAG = 'nbreport-profile'
+"""Tag for notebook cells that are always profiled.
+"""
+
+# Installs a _nbreport_profiler module in the kernel, without leaving names
+# behind in the user namespace.
+_PROFILER_SETUP_CODE = '''
+def _nbreport_install_profiler():
+    import collections
+    import os
+    import sys
+    import threading
+    import types
+
+    module = types.ModuleType('_nbreport_profiler')
+    state = {}
+
+    def is_cell_file(filename):
+        # IPython compiles cells as <ipython-input-N-hash>, or, with
+        # ipykernel 6+, as files in a temporary ipykernel_PID directory
+        return filename.startswith('<ipython-input-') \
+            or os.path.basename(os.path.dirname(filename)).startswith(
+                'ipykernel_')
+
+    def frame_stack(frame, start_code):
+        frames = []
+        while frame is not None:
+            frames.append(frame.f_code)
+            frame = frame.f_back
+        frames.reverse()
+        # Drop the kernel's own frames, above the cell's code, and samples
+        # taken outside of the cell
+        for index, code in enumerate(frames):
+            if is_cell_file(code.co_filename):
+                break
+        else:
+            return None
+        # Drop samples of the profiler itself, while it's starting or
+        # stopping
+        if code is start_code or any(
+                frame_code.co_filename == profiler_filename
+                for frame_code in frames[index:]):
+            return None
+        return ['{0} ({1}:{2:d})'.format(code.co_name, code.co_filename,
+                                         code.co_firstlineno)
+                for code in frames[index:]]
+
+    def sample(thread_id, start_code, interval, stop_event, counts):
+        while not stop_event.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                stack = frame_stack(frame, start_code)
+                if stack is not None:
+                    counts[';'.join(stack)] += 1
+
+    def start(interval):
+        state['stop_event'] = threading.Event()
+        state['counts'] = collections.Counter()
+        state['thread'] = threading.Thread(
+            target=sample,
+            args=(threading.get_ident(), sys._getframe(1).f_code, interval,
+                  state['stop_event'], state['counts']),
+            daemon=True)
+        state['thread'].start()
+
+    def stop(path):
+        state['stop_event'].set()
+        state['thread'].join()
+        with open(path, 'w') as fp:
+            for stack, count in sorted(state['counts'].items()):
+                fp.write('{0} {1:d}\\n'.format(stack, count))
+        state.clear()
+
+    profiler_filename = start.__code__.co_filename
+    module.start = start
+    module.stop = stop
+    sys.modules['_nbreport_profiler'] = module
+
+
+_nbreport_install_profiler()
+del _nbreport_install_profiler
+'''
+
+_FRAME_PATTERN = re.compile(r'^(?P<name>.*) \((?P<file>.*):(?P<line>\d+)\)$')
+
+
+def get_profiler_setup_code():
+    """Get Python code that installs the profiler in a kernel.
+
+    Returns
+    -------
+    code : `str`
+        Python source to execute (silently) in the kernel once, before any
+        cell is profiled.
+    """
+    return _PROFILER_SETUP_CODE
+
+
+def get_start_code(interval):
+    """Get Python code that starts profiling in a kernel.
+
+    Parameters
+    ----------
+    interval : float
+        Sampling interval, in seconds.
+
+    Returns
+    -------
+    code : `str`
+        Python source to execute (silently) in the kernel.
+    """
+    return "__import__('_nbreport_profiler').start({0!r})\n".format(
+        float(interval))
+
+
+def get_stop_code(path):
+    """Get Python code that stops profiling in a kernel, and writes the
+    collapsed stacks to a file.
+
+    Parameters
+    ----------
+    path : `pathlib.Path` or `str`
+        Path of the collapsed stacks file. The kernel writes this file.
+
+    Returns
+    -------
+    code : `str`
+        Python source to execute (silently) in the kernel.
+    """
+    return "__import__('_nbreport_profiler').stop({0!r})\n".format(str(path))
+
+
+def collapsed_to_speedscope(lines, name='', interval=1.):
+    """Convert collapsed stacks to a speedscope profile.
+
+    Parameters
+    ----------
+    lines : iterable of `str`
+        Lines of collapsed stacks, formatted as ``frame;frame;frame count``.
+    name : `str`, optional
+        Name of the profile.
+    interval : float, optional
+        Sampling interval, in seconds, used to weight the samples.
+
+    Returns
+    -------
+    profile : `dict`
+        A JSON-serializable speedscope profile (``sampled`` type).
+    """
+    frames = []
+    frame_indices = {}
+    samples = []
+    weights = []
+    for line in lines:
+        line = line.rstrip('\n')
+        if not line:
+            continue
+        stack, _, count = line.rpartition(' ')
+        sample = []
+        for frame_name in stack.split(';'):
+            if frame_name not in frame_indices:
+                frame_indices[frame_name] = len(frames)
+                match = _FRAME_PATTERN.match(frame_name)
+                if match:
+                    frames.append({'name': match.group('name'),
+                                   'file': match.group('file'),
+                                   'line': int(match.group('line'))})
+                else:
+                    frames.append({'name': frame_name})
+            sample.append(frame_indices[frame_name])
+        samples.append(sample)
+        weights.append(int(count) * interval)
+
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'nbreport',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights
+        }]
+    }
@@ -3,7 +3,11 @@
 
 __all__ = ('ReportRepo', 'ReportConfig')
 
+from contextlib import contextmanager
+import copy
+import hashlib
 from io import StringIO
+import logging
 import os
 from pathlib import Path
 from urllib.parse import urlparse
@@ -12,6 +16,10 @@ import git
 import nbformat
 from ruamel.yaml import YAML
 
+from .assets import AssetResolver, read_asset_manifest, write_asset_manifest
+from .clone import clone_repository
+from .fsutils import create_temp_file
+
 
 class ReportRepo:
     """Report repository.
@@ -21,9 +29,18 @@ class ReportRepo:
     dirname : `pathlib.Path` or `str`
         Path to the report repository directory. This directory is a clone of
         the report's Git repository on the local filesystem.
+    git_commit : `str`, optional
+        SHA of the Git commit that the repository's files are from, if
+        they're a checkout of a known commit (see `ReportRepo.git_commit`).
+    cache_dir : `pathlib.Path` or `str`, optional
+        Directory for the caches that nbreport keeps with the report
+        repository, for a repository whose directory must not be written to
+        (see `ReportRepo.cache_dir`).
     """
 
-    def __init__(self, dirname):
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, dirname, git_commit=None, cache_dir=None):
         super().__init__()
 
         # Set and validate dirname
@@ -33,9 +50,18 @@ class ReportRepo:
         if not self._dirname.is_dir():
             raise OSError('Report repo not found at {}'.format(self._dirname))
 
+        self._git_commit = git_commit
+        self._cache_dir = Path(cache_dir) if cache_dir is not None else None
+
+        # Cached configuration, and paths derived from it (see reload)
+        self._config = None
+        self._ipynb_path = None
+        self._asset_paths = None
+        self._asset_manifest = None
+
     @classmethod
     def git_clone(cls, url, clone_base_dir=None, checkout='master',
-                  subdir=None):
+                  subdir=None, strategy='full'):
         """Create a ReportRepo instance by cloning from a Git repository.
 
         Parameters
@@ -52,6 +78,10 @@ class ReportRepo:
             If a report repository is not located in the root of a Git
             repository, set the Git-repo-relative directory path with this
             argument.
+        strategy : `str`, optional
+            Name of the clone strategy (see
+            `nbreport.clone.CLONE_STRATEGIES`). By default, the whole
+            repository is cloned.
 
         Returns
         -------
@@ -67,12 +97,14 @@ class ReportRepo:
         else:
             clone_dir = Path(clone_base_dir) / repo_name
 
-        git.Repo.clone_from(url, clone_dir, branch=checkout)
+        git_repo = clone_repository(url, clone_dir, checkout=checkout,
+                                    strategy=strategy, subdir=subdir)
+        git_commit = git_repo.head.commit.hexsha
 
         if subdir is None:
-            return cls(clone_dir)
+            return cls(clone_dir, git_commit=git_commit)
         else:
-            return cls(clone_dir / subdir)
+            return cls(clone_dir / subdir, git_commit=git_commit)
 
     @property
     def dirname(self):
@@ -96,43 +128,142 @@ class ReportRepo:
     @property
     def ipynb_path(self):
         """Path to report's notebook template (`pathlib.Path`).
+
+        The path is cached; see `ReportRepo.reload`.
         """
-        return self.dirname / self.config['ipynb']
+        if self._ipynb_path is None:
+            self._ipynb_path = self.dirname / self.config['ipynb']
+        return self._ipynb_path
 
     @property
     def config(self):
         """Notebook repository configuration (``ReportConfig``).
+
+        The same `ReportConfig`, which holds the parsed ``nbreport.yaml`` file
+        in memory, is returned every time; see `ReportRepo.reload`.
+        """
+        if self._config is None:
+            self._config = ReportConfig(self.config_path)
+        return self._config
+
+    def reload(self):
+        """Discard the cached configuration and the paths derived from it
+        (`ReportRepo.ipynb_path`, `ReportRepo.asset_paths`, and
+        `ReportRepo.asset_manifest`).
+
+        Call this method after changing the ``nbreport.yaml`` file, or adding
+        or removing asset files, so that the next access reads them again.
+        """
+        self._config = None
+        self._ipynb_path = None
+        self._asset_paths = None
+        self._asset_manifest = None
+
+    @property
+    def git_commit(self):
+        """SHA of the Git commit that the repository's files are from
+        (`str`), or `None` if it isn't known.
+
+        The commit is known for repositories cloned with
+        `ReportRepo.git_clone`, or opened from a `nbreport.mirror.RepoCache`
+        or a `nbreport.snapshot.SnapshotCache`. It's recorded in the
+        ``git_commit`` field of the configuration of instances.
+        """
+        return self._git_commit
+
+    @property
+    def cache_dir(self):
+        """Directory for caches that nbreport keeps with the report
+        repository (`pathlib.Path`).
+
+        If the report repository is in a Git working tree, the caches are
+        stored in the Git directory (``.git/nbreport/{name}-{hash}``, where
+        the hash is of the report repository's path in the working tree) so
+        that they don't appear as untracked files, and each report
+        repository in the working tree has its own caches. Otherwise, the
+        caches are in the ``.nbreport`` subdirectory of the report
+        repository, unless the report repository was created with a
+        ``cache_dir``.
         """
-        return ReportConfig(self.config_path)
+        if self._cache_dir is not None:
+            return self._cache_dir
+        try:
+            git_repo = git.Repo(str(self.dirname),
+                                search_parent_directories=True)
+            relpath = self.dirname.relative_to(
+                Path(git_repo.working_tree_dir).resolve())
+        except (git.InvalidGitRepositoryError, git.NoSuchPathError,
+                TypeError, ValueError):
+            # Not in a Git working tree
+            return self.dirname / '.nbreport'
+        path_hash = hashlib.sha256(
+            relpath.as_posix().encode('utf-8')).hexdigest()[:16]
+        return Path(git_repo.git_dir) / 'nbreport' / '{0}-{1}'.format(
+            self.dirname.name, path_hash)
+
+    @property
+    def template_cache_dir(self):
+        """Directory for the on-disk cache of compiled notebook templates
+        (`pathlib.Path`).
+
+        This is the ``templates`` subdirectory of `ReportRepo.cache_dir`.
+        See `nbreport.templating.TemplateCache`.
+        """
+        return self.cache_dir / 'templates'
+
+    @property
+    def asset_resolver(self):
+        """Resolver for the asset rules in the ``assets`` and
+        ``exclude_assets`` configuration fields
+        (`nbreport.assets.AssetResolver`).
+        """
+        config = self.config
+        patterns = config['assets'] if 'assets' in config else []
+        exclude = ['.nbreport']
+        if 'exclude_assets' in config:
+            exclude.extend(config['exclude_assets'])
+        return AssetResolver(patterns, exclude=exclude)
 
     @property
     def asset_paths(self):
         """Paths to assets associated with a report template (`list` of
         `pathlib.Path`).
+
+        The paths are found once and cached; see `ReportRepo.reload`.
         """
-        try:
-            configured_paths = self.config['assets']
-        except KeyError:
+        if self._asset_paths is None:
+            self._asset_paths = self._find_asset_paths()
+        return list(self._asset_paths)
+
+    def _find_asset_paths(self):
+        if 'assets' not in self.config:
             return []
+        return self.asset_resolver.resolve(self.dirname)
 
-        assetpaths = []
-        for configured_path in configured_paths:
-            # User provided a glob pattern
-            if '*' in configured_path:
-                new_paths = list(self.dirname.glob(configured_path))
-                assetpaths.extend(new_paths)
-            else:
-                configured_path = self.dirname / Path(configured_path)
-                if configured_path.is_dir():
-                    # When a directory is provided, automatically glob contents
-                    new_paths = list(configured_path.glob('**/*'))
-                    assetpaths.extend(new_paths)
-                else:
-                    # Path to a single file
-                    assetpaths.append(configured_path)
-
-        # Filter out directories
-        return [p for p in assetpaths if p.is_file()]
+    @property
+    def asset_manifest(self):
+        """Manifest of the asset files, with their sizes, modification
+        times, and SHA-256 hashes (`list` of `nbreport.assets.AssetEntry`).
+
+        The manifest is cached in memory (see `ReportRepo.reload`) and in
+        the ``assets.json`` file in `ReportRepo.cache_dir`. Files whose
+        size and modification time match the cached manifest aren't hashed
+        again.
+        """
+        if self._asset_manifest is None:
+            manifest_path = self.cache_dir / 'assets.json'
+            previous = read_asset_manifest(manifest_path)
+            manifest = self.asset_resolver.build_manifest(
+                self.dirname, previous=previous)
+            if manifest != previous:
+                try:
+                    write_asset_manifest(manifest, manifest_path)
+                except OSError as e:
+                    self._logger.warning(
+                        'Could not write the asset manifest to %s: %s',
+                        manifest_path, e)
+            self._asset_manifest = manifest
+        return list(self._asset_manifest)
 
     def open_notebook(self):
         """Open the repository's notebook file.
@@ -158,6 +289,18 @@ class ReportConfig:
         Path to the ``nbreport.yaml`` configuration file.
     data : `dict`, optional
         Initial data to insert into the configuration.
+
+    Notes
+    -----
+    The parsed configuration is held in memory, and the file is only parsed
+    again if its modification time, size, or inode changes (for example,
+    if another process rewrites it). Values are returned from the in-memory
+    copy, so treat them as read-only; set keys with `ReportConfig.update`
+    or item assignment to change the file.
+
+    Each change is written to the file atomically. Use
+    `ReportConfig.transaction` to combine several changes into a single
+    write.
     """
 
     def __init__(self, path, data=None):
@@ -170,20 +313,95 @@ class ReportConfig:
         # This "unsafe" YAML support round-trip preservation of comments
         self._yaml = YAML()
 
+        # Parsed data, and the file status when it was parsed
+        self._data = None
+        self._stat_key = None
+
+        # Nesting depth of transactions, and whether the data has changes
+        # that aren't written yet
+        self._transaction_depth = 0
+        self._dirty = False
+
         # Insert initial data
         if data:
             self.update(data)
 
     def _read(self):
+        if self._transaction_depth > 0 and self._data is not None:
+            return self._data
+        try:
+            stat_key = _get_stat_key(self._path)
+        except OSError:
+            stat_key = None
+        if self._data is not None and stat_key == self._stat_key:
+            return self._data
+
         try:
             with open(self._path) as fp:
                 data = self._yaml.load(fp)
         except OSError:
+            data = None
+        if data is None:
+            # Missing or empty file
             data = {}
+        self._data = data
+        self._stat_key = stat_key
         return data
 
     def _write(self, data):
-        self._yaml.dump(data, self._path)
+        self._data = data
+        if self._transaction_depth > 0:
+            self._dirty = True
+            return
+
+        # Write atomically, so readers never see a partial file
+        fd, temp_path = create_temp_file(self._path)
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                self._yaml.dump(data, fp)
+            os.replace(temp_path, str(self._path))
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+            self._data = None
+            raise
+        self._stat_key = _get_stat_key(self._path)
+        self._dirty = False
+
+    @contextmanager
+    def transaction(self):
+        """Combine several changes to the configuration into a single write.
+
+        Use this method as a context manager. Changes made inside the
+        ``with`` block are written to the file, atomically, when the block
+        exits. If the block raises an exception, its changes are discarded.
+        Transactions can be nested; changes are written when the outermost
+        transaction exits.
+
+        Examples
+        --------
+        >>> with config.transaction():  # doctest: +SKIP
+        ...     config['instance_id'] = '1'
+        ...     config['instance_handle'] = 'TESTR-000-1'
+        """
+        data = self._read()
+        if self._transaction_depth == 0:
+            # Changes are made to a copy, so they can be discarded
+            self._data = copy.deepcopy(data)
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._data = None
+                self._dirty = False
+            raise
+        self._transaction_depth -= 1
+        if self._transaction_depth == 0 and self._dirty:
+            self._write(self._data)
 
     def __str__(self):
         data = self._read()
@@ -280,3 +498,10 @@ class ReportConfig:
         data = self._read()
         data.update(configs)
         self._write(data)
+
+
+def _get_stat_key(path):
+    """Get the file status that invalidates a cached, parsed, file.
+    """
+    stat = os.stat(str(path))
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
@@ -0,0 +1,95 @@
+"""A pooled HTTP session for requests to the nbreport API server and
+GitHub.
+"""
+
+__all__ = ('DEFAULT_TIMEOUT', 'create_session', 'get_session')
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (10., 300.)
+"""Default timeouts of requests, in seconds, as a ``(connect, read)``
+tuple.
+"""
+
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def create_session(pool_size=10, timeout=DEFAULT_TIMEOUT, retries=3,
+                   backoff_factor=0.5):
+    """Create an HTTP session that keeps connections alive and reuses them
+    across requests.
+
+    Parameters
+    ----------
+    pool_size : `int`, optional
+        Maximum number of connections kept alive for each host.
+    timeout : `float` or `tuple`, optional
+        Timeout of requests that don't set their own, in seconds. Either a
+        single value, or a ``(connect, read)`` tuple. `None` disables the
+        timeout.
+    retries : `int`, optional
+        Number of times a request is retried after a connection error or,
+        for idempotent requests, a read error or a ``429``, ``500``, ``502``,
+        ``503``, or ``504`` response.
+    backoff_factor : `float`, optional
+        Retries wait ``backoff_factor * 2 ** (retry - 1)`` seconds, or the
+        time given by the response's ``Retry-After`` header.
+
+    Returns
+    -------
+    session : `requests.Session`
+        The session. It can be shared between threads.
+
+    Notes
+    -----
+    ``POST`` requests are only retried if the request couldn't be sent, since
+    sending a request twice could, for example, reserve two report instances.
+    """
+    retry = Retry(total=retries, connect=retries, read=retries,
+                  status=retries, backoff_factor=backoff_factor,
+                  status_forcelist=_RETRY_STATUSES, raise_on_status=False)
+    adapter = _TimeoutHTTPAdapter(timeout=timeout, pool_maxsize=pool_size,
+                                  max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Get the session that is shared by default by nbreport's HTTP
+    requests.
+
+    Returns
+    -------
+    session : `requests.Session`
+        The shared session, created by `create_session` with its default
+        arguments the first time it's needed.
+    """
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
+
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTP adapter with a default timeout, since `requests.Session` doesn't
+    have one.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self._timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self._timeout
+        return super().send(request, timeout=timeout, **kwargs)
@@ -0,0 +1,232 @@
+"""A cache of read-only snapshots of report repositories, keyed by Git
+commit.
+"""
+
+__all__ = ('SnapshotCache',)
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+import shutil
+import stat
+import tempfile
+import time
+
+from .repo import ReportRepo
+from .userconfig import get_cache_dir
+
+
+class SnapshotCache:
+    """Cache of snapshots of the files of report repositories at Git
+    commits.
+
+    Parameters
+    ----------
+    directory : `pathlib.Path` or `str`, optional
+        Directory of the cache. Defaults to the ``snapshots`` subdirectory of
+        `nbreport.userconfig.get_cache_dir`.
+    max_age : `float`, optional
+        Snapshots that haven't been used for this many seconds are evicted
+        when new snapshots are added.
+
+    Notes
+    -----
+    A snapshot is a copy of the report repository's directory (the Git
+    repository's ``subdir``) at a commit, without the Git repository. Since
+    a commit's content never changes, instances can be created from the
+    snapshot of a commit without any Git operations, once the ref to check
+    out is resolved to a commit (`nbreport.clone.resolve_git_ref`).
+
+    The files of a snapshot are read-only. Each snapshot is created in a
+    temporary directory and renamed into place, so concurrent processes
+    never see a partial snapshot. The caches that nbreport keeps with a
+    report repository (`nbreport.repo.ReportRepo.cache_dir`) are stored
+    next to the snapshot, rather than in it.
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, directory=None, max_age=30 * 24 * 3600.):
+        super().__init__()
+        if directory is None:
+            directory = get_cache_dir() / 'snapshots'
+        self._directory = Path(directory)
+        self._max_age = max_age
+
+    def __repr__(self):
+        return "{0}('{1!s}')".format(self.__class__.__name__,
+                                     self._directory)
+
+    @property
+    def directory(self):
+        """Directory of the cache (`pathlib.Path`).
+        """
+        return self._directory
+
+    def get_snapshot_dir(self, git_commit, subdir=None):
+        """Get the directory of a snapshot.
+
+        Parameters
+        ----------
+        git_commit : `str`
+            SHA of the Git commit.
+        subdir : `str`, optional
+            Directory of the report repository within the Git repository, if
+            it isn't the root.
+
+        Returns
+        -------
+        path : `pathlib.Path`
+            Directory of the snapshot (whether it exists, or not).
+        """
+        subdir = (subdir or '').strip('/')
+        subdir_hash = hashlib.sha256(subdir.encode('utf-8')).hexdigest()[:8]
+        name = '{0}-{1}'.format(subdir.replace('/', '_') or 'root',
+                                subdir_hash)
+        return self._directory / git_commit / name
+
+    def get(self, git_commit, subdir=None):
+        """Get a report repository from the snapshot of a commit.
+
+        Parameters
+        ----------
+        git_commit : `str`
+            SHA of the Git commit.
+        subdir : `str`, optional
+            Directory of the report repository within the Git repository, if
+            it isn't the root.
+
+        Returns
+        -------
+        report_repo : `nbreport.repo.ReportRepo` or `None`
+            The report repository in the snapshot, or `None` if the commit
+            doesn't have a snapshot.
+        """
+        path = self.get_snapshot_dir(git_commit, subdir=subdir)
+        try:
+            # Record the use, for evict
+            os.utime(str(path))
+        except FileNotFoundError:
+            return None
+        self._logger.info('Using the snapshot of %s at %s', git_commit[:8],
+                          path)
+        return ReportRepo(path, git_commit=git_commit,
+                          cache_dir=_get_repo_cache_dir(path))
+
+    def add(self, report_repo, subdir=None):
+        """Add a snapshot of a report repository.
+
+        Parameters
+        ----------
+        report_repo : `nbreport.repo.ReportRepo`
+            The report repository, with a known
+            `~nbreport.repo.ReportRepo.git_commit`.
+        subdir : `str`, optional
+            Directory of the report repository within the Git repository, if
+            it isn't the root.
+
+        Returns
+        -------
+        report_repo : `nbreport.repo.ReportRepo`
+            The report repository in the snapshot.
+
+        Raises
+        ------
+        ValueError
+            Raised if the report repository's commit isn't known.
+        """
+        git_commit = report_repo.git_commit
+        if git_commit is None:
+            raise ValueError(
+                'The Git commit of {0!s} is not known.'.format(
+                    report_repo.dirname))
+        path = self.get_snapshot_dir(git_commit, subdir=subdir)
+        if not path.is_dir():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_dir = Path(tempfile.mkdtemp(dir=str(path.parent),
+                                             suffix='.tmp'))
+            try:
+                temp_path = temp_dir / path.name
+                _copy_snapshot(report_repo.dirname, temp_path)
+                try:
+                    os.rename(str(temp_path), str(path))
+                except OSError:
+                    if not path.is_dir():
+                        raise
+                    # Another process added the snapshot first
+                else:
+                    self._logger.info('Saved a snapshot of %s at %s',
+                                      git_commit[:8], path)
+            finally:
+                shutil.rmtree(str(temp_dir), ignore_errors=True)
+        self.evict()
+        return ReportRepo(path, git_commit=git_commit,
+                          cache_dir=_get_repo_cache_dir(path))
+
+    def evict(self, max_age=None):
+        """Remove snapshots that haven't been used recently.
+
+        Parameters
+        ----------
+        max_age : `float`, optional
+            Snapshots that haven't been used for this many seconds are
+            removed. Defaults to the cache's ``max_age``.
+
+        Returns
+        -------
+        evicted : `list` of `pathlib.Path`
+            Directories of the removed snapshots.
+        """
+        if max_age is None:
+            max_age = self._max_age
+        if not self._directory.is_dir():
+            return []
+        cutoff = time.time() - max_age
+        evicted = []
+        for commit_entry in os.scandir(str(self._directory)):
+            if not commit_entry.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(commit_entry.path):
+                if entry.name.startswith('.') \
+                        and entry.name.endswith('.cache'):
+                    # A snapshot's caches, evicted with the snapshot
+                    continue
+                try:
+                    last_used = entry.stat(follow_symlinks=False).st_mtime
+                except FileNotFoundError:
+                    continue
+                if last_used >= cutoff:
+                    continue
+                shutil.rmtree(entry.path, ignore_errors=True)
+                shutil.rmtree(str(_get_repo_cache_dir(Path(entry.path))),
+                              ignore_errors=True)
+                evicted.append(Path(entry.path))
+                self._logger.debug('Evicted snapshot %s', entry.path)
+            try:
+                os.rmdir(commit_entry.path)
+            except OSError:
+                # Not empty
+                pass
+        return evicted
+
+
+def _get_repo_cache_dir(snapshot_dir):
+    """Get the directory of the caches of a snapshot's report repository,
+    outside of the read-only snapshot.
+    """
+    return snapshot_dir.parent / '.{0}.cache'.format(snapshot_dir.name)
+
+
+def _copy_snapshot(source_dir, dest_dir):
+    """Copy the files of a report repository, without Git or nbreport
+    metadata, and make them read-only.
+    """
+    shutil.copytree(str(source_dir), str(dest_dir), symlinks=True,
+                    ignore=shutil.ignore_patterns('.git', '.nbreport'))
+    read_only = ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+    for dirpath, _, filenames in os.walk(str(dest_dir)):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if not os.path.islink(path):
+                os.chmod(path, stat.S_IMODE(os.stat(path).st_mode) & read_only)
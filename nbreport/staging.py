@@ -0,0 +1,274 @@
+"""Staging the asset files of a report repository into report instances.
+"""
+
+__all__ = ('STAGING_STRATEGIES', 'AssetStager')
+
+from concurrent.futures import ThreadPoolExecutor
+import errno
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+
+from .blobstore import BlobStore
+
+STAGING_STRATEGIES = ('copy', 'hardlink', 'reflink', 'symlink', 'blob')
+"""Names of the strategies for staging asset files into an instance.
+
+``copy``
+    Copy the file's content.
+``hardlink``
+    Create a hard link to the repository's file. The instance and the
+    repository share the file, so the asset must not be modified in place.
+``reflink``
+    Create a copy-on-write clone of the file (on filesystems such as Btrfs,
+    XFS, and APFS). The clone shares storage with the repository's file until
+    either is modified.
+``symlink``
+    Create a symbolic link to the repository's file. The repository must
+    outlive the instance.
+``blob``
+    Add the file to a content-addressed `nbreport.blobstore.BlobStore` and
+    create a hard link to the stored blob. Instances of every report share
+    one copy of each distinct file.
+"""
+
+# Errors that mean a filesystem doesn't support a way of staging a file
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV, errno.EPERM, errno.EACCES, errno.EMLINK, errno.EINVAL,
+    errno.ENOTTY, errno.ENOSYS, errno.EOPNOTSUPP,
+    getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP)
+}
+
+# ioctl request to clone a file on Linux (FICLONE in linux/fs.h)
+_FICLONE = 0x40049409
+
+
+class AssetStager:
+    """Stage files from a report repository into a report instance.
+
+    Parameters
+    ----------
+    strategy : `str`, optional
+        Name of the staging strategy (see `STAGING_STRATEGIES`).
+    jobs : int, optional
+        Maximum number of files to stage concurrently, in threads. The
+        default is the number of CPUs plus four (up to 32), since staging is
+        mostly waiting on the filesystem.
+    blob_store : `nbreport.blobstore.BlobStore`, optional
+        Store for the ``blob`` strategy. Defaults to a store in the user's
+        cache directory.
+
+    Raises
+    ------
+    ValueError
+        Raised if the strategy is unknown.
+
+    Notes
+    -----
+    If the filesystem doesn't support the strategy for a file (for example,
+    a hard link across filesystems), the file is copied instead. The
+    fallback is remembered for the pair of source and destination devices,
+    so the unsupported strategy isn't tried again for every file.
+
+    `AssetStager.stage` creates the destination directories up front, then
+    stages the files on a thread pool, so that staging on network
+    filesystems isn't bound by the latency of each file operation.
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, strategy='copy', jobs=None, blob_store=None):
+        super().__init__()
+        if strategy not in STAGING_STRATEGIES:
+            raise ValueError(
+                'Unknown asset staging strategy {0!r}. Use one of: '
+                '{1}.'.format(strategy, ', '.join(STAGING_STRATEGIES)))
+        self._strategy = strategy
+        if jobs is None:
+            jobs = min(32, (os.cpu_count() or 1) + 4)
+        self._jobs = jobs
+        if strategy == 'blob' and blob_store is None:
+            blob_store = BlobStore()
+        self._blob_store = blob_store
+        # Pairs of (source, destination) devices that don't support the
+        # strategy
+        self._unsupported_devices = set()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "{0}('{1}')".format(self.__class__.__name__, self._strategy)
+
+    @property
+    def strategy(self):
+        """Name of the staging strategy (`str`).
+        """
+        return self._strategy
+
+    @property
+    def blob_store(self):
+        """Store for the ``blob`` strategy (`nbreport.blobstore.BlobStore`
+        or `None`).
+        """
+        return self._blob_store
+
+    def stage(self, files, hashes=None):
+        """Stage files into an instance.
+
+        Parameters
+        ----------
+        files : iterable of `tuple`
+            Pairs of source and destination paths (`pathlib.Path`). Parent
+            directories of the destinations are created as needed.
+        hashes : `dict`, optional
+            SHA-256 hashes of the source files' contents (`str`), keyed by
+            source path. With the ``blob`` strategy, files with known hashes
+            that are already in the store aren't read.
+
+        Returns
+        -------
+        counts : `dict`
+            Number of files staged with each strategy.
+
+        Notes
+        -----
+        The number of files, bytes, and the time taken, are logged.
+        """
+        hashes = hashes or {}
+        files = [(source, dest, hashes.get(source))
+                 for source, dest in files]
+        start_time = time.perf_counter()
+
+        # Create each destination directory once, before staging
+        for directory in sorted(set(dest.parent for _, dest, _ in files)):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        if self._jobs > 1 and len(files) > 1:
+            with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+                results = list(executor.map(
+                    lambda args: self._stage_sized(*args), files))
+        else:
+            results = [self._stage_sized(*args) for args in files]
+
+        counts = {}
+        total_size = 0
+        for used_strategy, size in results:
+            counts[used_strategy] = counts.get(used_strategy, 0) + 1
+            total_size += size
+        duration = time.perf_counter() - start_time
+        if files:
+            self._logger.info(
+                'Staged %d files (%.1f MB) in %.2f s: %.0f files/s, '
+                '%.1f MB/s (%s)',
+                len(files), total_size / 1e6, duration,
+                len(files) / max(duration, 1e-6),
+                total_size / 1e6 / max(duration, 1e-6),
+                ', '.join('{0} {1:d}'.format(name, count)
+                          for name, count in sorted(counts.items())))
+        return counts
+
+    def _stage_sized(self, source, dest, sha256):
+        used_strategy = self.stage_file(source, dest, sha256=sha256)
+        return used_strategy, os.stat(str(source)).st_size
+
+    def stage_file(self, source, dest, sha256=None):
+        """Stage a single file.
+
+        Parameters
+        ----------
+        source : `pathlib.Path`
+            Path of the file in the report repository.
+        dest : `pathlib.Path`
+            Path of the file in the instance. An existing file is replaced.
+            The parent directory must exist.
+        sha256 : `str`, optional
+            SHA-256 hash of the file's content, if it's known. Only used by
+            the ``blob`` strategy.
+
+        Returns
+        -------
+        strategy : `str`
+            The strategy that staged the file: the `AssetStager.strategy`,
+            or ``'copy'`` if the filesystem doesn't support it.
+        """
+        if self._strategy != 'copy':
+            if self._strategy == 'blob':
+                # Blobs are linked from the store's filesystem
+                self._blob_store.directory.mkdir(parents=True, exist_ok=True)
+                source_device = os.stat(
+                    str(self._blob_store.directory)).st_dev
+            else:
+                source_device = os.stat(str(source)).st_dev
+            devices = (source_device, os.stat(str(dest.parent)).st_dev)
+            with self._lock:
+                is_supported = devices not in self._unsupported_devices
+            if is_supported:
+                _remove(dest)
+                try:
+                    if self._strategy == 'blob':
+                        self._blob_store.link(
+                            self._blob_store.add(source, sha256=sha256),
+                            dest)
+                    else:
+                        _STAGE_FUNCTIONS[self._strategy](source, dest)
+                except OSError as e:
+                    if e.errno not in _UNSUPPORTED_ERRNOS:
+                        raise
+                    self._logger.info(
+                        'Could not stage %s with %s (%s); copying files '
+                        'on this filesystem instead.', source, self._strategy,
+                        e)
+                    with self._lock:
+                        self._unsupported_devices.add(devices)
+                    _remove(dest)
+                else:
+                    return self._strategy
+
+        _remove(dest)
+        shutil.copy(str(source), str(dest))
+        return 'copy'
+
+
+def _hardlink(source, dest):
+    os.link(str(source), str(dest))
+
+
+def _symlink(source, dest):
+    os.symlink(str(os.path.abspath(str(source))), str(dest))
+
+
+def _reflink(source, dest):
+    if sys.platform.startswith('linux'):
+        import fcntl
+        with open(str(source), 'rb') as source_fp, \
+                open(str(dest), 'wb') as dest_fp:
+            fcntl.ioctl(dest_fp.fileno(), _FICLONE, source_fp.fileno())
+        shutil.copymode(str(source), str(dest))
+    elif sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        result = libc.clonefile(os.fsencode(str(source)),
+                                os.fsencode(str(dest)), 0)
+        if result != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), str(dest))
+    else:
+        raise OSError(errno.EOPNOTSUPP,
+                      'Reflinks are not supported on this platform',
+                      str(dest))
+
+
+_STAGE_FUNCTIONS = {
+    'hardlink': _hardlink,
+    'reflink': _reflink,
+    'symlink': _symlink
+}
+
+
+def _remove(path):
+    try:
+        os.unlink(str(path))
+    except FileNotFoundError:
+        pass
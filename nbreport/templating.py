@@ -1,15 +1,27 @@
 """Rendering templated cells in Jupyter notebooks.
 """
 
-__all__ = ('render_notebook', 'render_cell', 'load_template_environment')
+__all__ = ('render_notebook', 'render_many', 'render_cell',
+           'load_template_environment', 'load_template_context',
+           'TemplateCache', 'TemplateIndex', 'index_notebook_templates')
 
+from collections import OrderedDict
+from collections.abc import Mapping
+import hashlib
+import json
+import logging
+import os
 from pathlib import Path
+import threading
 
 from cookiecutter.generate import generate_context
 from cookiecutter.environment import StrictEnvironment
+from jinja2 import meta, nodes
+from jinja2.bccache import FileSystemBytecodeCache
+import nbformat
 
 
-def render_notebook(notebook, context, jinja_env):
+def render_notebook(notebook, context, jinja_env, template_cache=None):
     """Render the Jinja-templated cells of a notebook.
 
     Parameters
@@ -24,6 +36,9 @@ def render_notebook(notebook, context, jinja_env):
         `cookiecutter.generate.generate_context`.
     jinja_env : `cookiecutter.environment.StrictEnvironment`
         The Jinja environment.
+    template_cache : `TemplateCache`, optional
+        Cache of compiled cell templates. By default, a cache that is shared
+        by all renders in the process is used.
 
     Returns
     -------
@@ -34,13 +49,100 @@ def render_notebook(notebook, context, jinja_env):
     -----
     This function operates on the ``source`` member of each cell in the
     notebook. Cell sources are treated as individual Jinja templates.
+
+    Only the cells that contain template syntax are rendered, according to
+    the notebook's `TemplateIndex` (see `index_notebook_templates`). Before
+    rendering, template variables that the notebook references but that
+    aren't in the ``context`` are logged as warnings, and ``cookiecutter``
+    variables that the notebook doesn't reference are logged.
     """
-    for cell in notebook.cells:
-        render_cell(cell, context, jinja_env)
+    index = index_notebook_templates(notebook, jinja_env)
+    _check_context(index, context)
+
+    for cell_index in index.templated_cells:
+        render_cell(notebook.cells[cell_index], context, jinja_env,
+                    template_cache=template_cache)
     return notebook
 
 
-def render_cell(cell, context, jinja_env):
+def render_many(notebook, contexts, jinja_env=None, template_cache=None):
+    """Render a notebook with each of several template contexts.
+
+    Parameters
+    ----------
+    notebook : `nbformat.NotebookNode`
+        The notebook document. This notebook is not modified.
+    contexts : iterable of `dict`-like
+        Template contexts. Usually these are constructed via
+        `load_template_environment`.
+    jinja_env : `cookiecutter.environment.StrictEnvironment`, optional
+        The Jinja environment that renders every context. By default, an
+        environment is created from the first context.
+    template_cache : `TemplateCache`, optional
+        Cache of compiled cell templates. By default, a cache that is shared
+        by all renders in the process is used.
+
+    Yields
+    ------
+    notebook : `nbformat.NotebookNode`
+        A rendered notebook for each context, in the same order as
+        ``contexts``.
+
+    Notes
+    -----
+    The notebook's templated cells are indexed, parsed, and compiled once,
+    before the first context is rendered. The rendered notebooks are shallow
+    copies: cells without template syntax, and the outputs and metadata of
+    templated cells, are shared by reference between ``notebook`` and the
+    rendered notebooks. Only the top-level notebook metadata is copied, so
+    it can be updated for each rendered notebook. Don't modify the shared
+    cells in place.
+    """
+    if template_cache is None:
+        template_cache = _default_template_cache
+
+    templates = None
+    for context in contexts:
+        if templates is None:
+            if jinja_env is None:
+                jinja_env = StrictEnvironment(context=context,
+                                              keep_trailing_newline=True)
+            index = index_notebook_templates(notebook, jinja_env)
+            templates = {
+                cell_index: template_cache.get_template(
+                    notebook.cells[cell_index].source, jinja_env)
+                for cell_index in index.templated_cells}
+
+        _check_context(index, context)
+        cells = list(notebook.cells)
+        for cell_index, template in templates.items():
+            cell = nbformat.NotebookNode(cells[cell_index])
+            cell.source = template.render(**context)
+            cells[cell_index] = cell
+
+        rendered = nbformat.NotebookNode(notebook)
+        rendered.metadata = nbformat.NotebookNode(notebook.metadata)
+        rendered.cells = cells
+        yield rendered
+
+
+def _check_context(index, context):
+    """Log variables that are undefined in, or unused from, a template
+    context.
+    """
+    logger = logging.getLogger(__name__)
+
+    undefined = index.find_undefined_variables(context)
+    if undefined:
+        logger.warning('Notebook references template variables that are '
+                       'not in the context: %s', ', '.join(undefined))
+    unused = index.find_unused_variables(context)
+    if unused:
+        logger.info('Template variables not used by the notebook: %s',
+                    ', '.join(unused))
+
+
+def render_cell(cell, context, jinja_env, template_cache=None):
     """Render the Jinja-templated source of a single notebook cell.
 
     Parameters
@@ -55,6 +157,9 @@ def render_cell(cell, context, jinja_env):
         `cookiecutter.generate.generate_context`.
     jinja_env : `cookiecutter.environment.StrictEnvironment`
         The Jinja environment.
+    template_cache : `TemplateCache`, optional
+        Cache of compiled cell templates. By default, a cache that is shared
+        by all renders in the process is used.
 
     Returns
     -------
@@ -70,7 +175,9 @@ def render_cell(cell, context, jinja_env):
     For more information about the format of a cell, see `The Notebook
     file format <https://ls.st/g01>`_ in the nbformat docs.
     """
-    template = jinja_env.from_string(cell.source)
+    if template_cache is None:
+        template_cache = _default_template_cache
+    template = template_cache.get_template(cell.source, jinja_env)
     cell.source = template.render(**context)
     return cell
 
@@ -119,6 +226,45 @@ def load_template_environment(context_path=None,
     Internally this function uses `cookiecutter.generate.generate_context` to
     combine a ``cookiecutter.json`` file with ``extra_context``.
     """
+    context = load_template_context(context_path=context_path,
+                                    extra_context=extra_context,
+                                    system_context=system_context)
+
+    # Also make the Jinja environment
+    jinja_env = StrictEnvironment(
+        context=context,
+        keep_trailing_newline=True,
+    )
+
+    return context, jinja_env
+
+
+def load_template_context(context_path=None, extra_context=None,
+                          system_context=None):
+    """Load the template context (``cookiecutter.json``), without creating
+    a Jinja environment.
+
+    Parameters
+    ----------
+    context_path : `pathlib.Path` or `str`, optional
+        Path to the ``cookiecutter.json`` context file, if available.
+    extra_context : `dict`, optional
+        Key-value terms that override values obtained from any
+        ``cookiecutter.json`` file.
+    system_context : `dict`, optional
+        Key-value terms that are available to templates, but outside the
+        ``cookiecutter`` context.
+
+    Returns
+    -------
+    context : `dict`
+        The template context.
+
+    Notes
+    -----
+    See `load_template_environment` for details. Use this function with
+    `render_many` to render several contexts with one Jinja environment.
+    """
     if context_path is not None:
         # Regular code path that generates a context from a combination
         # of the cookiecutter.json file with overrides.
@@ -137,13 +283,424 @@ def load_template_environment(context_path=None,
     if system_context is not None:
         context.update(system_context)
 
-    print('created context')
-    print(context)
+    logging.getLogger(__name__).debug('Created template context: %s',
+                                      context)
 
-    # Also make the Jinja environment
-    jinja_env = StrictEnvironment(
-        context=context,
-        keep_trailing_newline=True,
-    )
+    return context
 
-    return context, jinja_env
+
+def index_notebook_templates(notebook, jinja_env):
+    """Index the templated cells of a notebook, and the template variables
+    they reference.
+
+    Parameters
+    ----------
+    notebook : `nbformat.NotebookNode`
+        The notebook document.
+    jinja_env : `jinja2.Environment`
+        The Jinja environment that renders the notebook.
+
+    Returns
+    -------
+    index : `TemplateIndex`
+        Index of the notebook's templated cells.
+
+    Notes
+    -----
+    A cell is templated if its source contains the start of a Jinja block,
+    variable, or comment (usually ``{%``, ``{{``, or ``{#``). Only templated
+    cells are parsed.
+
+    Indices are cached in memory, keyed by a hash of the notebook's cell
+    sources and the environment's syntax settings, so a repository's notebook
+    is only indexed once for all of its instances.
+    """
+    sources = [cell.source for cell in notebook.cells]
+    key = _compute_template_key(json.dumps(sources), jinja_env)
+    with _template_index_lock:
+        index = _template_index_cache.get(key)
+        if index is not None:
+            _template_index_cache.move_to_end(key)
+            return index
+
+    markers = [jinja_env.block_start_string,
+               jinja_env.variable_start_string,
+               jinja_env.comment_start_string]
+    if jinja_env.line_statement_prefix:
+        markers.append(jinja_env.line_statement_prefix)
+    if jinja_env.line_comment_prefix:
+        markers.append(jinja_env.line_comment_prefix)
+
+    cell_variables = {}
+    for cell_index, source in enumerate(sources):
+        if any(marker in source for marker in markers):
+            cell_variables[cell_index] = _find_template_variables(
+                source, jinja_env)
+    index = TemplateIndex(cell_variables)
+
+    with _template_index_lock:
+        _template_index_cache[key] = index
+        while len(_template_index_cache) > 128:
+            _template_index_cache.popitem(last=False)
+    return index
+
+
+class TemplateIndex:
+    """Index of the templated cells in a notebook, and of the template
+    variables each cell references.
+
+    Parameters
+    ----------
+    cell_variables : `dict`
+        Mapping of the index of each templated cell to a `frozenset` of the
+        names of the template variables the cell references.
+
+    Notes
+    -----
+    Use `index_notebook_templates` to create an index for a notebook.
+
+    Variable names are top-level names in the template context, like
+    ``instance_id``. Items of a mapping in the context are named with the
+    item's key, like ``cookiecutter.title``. If a cell uses a mapping
+    without naming its items (for example, by iterating over it), the
+    mapping's name alone is referenced.
+    """
+
+    def __init__(self, cell_variables):
+        super().__init__()
+        self._cell_variables = {
+            cell_index: frozenset(names)
+            for cell_index, names in cell_variables.items()}
+
+    def __repr__(self):
+        return '{0}(templated_cells={1!r})'.format(
+            self.__class__.__name__, self.templated_cells)
+
+    @property
+    def templated_cells(self):
+        """Indices of the cells that contain template syntax (`list` of
+        `int`).
+        """
+        return sorted(self._cell_variables)
+
+    @property
+    def cell_variables(self):
+        """Mapping of the index of each templated cell to the names of the
+        variables it references (`dict`).
+        """
+        return dict(self._cell_variables)
+
+    @property
+    def variables(self):
+        """Names of the variables referenced by any cell (`frozenset`).
+        """
+        return frozenset().union(*self._cell_variables.values())
+
+    def find_undefined_variables(self, context):
+        """Find the variables that templated cells reference, but that aren't
+        defined in a template context.
+
+        Parameters
+        ----------
+        context : `dict`-like
+            The template context.
+
+        Returns
+        -------
+        names : `list` of `str`
+            Sorted names of the undefined variables.
+        """
+        undefined = set()
+        for name in self.variables:
+            root, _, key = name.partition('.')
+            if root not in context:
+                undefined.add(root)
+            elif key and isinstance(context[root], Mapping) \
+                    and key not in context[root]:
+                undefined.add(name)
+        return sorted(undefined)
+
+    def find_unused_variables(self, context):
+        """Find the items of mappings in a template context, like the
+        ``cookiecutter`` variables, that no templated cell references.
+
+        Parameters
+        ----------
+        context : `dict`-like
+            The template context.
+
+        Returns
+        -------
+        names : `list` of `str`
+            Sorted names of the unused variables. Private keys, which start
+            with an underscore (like ``cookiecutter._extensions``), are never
+            reported.
+        """
+        variables = self.variables
+        unused = []
+        for root, value in context.items():
+            if not isinstance(value, Mapping) or root in variables:
+                continue
+            for key in value:
+                name = '{0}.{1}'.format(root, key)
+                if not str(key).startswith('_') and name not in variables:
+                    unused.append(name)
+        return sorted(unused)
+
+
+def _find_template_variables(source, jinja_env):
+    """Find the names of context variables referenced by a template.
+    """
+    ast = jinja_env.parse(source)
+    names = set()
+    _collect_names(ast, names)
+    # Drop variables that the template assigns itself (such as loop
+    # variables), and Jinja's globals
+    undeclared = meta.find_undeclared_variables(ast)
+    return frozenset(
+        name for name in names
+        if name.partition('.')[0] in undeclared
+        and name.partition('.')[0] not in jinja_env.globals)
+
+
+def _collect_names(node, names):
+    if isinstance(node, (nodes.Getattr, nodes.Getitem)) \
+            and isinstance(node.node, nodes.Name) \
+            and node.node.ctx == 'load':
+        if isinstance(node, nodes.Getattr):
+            key = node.attr
+        elif isinstance(node.arg, nodes.Const) \
+                and isinstance(node.arg.value, str):
+            key = node.arg.value
+        else:
+            key = None
+        if key is not None:
+            names.add('{0}.{1}'.format(node.node.name, key))
+            return
+
+    if isinstance(node, nodes.Call) and isinstance(node.node, nodes.Getattr) \
+            and isinstance(node.node.node, nodes.Name):
+        # A method call, like cookiecutter.items(), uses the whole variable
+        names.add(node.node.node.name)
+        for child in node.iter_child_nodes(exclude=('node',)):
+            _collect_names(child, names)
+        return
+
+    if isinstance(node, nodes.Name) and node.ctx == 'load':
+        names.add(node.name)
+
+    for child in node.iter_child_nodes():
+        _collect_names(child, names)
+
+
+class TemplateCache:
+    """Cache of compiled cell templates, keyed by a hash of the cell source.
+
+    Parameters
+    ----------
+    max_entries : int, optional
+        Maximum number of compiled templates kept in memory. When the cache
+        is full, the least-recently used template is evicted.
+    directory : `pathlib.Path` or `str`, optional
+        Directory of an on-disk Jinja bytecode cache, which persists compiled
+        templates between processes. Usually this is
+        `nbreport.repo.ReportRepo.template_cache_dir`. If `None`, templates
+        are only cached in memory.
+    max_size : int, optional
+        Maximum size of the on-disk cache, in bytes. When a new entry makes
+        the cache larger than this, the least-recently used entries are
+        evicted.
+
+    Notes
+    -----
+    The cache stores the Python code that Jinja compiles a template to,
+    rather than template objects, so a compiled template is shared by every
+    Jinja environment with the same syntax settings and extensions. Entries
+    in the on-disk cache are ignored if they were written by a different
+    version of Jinja or Python.
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, max_entries=1024, directory=None, max_size=2 ** 24):
+        super().__init__()
+        self._max_entries = max_entries
+        self._codes = OrderedDict()
+        self._lock = threading.Lock()
+        if directory is None:
+            self._bytecode_cache = None
+        else:
+            self._bytecode_cache = _BoundedBytecodeCache(directory, max_size)
+
+    def __repr__(self):
+        if self._bytecode_cache is None:
+            return '{0}()'.format(self.__class__.__name__)
+        return "{0}('{1!s}')".format(self.__class__.__name__,
+                                     self._bytecode_cache.directory)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._codes)
+
+    @property
+    def directory(self):
+        """Directory of the on-disk cache (`pathlib.Path`), or `None` if
+        templates are only cached in memory.
+        """
+        if self._bytecode_cache is None:
+            return None
+        return Path(self._bytecode_cache.directory)
+
+    def get_template(self, source, jinja_env):
+        """Get the compiled template for a cell source.
+
+        Parameters
+        ----------
+        source : `str`
+            Source of the template (a cell's ``source``).
+        jinja_env : `jinja2.Environment`
+            The Jinja environment that renders the template.
+
+        Returns
+        -------
+        template : `jinja2.Template`
+            The template, bound to ``jinja_env``.
+        """
+        key = _compute_template_key(source, jinja_env)
+        with self._lock:
+            code = self._codes.get(key)
+            if code is not None:
+                self._codes.move_to_end(key)
+
+        if code is None:
+            code = self._load_code(key, source, jinja_env)
+            with self._lock:
+                self._codes[key] = code
+                while len(self._codes) > self._max_entries:
+                    self._codes.popitem(last=False)
+
+        return jinja_env.template_class.from_code(
+            jinja_env, code, jinja_env.make_globals(None))
+
+    def clear(self):
+        """Remove all templates from the cache, including the on-disk cache.
+        """
+        with self._lock:
+            self._codes.clear()
+        if self._bytecode_cache is not None and self.directory.is_dir():
+            self._bytecode_cache.clear()
+
+    def _load_code(self, key, source, jinja_env):
+        if self._bytecode_cache is None:
+            return jinja_env.compile(source)
+
+        bucket = self._bytecode_cache.get_bucket(jinja_env, key, None, source)
+        if bucket.code is None:
+            bucket.code = jinja_env.compile(source)
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._bytecode_cache.set_bucket(bucket)
+            except OSError as e:
+                self._logger.warning(
+                    'Could not write to the template cache in %s: %s',
+                    self.directory, e)
+        return bucket.code
+
+
+def _compute_template_key(source, jinja_env):
+    """Compute the cache key of a template.
+
+    Parameters
+    ----------
+    source : `str`
+        Source of the template.
+    jinja_env : `jinja2.Environment`
+        The Jinja environment that compiles the template.
+
+    Returns
+    -------
+    key : `str`
+        SHA-256 hash of the template source and of the environment settings
+        (syntax and extensions) that affect how it's compiled.
+    """
+    settings = [
+        jinja_env.block_start_string,
+        jinja_env.block_end_string,
+        jinja_env.variable_start_string,
+        jinja_env.variable_end_string,
+        jinja_env.comment_start_string,
+        jinja_env.comment_end_string,
+        str(jinja_env.line_statement_prefix),
+        str(jinja_env.line_comment_prefix),
+        str(jinja_env.trim_blocks),
+        str(jinja_env.lstrip_blocks),
+        jinja_env.newline_sequence,
+        str(jinja_env.keep_trailing_newline),
+        str(jinja_env.optimized),
+        str(jinja_env.is_async)
+    ]
+    settings.extend(sorted(jinja_env.extensions))
+    data = '\0'.join(settings + [source])
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class _BoundedBytecodeCache(FileSystemBytecodeCache):
+    """Jinja bytecode cache in a directory, with a maximum size.
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, directory, max_size):
+        super().__init__(str(directory), pattern='%s.jinja')
+        self._max_size = max_size
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        if bucket.code is not None:
+            # Refresh the entry's modification time to track its last use
+            try:
+                os.utime(self._get_cache_filename(bucket))
+            except OSError:
+                pass
+
+    def dump_bytecode(self, bucket):
+        super().dump_bytecode(bucket)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.jinja'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((entry.path, stat.st_size, stat.st_mtime))
+        total_size = sum(size for _, size, _ in entries)
+        if total_size <= self._max_size:
+            return
+        # Oldest (least-recently used) entries first
+        entries.sort(key=lambda entry: entry[2])
+        for path, size, _ in entries:
+            if total_size <= self._max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            self._logger.debug('Evicted template cache entry %s', path)
+
+
+_default_template_cache = TemplateCache()
+"""Cache of compiled templates shared by renders that don't provide their own
+`TemplateCache`.
+"""
+
+_template_index_cache = OrderedDict()
+"""Cache of `TemplateIndex` objects, keyed by a hash of the notebook's cell
+sources (see `index_notebook_templates`).
+"""
+
+_template_index_lock = threading.Lock()
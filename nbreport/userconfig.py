@@ -3,8 +3,9 @@ tokens).
 """
 
 __all__ = ('create_empty_config', 'read_config', 'get_config_path',
-           'write_config', 'insert_github_config')
+           'write_config', 'insert_github_config', 'get_cache_dir')
 
+import os
 from pathlib import Path
 
 import ruamel.yaml
@@ -91,6 +92,34 @@ def get_config_path(path=None):
     return path
 
 
+def get_cache_dir(path=None):
+    """Get the path to nbreport's cache directory.
+
+    By default, this directory is ``~/.cache/nbreport``, or
+    ``$XDG_CACHE_HOME/nbreport`` if the ``XDG_CACHE_HOME`` environment
+    variable is set.
+
+    Parameters
+    ----------
+    path : `str` or `pathlib.Path`, optional
+        An optional, user-provided, override of the default cache directory.
+
+    Returns
+    -------
+    path : `pathlib.Path`
+        Path to the cache directory (whether it exists, or not).
+    """
+    if path is None:
+        cache_home = os.getenv('XDG_CACHE_HOME')
+        if cache_home:
+            path = Path(cache_home) / 'nbreport'
+        else:
+            path = Path.home() / '.cache' / 'nbreport'
+    else:
+        path = Path(path)
+    return path
+
+
 def insert_github_config(config, username, token, token_note=None):
     """Insert a ``github`` field into the configuration data with GitHub
     authentication information (username and personal access token).
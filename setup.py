@@ -58,8 +58,16 @@ docs_require = [
     'documenteer[pipelines]>=0.5.0,<0.6.0',
     'sphinx-click',
 ]
+memory_require = [
+    'psutil',
+]
+zstd_require = [
+    'zstandard',
+]
 extras_require = {
-    'dev': docs_require + tests_require
+    'memory': memory_require,
+    'zstd': zstd_require,
+    'dev': docs_require + tests_require + memory_require + zstd_require
 }
 
 
@@ -1,12 +1,24 @@
 """Pytest test fixtures.
 """
 
+import os
 from pathlib import Path
+import shutil
 
 from click.testing import CliRunner
 import pytest
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(tmpdir, monkeypatch):
+    """Isolate nbreport's cache directory (``~/.cache/nbreport``) in a
+    temporary directory for each test.
+    """
+    cache_home = Path(str(tmpdir)) / 'cache-home'
+    monkeypatch.setenv('XDG_CACHE_HOME', str(cache_home))
+    return cache_home / 'nbreport'
+
+
 @pytest.fixture()
 def write_user_config():
     """Creates a callable that writes a mock .nbreport.yaml file into the
@@ -24,28 +36,40 @@ def write_user_config():
     return _write_user_config
 
 
-@pytest.fixture()
-def testr_000_path():
-    """Path to the TESTR-000 report repository.
+def _copy_report_repo(tmpdir, name):
+    """Copy a report repository into the ``tests`` directory of a Git
+    working tree in a temporary directory, so that the caches nbreport keeps
+    in the Git directory aren't written to this package's own checkout.
     """
-    path = Path(__file__).parent / 'TESTR-000'
+    import git
+
+    work_path = Path(str(tmpdir)) / 'reports'
+    if not (work_path / '.git').exists():
+        git.Repo.init(str(work_path))
+    path = work_path / 'tests' / name
+    shutil.copytree(str(Path(__file__).parent / name), str(path))
     return path.resolve()
 
 
 @pytest.fixture()
-def testr_001_path():
-    """Path to the TESTR-001 report repository.
+def testr_000_path(tmpdir):
+    """Path to a copy of the TESTR-000 report repository.
     """
-    path = Path(__file__).parent / 'TESTR-001'
-    return path.resolve()
+    return _copy_report_repo(tmpdir, 'TESTR-000')
 
 
 @pytest.fixture()
-def testr_002_path():
-    """Path to the TESTR-002 report repository.
+def testr_001_path(tmpdir):
+    """Path to a copy of the TESTR-001 report repository.
     """
-    path = Path(__file__).parent / 'TESTR-002'
-    return path.resolve()
+    return _copy_report_repo(tmpdir, 'TESTR-001')
+
+
+@pytest.fixture()
+def testr_002_path(tmpdir):
+    """Path to a copy of the TESTR-002 report repository.
+    """
+    return _copy_report_repo(tmpdir, 'TESTR-002')
 
 
 @pytest.fixture()
@@ -70,3 +94,158 @@ def fake_registration():
         repo.config['ltd_url'] = ltd_url
 
     return _fake_registration
+
+
+@pytest.fixture()
+def git_remote(tmpdir, testr_000_path, testr_002_path):
+    """A bare Git repository on disk, standing in for a remote monorepo that
+    contains the TESTR-000 and TESTR-002 report repositories in ``tests/``,
+    unrelated large files, and a large file in its history.
+
+    Returns the ``file://`` URL of the repository.
+    """
+    import git
+
+    work_path = Path(str(tmpdir)) / 'monorepo'
+    (work_path / 'tests').mkdir(parents=True)
+    repo = git.Repo.init(str(work_path))
+    with repo.config_writer() as writer:
+        writer.set_value('user', 'name', 'nbreport')
+        writer.set_value('user', 'email', 'nbreport@example.com')
+    actor = git.Actor('nbreport', 'nbreport@example.com')
+
+    # A large file in the history only
+    (work_path / 'old.bin').write_bytes(os.urandom(2 ** 20))
+    repo.index.add(['old.bin'])
+    repo.index.commit('Add old data', author=actor, committer=actor)
+    repo.index.remove(['old.bin'], working_tree=True)
+
+    for path in (testr_000_path, testr_002_path):
+        shutil.copytree(str(path), str(work_path / 'tests' / path.name))
+    (work_path / 'big').mkdir()
+    (work_path / 'big' / 'data.bin').write_bytes(os.urandom(2 ** 20))
+    (work_path / 'tests' / 'TESTR-002' / 'scratch.bin').write_bytes(
+        os.urandom(2 ** 18))
+    repo.git.add(A=True)
+    repo.index.commit('Add reports', author=actor, committer=actor)
+    repo.git.branch('-M', 'master')
+
+    bare_path = Path(str(tmpdir)) / 'remote.git'
+    bare_repo = repo.clone(str(bare_path), bare=True)
+    # Allow partial clones, as GitHub does
+    bare_repo.git.config('uploadpack.allowFilter', 'true')
+    return bare_path.as_uri()
+
+
+@pytest.fixture()
+def api_server():
+    """A local HTTP/1.1 server, standing in for the nbreport API server, that
+    records the requests it receives and the connections they used.
+
+    The server reserves instances (``POST .../instances/``) and accepts
+    notebook uploads (``POST .../notebook``). Statuses appended to its
+    ``statuses`` list are returned, in order, instead of the normal
+    responses. Requests are recorded in its ``requests`` list as `dict`
+    with ``method``, ``path``, ``headers``, ``connection`` (the connection's
+    number), ``size`` (the number of body bytes received), and ``content``
+    (the SHA-256 hash of the body, decoded according to its
+    ``Content-Encoding``) keys. Bodies are read in chunks, and not kept in
+    memory.
+
+    Returns the server, whose ``url`` attribute is its base URL.
+    """
+    import hashlib
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    import itertools
+    import json
+    from socketserver import ThreadingMixIn
+    import threading
+    import zlib
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            self.connection_number = next(self.server.connection_numbers)
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.do_POST()
+
+        def do_POST(self):
+            encoding = self.headers.get('Content-Encoding', 'identity')
+            if encoding == 'gzip':
+                decompress = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress
+            elif encoding == 'zstd':
+                import zstandard
+                decompress = \
+                    zstandard.ZstdDecompressor().decompressobj().decompress
+            else:
+                decompress = bytes
+            size = 0
+            content_hash = hashlib.sha256()
+            for chunk in self._iter_body():
+                size += len(chunk)
+                content_hash.update(decompress(chunk))
+            self.server.requests.append({
+                'method': self.command,
+                'path': self.path,
+                'headers': self.headers,
+                'size': size,
+                'content': content_hash.hexdigest(),
+                'connection': self.connection_number})
+
+            if self.server.statuses:
+                status = self.server.statuses.pop(0)
+                data = {}
+            elif self.path.endswith('/instances/'):
+                status = 201
+                instance_id = str(len(self.server.requests))
+                data = {
+                    'instance_id': instance_id,
+                    'published_url': 'https://testr-000.lsst.io/v/'
+                                     + instance_id,
+                    'ltd_edition_url': 'https://keeper.lsst.codes/editions/'
+                                       + instance_id}
+            else:
+                status = 202
+                data = {'queue_url': 'https://example.com/queue/12345'}
+            content = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def _iter_body(self):
+            if self.headers.get('Transfer-Encoding') == 'chunked':
+                while True:
+                    size = int(self.rfile.readline().split(b';')[0], 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        return
+                    yield self.rfile.read(size)
+                    self.rfile.readline()
+            else:
+                remaining = int(self.headers.get('Content-Length', 0))
+                while remaining > 0:
+                    chunk = self.rfile.read(min(remaining, 2 ** 16))
+                    remaining -= len(chunk)
+                    yield chunk
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    server.url = 'http://127.0.0.1:{0:d}'.format(server.server_address[1])
+    server.requests = []
+    server.statuses = []
+    server.connection_numbers = itertools.count()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,97 @@
+"""Tests for the nbreport.assets module.
+"""
+
+from pathlib import Path
+
+import pytest
+
+import nbreport.assets
+from nbreport.assets import (AssetResolver, read_asset_manifest,
+                             write_asset_manifest)
+
+
+@pytest.fixture
+def asset_tree(tmpdir):
+    """A repository with data files in several directories.
+    """
+    root = Path(str(tmpdir)) / 'repo'
+    for relpath in ('1.txt', 'a/2.txt', 'a/b/3.txt', 'a/b/4.csv',
+                    'data/x.fits', 'data/skip/y.fits', 'notes.md',
+                    '.git/config.txt'):
+        path = root / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(relpath)
+    return root
+
+
+def _relpaths(root, paths):
+    return [path.relative_to(root).as_posix() for path in paths]
+
+
+def test_resolve(asset_tree):
+    """Globs, files, and directories match like the nbreport.yaml reference
+    describes, and each file is found once.
+    """
+    resolver = AssetResolver(['**/*.txt', 'a/*.txt', 'notes.md', 'data/',
+                              'missing.csv'])
+    paths = resolver.resolve(asset_tree)
+    assert _relpaths(asset_tree, paths) == [
+        '1.txt', 'a/2.txt', 'a/b/3.txt', 'data/skip/y.fits', 'data/x.fits',
+        'notes.md']
+
+
+def test_resolve_exclude(asset_tree):
+    """Exclude rules remove matched files.
+    """
+    resolver = AssetResolver(['a', 'data'],
+                             exclude=['**/*.csv', 'data/skip'])
+    paths = resolver.resolve(asset_tree)
+    assert _relpaths(asset_tree, paths) == [
+        'a/2.txt', 'a/b/3.txt', 'data/x.fits']
+    assert resolver.match('a/b/3.txt')
+    assert not resolver.match('a/b/4.csv')
+
+
+@pytest.mark.parametrize('pattern', ['/etc/passwd', '../other', '.'])
+def test_invalid_rule(pattern):
+    """Rules must be relative paths inside the repository.
+    """
+    with pytest.raises(ValueError):
+        AssetResolver([pattern])
+
+
+def test_manifest(asset_tree, tmpdir, monkeypatch):
+    """Files that are unchanged since a previous manifest aren't hashed
+    again.
+    """
+    resolver = AssetResolver(['a'])
+    manifest = resolver.build_manifest(asset_tree)
+    assert [entry.path for entry in manifest] == ['a/2.txt', 'a/b/3.txt',
+                                                  'a/b/4.csv']
+    assert manifest[0].size == len('a/2.txt')
+    assert len(manifest[0].sha256) == 64
+
+    manifest_path = Path(str(tmpdir)) / 'cache' / 'assets.json'
+    write_asset_manifest(manifest, manifest_path)
+    previous = read_asset_manifest(manifest_path)
+    assert previous == manifest
+
+    hashed = []
+    original_hash_file = nbreport.assets._hash_file
+
+    def counting_hash_file(path):
+        hashed.append(path)
+        return original_hash_file(path)
+
+    monkeypatch.setattr(nbreport.assets, '_hash_file', counting_hash_file)
+    (asset_tree / 'a' / '2.txt').write_text('changed')
+    new_manifest = resolver.build_manifest(asset_tree, previous=previous)
+    assert hashed == [asset_tree / 'a' / '2.txt']
+    assert new_manifest[0].sha256 != manifest[0].sha256
+    assert new_manifest[1:] == manifest[1:]
+
+
+def test_read_missing_manifest(tmpdir):
+    """A missing manifest is empty.
+    """
+    assert read_asset_manifest(Path(str(tmpdir)) / 'assets.json') == []
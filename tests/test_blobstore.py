@@ -0,0 +1,117 @@
+"""Tests for the nbreport.blobstore module.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+import time
+
+import pytest
+
+from nbreport.blobstore import BlobStore
+
+
+@pytest.fixture
+def store(tmpdir):
+    return BlobStore(Path(str(tmpdir)) / 'blobs')
+
+
+def test_default_directory(cache_dir):
+    assert BlobStore().directory == cache_dir / 'blobs'
+
+
+def test_add_and_link(tmpdir, store):
+    """Files with the same content are stored once and linked into
+    instances.
+    """
+    paths = [Path(str(tmpdir)) / name for name in ('a.txt', 'b.txt')]
+    for path in paths:
+        path.write_text('content')
+    expected = hashlib.sha256(b'content').hexdigest()
+
+    assert store.add(paths[0]) == expected
+    assert store.add(paths[1]) == expected
+    blob_path = store.blob_path(expected)
+    assert blob_path.read_text() == 'content'
+    assert len([path for path in store.directory.glob('*/*')
+                if path.suffix != '.used']) == 1
+    assert not os.access(str(blob_path), os.W_OK) or os.getuid() == 0
+
+    dest = Path(str(tmpdir)) / 'instance.txt'
+    dest.write_text('old')
+    store.link(expected, dest)
+    assert os.path.samefile(str(blob_path), str(dest))
+
+
+def test_add_known_hash(tmpdir, store):
+    """A file whose hash is given isn't read if its blob exists.
+    """
+    path = Path(str(tmpdir)) / 'a.txt'
+    path.write_text('content')
+    sha256 = store.add(path)
+    path.unlink()
+    assert store.add(path, sha256=sha256) == sha256
+
+
+def test_add_stale_hash(tmpdir, store, caplog):
+    """A file that changed since it was hashed is stored under the hash of
+    its content.
+    """
+    path = Path(str(tmpdir)) / 'a.txt'
+    path.write_text('old')
+    old_sha256 = hashlib.sha256(b'old').hexdigest()
+    path.write_text('new')
+
+    sha256 = store.add(path, sha256=old_sha256)
+    assert sha256 == hashlib.sha256(b'new').hexdigest()
+    assert store.blob_path(sha256).read_text() == 'new'
+    assert not store.blob_path(old_sha256).exists()
+    assert 'has changed since it was hashed' in caplog.text
+
+
+def test_add_keeps_linked_mtime(tmpdir, store):
+    """Reusing a blob doesn't change the modification time of the instance
+    files that link it, and keeps it from garbage collection.
+    """
+    path = Path(str(tmpdir)) / 'a.txt'
+    path.write_text('content')
+    sha256 = store.add(path)
+    old = time.time() - 7200
+    os.utime(str(store.blob_path(sha256)), (old, old))
+
+    assert store.add(path, sha256=sha256) == sha256
+    assert store.blob_path(sha256).stat().st_mtime == old
+    assert store.gc() == {'count': 0, 'size': 0, 'kept': 1}
+
+    use_path = Path(str(store.blob_path(sha256)) + '.used')
+    os.utime(str(use_path), (old, old))
+    assert store.gc() == {'count': 1, 'size': 7, 'kept': 0}
+    assert not use_path.exists()
+
+
+def test_gc(tmpdir, store):
+    """Blobs that aren't linked from an instance are removed once they're
+    old enough.
+    """
+    paths = []
+    for name in ('a', 'b'):
+        path = Path(str(tmpdir)) / name
+        path.write_text(name * 10)
+        paths.append(path)
+    linked = store.add(paths[0])
+    unlinked = store.add(paths[1])
+    store.link(linked, Path(str(tmpdir)) / 'instance')
+
+    assert store.gc() == {'count': 0, 'size': 0, 'kept': 2}
+
+    old = time.time() - 7200
+    os.utime(str(store.blob_path(unlinked)), (old, old))
+    assert store.gc(dry_run=True) == {'count': 1, 'size': 10, 'kept': 1}
+    assert store.blob_path(unlinked).exists()
+    assert store.gc() == {'count': 1, 'size': 10, 'kept': 1}
+    assert not store.blob_path(unlinked).exists()
+    assert store.blob_path(linked).exists()
+
+
+def test_gc_empty(store):
+    assert store.gc() == {'count': 0, 'size': 0, 'kept': 0}
@@ -0,0 +1,129 @@
+"""Tests for the nbreport.cellcache module.
+"""
+
+import os
+
+import nbformat
+
+from nbreport.cellcache import CellCache, compute_cell_keys
+from nbreport.compute import compute_notebook
+
+
+def _make_notebook(*sources, tags=None):
+    notebook = nbformat.v4.new_notebook()
+    for i, source in enumerate(sources):
+        cell = nbformat.v4.new_code_cell(source)
+        if tags and tags[i]:
+            cell.metadata['tags'] = [tags[i]]
+        notebook.cells.append(cell)
+    return notebook
+
+
+def test_cell_keys():
+    """Keys are chained through code cells, and ignore Markdown cells.
+    """
+    nb1 = _make_notebook('a = 1', 'b = 2')
+    nb2 = _make_notebook('a = 10', 'b = 2')
+    nb3 = _make_notebook('a = 1', 'b = 2')
+    nb3.cells.insert(1, nbformat.v4.new_markdown_cell('# Hello'))
+
+    keys1 = compute_cell_keys(nb1)
+    keys2 = compute_cell_keys(nb2)
+    keys3 = compute_cell_keys(nb3)
+
+    assert keys1[0] != keys2[0]
+    assert keys1[1] != keys2[1]  # an upstream cell changed
+    assert keys3[1] is None
+    assert keys3[0] == keys1[0]
+    assert keys3[2] == keys1[1]
+    assert compute_cell_keys(nb1, kernel_name='other')[0] != keys1[0]
+
+
+def test_get_put_evict(tmpdir):
+    """Test storing entries and evicting the least-recently used.
+    """
+    cache = CellCache(directory=str(tmpdir), max_size=400)
+    cell = nbformat.v4.new_code_cell('print(1)', execution_count=1)
+    cell.outputs.append(nbformat.v4.new_output('stream', text='x' * 100))
+
+    assert cache.get('aa11') is None
+    cache.put('aa11', cell)
+    entry = cache.get('aa11')
+    assert entry['execution_count'] == 1
+    assert entry['outputs'][0].text == 'x' * 100
+
+    for key in ('bb22', 'cc33', 'dd44'):
+        cache.put(key, cell)
+    assert cache.get('aa11') is None
+    assert cache.get('dd44') is not None
+
+    cache.clear()
+    assert cache.get('dd44') is None
+
+
+def test_put_scans_only_over_limit(tmpdir, monkeypatch):
+    """Test that storing entries only scans the cache directory once, until
+    the cache is full.
+    """
+    cache = CellCache(directory=str(tmpdir), max_size=1000)
+    cell = nbformat.v4.new_code_cell('print(1)', execution_count=1)
+    cell.outputs.append(nbformat.v4.new_output('stream', text='x' * 100))
+
+    scans = []
+    list_entries = cache._list_entries
+
+    def count_scans():
+        scans.append(None)
+        return list_entries()
+
+    monkeypatch.setattr(cache, '_list_entries', count_scans)
+    for key in ('aa11', 'bb22', 'cc33'):
+        cache.put(key, cell)
+    # Replacing an entry doesn't grow the cache
+    cache.put('aa11', cell)
+    assert len(scans) == 1
+
+    for key in ('dd44', 'ee55', 'ff66', 'gg77', 'hh88'):
+        cache.put(key, cell)
+    assert len(scans) > 1
+    assert sum(os.path.getsize(path)
+               for path, _, _ in list_entries()) <= 1000
+
+
+def test_compute_replays_all_cells(tmpdir):
+    """If every code cell is cached, outputs are replayed without executing.
+    """
+    cache = CellCache(directory=str(tmpdir))
+    source = 'import uuid\nprint(uuid.uuid4())'
+
+    nb1 = compute_notebook(_make_notebook(source), cell_cache=cache)
+    nb2 = _make_notebook(source)
+    nb2.cells.insert(0, nbformat.v4.new_markdown_cell('# New heading'))
+    nb2 = compute_notebook(nb2, cell_cache=cache)
+    assert nb2.cells[1].outputs[0].text == nb1.cells[0].outputs[0].text
+    assert nb1.metadata['nbreport']['compute']['replayed'] is False
+    summary = nb2.metadata['nbreport']['compute']
+    assert summary['replayed'] is True
+    assert summary['kernel_startup_time'] is None
+    assert summary['slowest_cells'] == []
+
+
+def test_compute_resumes_after_state_setup(tmpdir):
+    """With state-setup tags, only tagged cells and changed cells execute.
+    """
+    cache = CellCache(directory=str(tmpdir))
+    sources = ['x = 40',
+               'import uuid\nprint(uuid.uuid4())',
+               'print(x + 2)']
+    tags = ['state-setup', None, None]
+
+    nb1 = compute_notebook(_make_notebook(*sources, tags=tags),
+                           cell_cache=cache)
+
+    sources[2] = 'print(x + 1)'
+    nb2 = compute_notebook(_make_notebook(*sources, tags=tags),
+                           cell_cache=cache)
+    # Replayed
+    assert nb2.cells[1].outputs[0].text == nb1.cells[1].outputs[0].text
+    # Executed, with the state from the "state-setup" cell
+    assert nb2.cells[2].outputs[0].text == '41\n'
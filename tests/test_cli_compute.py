@@ -25,7 +25,111 @@ def test_compute_command(testr_000_path, runner):
         ]
         result = runner.invoke(nbreport.cli.main.main, args)
         assert result.exit_code == 0
+        assert 'Slowest cells' in result.output
 
         # Check that the notebook was computed and saved
         nb = instance.open_notebook()
         assert nb.cells[1].outputs[0].text == 'The answer is 42\n'
+
+
+def test_compute_command_kernel_pool(testr_000_path, runner):
+    """Test the nbreport compute command with a kernel pool.
+    """
+    with runner.isolated_filesystem():
+        repo = ReportRepo(testr_000_path)
+        instance = create_instance(
+            repo,
+            instance_id='test',
+            template_variables={},
+            instance_path=Path('TESTR-000-test'))
+
+        args = [
+            'compute',  # subcommand
+            str(instance.dirname),  # first argument
+            '--kernel-pool-size', '1',
+            '--kernel-max-uses', '2',
+        ]
+        result = runner.invoke(nbreport.cli.main.main, args)
+        assert result.exit_code == 0
+
+        nb = instance.open_notebook()
+        assert nb.cells[1].outputs[0].text == 'The answer is 42\n'
+
+
+def test_compute_command_fork_server(testr_000_path, runner):
+    """Test the nbreport compute command with a fork server, preloading the
+    modules listed in nbreport.yaml.
+    """
+    with runner.isolated_filesystem():
+        repo = ReportRepo(testr_000_path)
+        instance = create_instance(
+            repo,
+            instance_id='test',
+            template_variables={},
+            instance_path=Path('TESTR-000-test'))
+        instance.config['preload'] = ['json']
+
+        args = [
+            'compute',  # subcommand
+            str(instance.dirname),  # first argument
+            '--fork-server',
+        ]
+        result = runner.invoke(nbreport.cli.main.main, args)
+        assert result.exit_code == 0
+
+        nb = instance.open_notebook()
+        assert nb.cells[1].outputs[0].text == 'The answer is 42\n'
+
+
+def test_compute_command_batch(testr_000_path, runner):
+    """Test the nbreport compute command with several instances computed
+    concurrently, including one that fails.
+    """
+    with runner.isolated_filesystem():
+        repo = ReportRepo(testr_000_path)
+        instances = [
+            create_instance(repo, instance_id=str(i),
+                            template_variables={'a': str(i)},
+                            instance_path=Path('TESTR-000-{}'.format(i)))
+            for i in range(1, 3)
+        ]
+        broken = create_instance(repo, instance_id='broken',
+                                 template_variables={'a': 'undefined_name'},
+                                 instance_path=Path('TESTR-000-broken'))
+        Path('manifest.txt').write_text(str(broken.dirname) + '\n')
+
+        args = ['compute', '--jobs', '2', '--manifest', 'manifest.txt']
+        args.extend(str(instance.dirname) for instance in instances)
+        result = runner.invoke(nbreport.cli.main.main, args)
+        print(result.output)
+        assert result.exit_code == 1
+        assert '1 of 3 instances failed' in result.output
+        assert 'FAILED' in result.output
+
+        for i, instance in enumerate(instances, start=1):
+            nb = instance.open_notebook()
+            assert nb.cells[1].outputs[0].text \
+                == 'The answer is {}\n'.format(i + 32)
+
+
+def test_compute_command_cache(testr_000_path, runner, cache_dir):
+    """The cell cache is only used with --cache.
+    """
+    with runner.isolated_filesystem():
+        repo = ReportRepo(testr_000_path)
+        instance = create_instance(
+            repo,
+            instance_id='test',
+            template_variables={},
+            instance_path=Path('TESTR-000-test'))
+
+        args = ['compute', str(instance.dirname)]
+        result = runner.invoke(nbreport.cli.main.main, args)
+        assert result.exit_code == 0
+        assert not (cache_dir / 'cells').exists()
+
+        for _ in range(2):
+            result = runner.invoke(nbreport.cli.main.main, args + ['--cache'])
+            assert result.exit_code == 0
+        summary = instance.open_notebook().metadata['nbreport']['compute']
+        assert summary['replayed'] is True
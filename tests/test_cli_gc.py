@@ -0,0 +1,28 @@
+"""Test the nbreport gc command.
+"""
+
+import os
+from pathlib import Path
+import time
+
+from nbreport.blobstore import BlobStore
+import nbreport.cli.main
+
+
+def test_gc_command(runner, cache_dir):
+    store = BlobStore()
+    with runner.isolated_filesystem():
+        Path('asset.txt').write_text('content')
+        sha256 = store.add('asset.txt')
+        old = time.time() - 7200
+        os.utime(str(store.blob_path(sha256)), (old, old))
+
+        result = runner.invoke(nbreport.cli.main.main, ['gc', '--dry-run'])
+        assert result.exit_code == 0
+        assert 'Would remove 1 unreferenced blobs' in result.output
+        assert store.blob_path(sha256).exists()
+
+        result = runner.invoke(nbreport.cli.main.main, ['gc'])
+        assert result.exit_code == 0
+        assert 'Removed 1 unreferenced blobs' in result.output
+        assert not store.blob_path(sha256).exists()
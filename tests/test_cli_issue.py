@@ -73,3 +73,112 @@ def test_issue(write_user_config, testr_000_path, runner,
             "- Date: 2018-07-18"
         )
         assert nb.cells[1].outputs[0].text == 'The answer is 300\n'
+
+
+@responses.activate
+def test_issue_matrix(write_user_config, testr_000_path, runner,
+                      fake_registration):
+    """Test issuing a parameter sweep with a --matrix YAML file.
+    """
+    for instance_id in ('1', '2'):
+        responses.add(
+            responses.POST,
+            'https://api.lsst.codes/nbreport/reports/testr-000/instances/',
+            json={
+                'instance_id': instance_id,
+                'ltd_edition_url': 'https://keeper.lsst.codes/editions/1',
+                'published_url': 'https://testr-000.lsst.io/v/' + instance_id
+            },
+            status=201)
+        responses.add(
+            responses.POST,
+            'https://api.lsst.codes/nbreport/reports/testr-000/'
+            'instances/{}/notebook'.format(instance_id),
+            json={
+                'queue_url': 'https://example.com/queue/' + instance_id
+            },
+            status=202)
+
+    with runner.isolated_filesystem():
+        repo_path = Path.cwd() / 'TESTR-000'
+        shutil.copytree(str(testr_000_path), str(repo_path))
+        repo = ReportRepo(repo_path)
+        fake_registration(repo)
+        write_user_config('.nbreport.yaml')
+        Path('matrix.yaml').write_text('- a: 1\n- a: 2\n')
+
+        args = [
+            '--config-file', '.nbreport.yaml',
+            'issue',  # subcommand
+            str(repo_path),  # first argument
+            '--matrix', 'matrix.yaml',
+            '--jobs', '2',
+            '-c', 'b', '10',
+        ]
+        result = runner.invoke(nbreport.cli.main.main, args)
+        print(result.output)
+        assert result.exit_code == 0
+        assert 'TESTR-000-1' in result.output
+        assert 'TESTR-000-2' in result.output
+
+        upload_bodies = {
+            call.request.url.split('/')[-2]: call.request.body
+            for call in responses.calls
+            if call.request.url.endswith('/notebook')}
+        for instance_id, answer in (('1', 11), ('2', 12)):
+            nb = nbformat.reads(upload_bodies[instance_id].decode('utf-8'),
+                                as_version=nbformat.NO_CONVERT)
+            assert nb.cells[1].outputs[0].text \
+                == 'The answer is {}\n'.format(answer)
+
+
+@responses.activate
+def test_issue_matrix_upload_failure(write_user_config, testr_000_path,
+                                     runner, fake_registration):
+    """An instance that fails to upload is reported as a failed row of the
+    sweep, and doesn't stop the other instances from being uploaded.
+    """
+    for instance_id, status in (('1', 500), ('2', 202)):
+        responses.add(
+            responses.POST,
+            'https://api.lsst.codes/nbreport/reports/testr-000/instances/',
+            json={
+                'instance_id': instance_id,
+                'ltd_edition_url': 'https://keeper.lsst.codes/editions/1',
+                'published_url': 'https://testr-000.lsst.io/v/' + instance_id
+            },
+            status=201)
+        responses.add(
+            responses.POST,
+            'https://api.lsst.codes/nbreport/reports/testr-000/'
+            'instances/{}/notebook'.format(instance_id),
+            json={
+                'queue_url': 'https://example.com/queue/' + instance_id
+            },
+            status=status)
+
+    with runner.isolated_filesystem():
+        repo_path = Path.cwd() / 'TESTR-000'
+        shutil.copytree(str(testr_000_path), str(repo_path))
+        repo = ReportRepo(repo_path)
+        fake_registration(repo)
+        write_user_config('.nbreport.yaml')
+        Path('matrix.yaml').write_text('- a: 1\n- a: 2\n')
+
+        args = [
+            '--config-file', '.nbreport.yaml',
+            'issue',  # subcommand
+            str(repo_path),  # first argument
+            '--matrix', 'matrix.yaml',
+            '-c', 'b', '10',
+        ]
+        result = runner.invoke(nbreport.cli.main.main, args)
+        print(result.output)
+        assert result.exit_code == 1
+        lines = result.output.splitlines()
+        assert any('FAILED' in line and 'TESTR-000-1' in line
+                   for line in lines)
+        assert any('issued' in line and 'TESTR-000-2' in line
+                   for line in lines)
+        assert '1 of 2 instances failed to issue' in result.output
+        assert responses.calls[-1].request.url.endswith('/2/notebook')
@@ -1,6 +1,8 @@
 """Test the nbreport test CLI (nbreport.cli.test).
 """
 
+from pathlib import Path
+
 import nbreport.cli.main
 from nbreport.instance import ReportInstance
 
@@ -81,3 +83,109 @@ def test_from_git_clone(runner):
         print(result.output)
 
         assert result.exit_code == 0
+
+
+def test_from_local_git_clone(runner, git_remote):
+    """Test creating an instance from a sparse clone of a Git repository.
+    """
+    with runner.isolated_filesystem():
+        args = [
+            'test',  # subcommand
+            git_remote,
+            '--git-subdir', 'tests/TESTR-000',
+            '--git-clone', 'sparse',
+            '-c', 'a', '100',
+            '-c', 'b', '200',
+        ]
+        result = runner.invoke(nbreport.cli.main.main, args)
+        print(result.output)
+
+        assert result.exit_code == 0
+        assert Path('TESTR-000-test/TESTR-000.ipynb').exists()
+
+
+def test_git_cache(runner, git_remote, cache_dir):
+    """Test creating instances from a cached mirror of a Git repository.
+    """
+    with runner.isolated_filesystem():
+        args = [
+            'test',  # subcommand
+            git_remote,
+            '--git-subdir', 'tests/TESTR-000',
+            '--git-cache',
+            '-c', 'a', '100',
+            '-c', 'b', '200',
+        ]
+        for _ in range(2):
+            result = runner.invoke(nbreport.cli.main.main, args)
+            print(result.output)
+            assert result.exit_code == 0
+        assert len([path for path in (cache_dir / 'repos').iterdir()
+                    if path.is_dir()]) == 1
+
+
+def test_matrix_option(testr_000_path, runner):
+    """Test a parameter sweep with a --matrix CSV file, including a row that
+    fails to compute.
+    """
+    with runner.isolated_filesystem():
+        with open('matrix.csv', 'w') as fp:
+            fp.write('a,b\n1,2\n100,200\nundefined_name,1\n')
+        args = [
+            'test',  # subcommand
+            str(testr_000_path),  # first argument
+            '--matrix', 'matrix.csv',
+            '--jobs', '2',
+            '-c', 'b', '5',
+        ]
+        result = runner.invoke(nbreport.cli.main.main, args)
+        print(result.output)
+
+        assert result.exit_code == 1
+        assert '1 of 3 instances failed' in result.output
+        assert 'FAILED' in result.output
+
+        nb = ReportInstance('TESTR-000-test-1').open_notebook()
+        assert nb.cells[1].outputs[0].text == 'The answer is 3\n'
+        nb = ReportInstance('TESTR-000-test-2').open_notebook()
+        assert nb.cells[1].outputs[0].text == 'The answer is 300\n'
+
+
+def test_matrix_option_fork_server(testr_000_path, runner):
+    """Test a parameter sweep with --fork-server. TESTR-000 has no
+    fork-point cell, so each instance is computed in full.
+    """
+    with runner.isolated_filesystem():
+        with open('matrix.yaml', 'w') as fp:
+            fp.write('- a: 1\n- a: 2\n')
+        args = [
+            'test',  # subcommand
+            str(testr_000_path),  # first argument
+            '--matrix', 'matrix.yaml',
+            '--fork-server',
+        ]
+        result = runner.invoke(nbreport.cli.main.main, args)
+        print(result.output)
+        assert result.exit_code == 0
+
+        nb = ReportInstance('TESTR-000-test-2').open_notebook()
+        assert nb.cells[1].outputs[0].text == 'The answer is 34\n'
+
+
+def test_git_snapshot_unknown_ref(runner, git_remote):
+    """A Git ref that isn't in the repository is a usage error.
+    """
+    with runner.isolated_filesystem():
+        args = [
+            'test',  # subcommand
+            git_remote,
+            '--git-subdir', 'tests/TESTR-000',
+            '--git-ref', 'no-such-branch',
+            '--git-snapshot',
+        ]
+        result = runner.invoke(nbreport.cli.main.main, args)
+        print(result.output)
+
+        assert result.exit_code == 2
+        assert '--git-ref' in result.output
+        assert "Git ref 'no-such-branch' not found" in result.output
@@ -0,0 +1,89 @@
+"""Tests for the nbreport.clone module, using a local stand-in for a remote
+Git repository.
+"""
+
+import logging
+
+import git
+import pytest
+
+from nbreport.clone import (clone_repository, get_directory_size,
+                            resolve_git_ref)
+from nbreport.instance import ReportInstance
+from nbreport.repo import ReportRepo
+
+
+@pytest.mark.parametrize('strategy',
+                         ['full', 'shallow', 'blobless', 'sparse'])
+def test_git_clone(strategy, git_remote, tmpdir, caplog):
+    """Each strategy clones a working report repository.
+    """
+    caplog.set_level(logging.INFO, logger='nbreport.clone')
+    repo = ReportRepo.git_clone(git_remote, clone_base_dir=str(tmpdir),
+                                subdir='tests/TESTR-002', strategy=strategy)
+    assert repo.ipynb_path.exists()
+    assert 'Cloned {0}'.format(git_remote) in caplog.text
+    assert '{0} strategy'.format(strategy) in caplog.text
+
+    instance = ReportInstance.from_report_repo(
+        repo, tmpdir.join('instance'), '1')
+    assert (instance.dirname / 'a' / 'b' / '4.txt').exists()
+
+
+def test_clone_sizes(git_remote, tmpdir):
+    """Shallow and partial clones don't download the history's files, and
+    sparse clones only download the report's files.
+    """
+    sizes = {}
+    for strategy in ('full', 'shallow', 'blobless', 'sparse'):
+        clone_dir = tmpdir.join(strategy)
+        clone_repository(git_remote, clone_dir, strategy=strategy,
+                         subdir='tests/TESTR-002')
+        sizes[strategy] = get_directory_size(clone_dir.join('.git'))
+
+        assert clone_dir.join('tests', 'TESTR-002', 'nbreport.yaml').exists()
+        is_sparse = strategy == 'sparse'
+        assert clone_dir.join('big', 'data.bin').exists() != is_sparse
+        assert clone_dir.join('tests', 'TESTR-002', 'scratch.bin').exists() \
+            != is_sparse
+        assert clone_dir.join('tests', 'TESTR-000').exists() != is_sparse
+
+    assert sizes['full'] > 2 ** 21
+    assert 2 ** 20 < sizes['shallow'] < 2 ** 21
+    assert 2 ** 20 < sizes['blobless'] < 2 ** 21
+    assert sizes['sparse'] < 2 ** 18
+
+
+def test_unknown_strategy(git_remote, tmpdir):
+    with pytest.raises(ValueError):
+        clone_repository(git_remote, tmpdir.join('clone'), strategy='deep')
+
+
+def test_resolve_git_ref(git_remote, tmpdir):
+    """Branches and tags resolve to the commit they point to.
+    """
+    work_repo = git.Repo(str(tmpdir.join('monorepo')))
+    head_sha = work_repo.head.commit.hexsha
+    parent_sha = work_repo.head.commit.parents[0].hexsha
+    work_repo.create_tag('v1', ref=parent_sha, message='Version 1')
+    work_repo.create_tag('light', ref=parent_sha)
+    work_repo.git.push(git_remote, 'v1', 'light')
+
+    assert resolve_git_ref(git_remote, 'master') == head_sha
+    assert resolve_git_ref(git_remote, 'v1') == parent_sha
+    assert resolve_git_ref(git_remote, 'light') == parent_sha
+    assert resolve_git_ref(git_remote, parent_sha) == parent_sha
+    with pytest.raises(ValueError):
+        resolve_git_ref(git_remote, 'missing')
+
+
+@pytest.mark.parametrize('strategy', ['full', 'sparse'])
+def test_clone_commit(strategy, git_remote, tmpdir):
+    """A commit SHA can be checked out.
+    """
+    sha = resolve_git_ref(git_remote, 'master')
+    repo = ReportRepo.git_clone(git_remote, clone_base_dir=str(tmpdir),
+                                checkout=sha, subdir='tests/TESTR-000',
+                                strategy=strategy)
+    assert repo.git_commit == sha
+    assert repo.ipynb_path.exists()
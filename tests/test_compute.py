@@ -3,9 +3,13 @@
 
 from pathlib import Path
 
+from nbconvert.preprocessors import CellExecutionError
 import nbformat
+import pytest
 
-from nbreport.compute import compute_notebook_file
+from nbreport.compute import (compute_notebook, compute_notebook_file,
+                              compute_notebook_sweep, get_checkpoint_path,
+                              get_slowest_cells, FORK_POINT_TAG)
 
 
 def test_compute_notebook_file(tmpdir):
@@ -24,3 +28,149 @@ def test_compute_notebook_file(tmpdir):
 
     nb = nbformat.read(str(notebook_path), as_version=nbformat.NO_CONVERT)
     assert nb.cells[0].outputs[0]['data']['text/plain'] == '3'
+
+
+def test_compute_notebook_file_resume(tmpdir, monkeypatch):
+    """Test checkpointing a failed computation and resuming it.
+    """
+    monkeypatch.chdir(str(tmpdir))  # errored notebooks are written here
+    notebook_path = Path(str(tmpdir)) / 'notebook.ipynb'
+    marker_path = Path(str(tmpdir)) / 'ready'
+
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells.append(nbformat.v4.new_code_cell('x = 1\n'))
+    notebook.cells[0].metadata['tags'] = ['state-setup']
+    notebook.cells.append(
+        nbformat.v4.new_code_cell('import uuid\nprint(uuid.uuid4())\n'))
+    notebook.cells.append(
+        nbformat.v4.new_code_cell(
+            'import os\n'
+            'assert os.path.exists({0!r})\n'
+            'print(x + 1)\n'.format(str(marker_path))))
+    nbformat.write(notebook, str(notebook_path))
+
+    with pytest.raises(CellExecutionError):
+        compute_notebook_file(notebook_path, checkpoint=True)
+    checkpoint_path = get_checkpoint_path(notebook_path)
+    checkpoint = nbformat.read(str(checkpoint_path),
+                               as_version=nbformat.NO_CONVERT)
+    assert checkpoint.metadata['nbreport_checkpoint']['next_cell'] == 2
+    uuid_output = checkpoint.cells[1].outputs[0].text
+
+    marker_path.touch()
+    compute_notebook_file(notebook_path, resume=True)
+
+    nb = nbformat.read(str(notebook_path), as_version=nbformat.NO_CONVERT)
+    assert nb.cells[1].outputs[0].text == uuid_output
+    assert nb.cells[2].outputs[0].text == '2\n'
+    assert 'nbreport_checkpoint' not in nb.metadata
+    assert not checkpoint_path.exists()
+
+
+def test_compute_notebook_timing():
+    """Test the per-cell timing metadata and the notebook's timing summary.
+    """
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells.append(nbformat.v4.new_markdown_cell('# Timing'))
+    notebook.cells.append(nbformat.v4.new_code_cell('print("fast")'))
+    notebook.cells.append(
+        nbformat.v4.new_code_cell('import time\ntime.sleep(0.5)'))
+
+    notebook = compute_notebook(notebook, slowest_cell_count=1)
+
+    timing = notebook.cells[2].metadata['nbreport']
+    assert timing['wall_time'] >= 0.5
+    assert timing['queued'] <= timing['started'] <= timing['completed']
+    assert notebook.cells[1].metadata['nbreport']['output_bytes'] > 0
+    assert 'nbreport' not in notebook.cells[0].metadata
+
+    summary = notebook.metadata['nbreport']['compute']
+    assert summary['total_time'] >= 0.5
+    assert summary['kernel_startup_time'] > 0
+    assert summary['slowest_cells'] == [
+        {'index': 2, 'wall_time': timing['wall_time']}]
+    assert get_slowest_cells(notebook)[0][:2] == (2, timing['wall_time'])
+
+
+def _write_sweep_notebooks(dirname, values, fork_point=True):
+    log_path = Path(str(dirname)) / 'setup.log'
+    paths = []
+    for value in values:
+        instance_dir = Path(str(dirname)) / 'instance-{}'.format(value)
+        instance_dir.mkdir()
+        notebook = nbformat.v4.new_notebook()
+        # Records each execution of the shared setup
+        setup_cell = nbformat.v4.new_code_cell(
+            "with open({0!r}, 'a') as fp:\n"
+            "    fp.write('setup\\n')\n"
+            "base = 40\n"
+            "print('setup done')".format(str(log_path)))
+        if fork_point:
+            setup_cell.metadata['tags'] = [FORK_POINT_TAG]
+        notebook.cells.append(setup_cell)
+        notebook.cells.append(
+            nbformat.v4.new_code_cell('base + {}'.format(value)))
+        path = instance_dir / 'notebook.ipynb'
+        nbformat.write(notebook, str(path))
+        paths.append(path)
+    return paths
+
+
+def test_compute_notebook_sweep(tmpdir):
+    """The cells up to the fork point are executed once, and shared by every
+    notebook of the sweep.
+    """
+    paths = _write_sweep_notebooks(tmpdir, [1, 2, 3])
+
+    results = compute_notebook_sweep(paths, jobs=2)
+
+    assert all(result.success for result in results)
+    assert (Path(str(tmpdir)) / 'setup.log').read_text() == 'setup\n'
+    for path, value in zip(paths, [1, 2, 3]):
+        nb = nbformat.read(str(path), as_version=nbformat.NO_CONVERT)
+        assert nb.cells[0].outputs[0].text == 'setup done\n'
+        assert nb.cells[0].execution_count == 1
+        assert nb.cells[1].outputs[0]['data']['text/plain'] \
+            == str(40 + value)
+        assert nb.cells[1].execution_count == 2
+
+
+def test_compute_notebook_sweep_reads_assets(tmpdir):
+    """The shared cells can read the instances' asset files by their
+    relative paths.
+    """
+    paths = []
+    for value in (1, 2):
+        instance_dir = Path(str(tmpdir)) / 'instance-{}'.format(value)
+        instance_dir.mkdir()
+        (instance_dir / 'catalog.txt').write_text('40\n')
+        notebook = nbformat.v4.new_notebook()
+        setup_cell = nbformat.v4.new_code_cell(
+            "with open('catalog.txt') as fp:\n"
+            "    base = int(fp.read())")
+        setup_cell.metadata['tags'] = [FORK_POINT_TAG]
+        notebook.cells.append(setup_cell)
+        notebook.cells.append(
+            nbformat.v4.new_code_cell('base + {}'.format(value)))
+        path = instance_dir / 'notebook.ipynb'
+        nbformat.write(notebook, str(path))
+        paths.append(path)
+
+    results = compute_notebook_sweep(paths)
+
+    assert all(result.success for result in results), results
+    for path, value in zip(paths, [1, 2]):
+        nb = nbformat.read(str(path), as_version=nbformat.NO_CONVERT)
+        assert nb.cells[1].outputs[0]['data']['text/plain'] \
+            == str(40 + value)
+
+
+def test_compute_notebook_sweep_without_fork_point(tmpdir):
+    """Notebooks without a fork point are computed in full.
+    """
+    paths = _write_sweep_notebooks(tmpdir, [1, 2], fork_point=False)
+
+    results = compute_notebook_sweep(paths)
+
+    assert all(result.success for result in results)
+    assert (Path(str(tmpdir)) / 'setup.log').read_text() == 'setup\n' * 2
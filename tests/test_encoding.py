@@ -0,0 +1,40 @@
+"""Tests for the nbreport.encoding module.
+"""
+
+import io
+import os
+import zlib
+
+import pytest
+
+from nbreport.encoding import iter_encoded
+
+
+def test_identity():
+    data = os.urandom(2 ** 12)
+    chunks = list(iter_encoded(io.BytesIO(data), chunk_size=2 ** 10))
+    assert chunks == [data[i:i + 2 ** 10] for i in range(0, 2 ** 12, 2 ** 10)]
+
+
+def test_gzip():
+    data = b'{"cells": []}\n' * 2 ** 12
+    chunks = list(iter_encoded(io.BytesIO(data), content_encoding='gzip',
+                               chunk_size=2 ** 10))
+    encoded = b''.join(chunks)
+    assert len(encoded) < len(data)
+    assert zlib.decompress(encoded, 16 + zlib.MAX_WBITS) == data
+
+
+def test_zstd():
+    zstandard = pytest.importorskip('zstandard')
+    data = b'{"cells": []}\n' * 2 ** 12
+    encoded = b''.join(iter_encoded(io.BytesIO(data),
+                                    content_encoding='zstd'))
+    assert len(encoded) < len(data)
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(encoded) \
+        == data
+
+
+def test_unknown_encoding():
+    with pytest.raises(ValueError):
+        list(iter_encoded(io.BytesIO(b''), content_encoding='br'))
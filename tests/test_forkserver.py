@@ -0,0 +1,98 @@
+"""Tests for the nbreport.forkserver module.
+"""
+
+from pathlib import Path
+
+import nbformat
+import pytest
+
+from nbreport.compute import compute_notebook
+from nbreport.forkserver import ForkServer
+from nbreport.kernelpool import KernelPool
+
+
+def _make_notebook(*sources):
+    notebook = nbformat.v4.new_notebook()
+    for source in sources:
+        notebook.cells.append(nbformat.v4.new_code_cell(source))
+    return notebook
+
+
+def test_compute_with_fork_server(tmpdir):
+    """Kernels forked from the template are separate processes, run in the
+    notebook's directory, and start with the preloaded modules.
+    """
+    source = (
+        'import os, sys\n'
+        'print(os.getpid())\n'
+        'print(os.getcwd())\n'
+        "print('decimal' in sys.modules)"
+    )
+    with ForkServer(preload=['decimal']) as fork_server:
+        nb1 = compute_notebook(_make_notebook(source), dirname=str(tmpdir),
+                               fork_server=fork_server)
+        nb2 = compute_notebook(_make_notebook(source),
+                               fork_server=fork_server)
+        assert fork_server.is_running
+
+    pid1, cwd1, preloaded1 = nb1.cells[0].outputs[0].text.splitlines()
+    pid2, _, preloaded2 = nb2.cells[0].outputs[0].text.splitlines()
+    assert pid1 != pid2
+    assert cwd1 == str(Path(str(tmpdir)).resolve())
+    assert preloaded1 == preloaded2 == 'True'
+    assert not fork_server.is_running
+
+
+def test_kernel_shutdown():
+    """A forked kernel can be interrupted and shut down through its kernel
+    manager.
+    """
+    with ForkServer() as fork_server:
+        km = fork_server.kernel_manager()
+        km.start_kernel()
+        try:
+            assert km.is_alive()
+            assert km.provisioner.pgid == km.provisioner.pid
+            km.interrupt_kernel()
+        finally:
+            km.shutdown_kernel(now=True)
+        assert not km.is_alive()
+
+
+def test_kernel_pool_with_fork_server():
+    """Pooled kernels can be forked from a fork server.
+    """
+    with ForkServer() as fork_server:
+        with KernelPool(size=1, max_uses=2,
+                        fork_server=fork_server) as pool:
+            nb = compute_notebook(_make_notebook('print(6 * 7)'),
+                                  kernel_pool=pool)
+    assert nb.cells[0].outputs[0].text == '42\n'
+
+
+def test_preload_error():
+    """The fork server fails to start if a module can't be preloaded.
+    """
+    with ForkServer(preload=['nbreport_no_such_module']) as fork_server:
+        with pytest.raises(RuntimeError):
+            fork_server.start()
+        assert not fork_server.is_running
+
+
+def test_execute():
+    """Kernels forked after code is executed in the template start with its
+    namespace and execution count.
+    """
+    with ForkServer() as fork_server:
+        outputs, execution_count = fork_server.execute(
+            "x = 41\nprint('setup')\nx + 1")
+        assert execution_count == 1
+        assert outputs[0].text == 'setup\n'
+        assert outputs[1].data['text/plain'] == '42'
+
+        with pytest.raises(RuntimeError):
+            fork_server.execute('1 / 0')
+
+        nb = compute_notebook(_make_notebook('x'), fork_server=fork_server)
+    assert nb.cells[0].outputs[0].data['text/plain'] == '41'
+    assert nb.cells[0].execution_count == 3
@@ -0,0 +1,40 @@
+"""Tests for the nbreport.fsutils module.
+"""
+
+import os
+from pathlib import Path
+import stat
+
+from nbreport.fsutils import create_temp_file
+
+
+def _write_and_replace(path, text):
+    fd, temp_path = create_temp_file(path)
+    with os.fdopen(fd, 'w') as fp:
+        fp.write(text)
+    os.replace(temp_path, str(path))
+
+
+def test_create_temp_file_existing(tmpdir):
+    """Replacing a file keeps its permissions.
+    """
+    path = Path(str(tmpdir)) / 'a.txt'
+    path.write_text('old')
+    os.chmod(str(path), 0o640)
+
+    _write_and_replace(path, 'new')
+    assert path.read_text() == 'new'
+    assert stat.S_IMODE(path.stat().st_mode) == 0o640
+    assert os.listdir(str(tmpdir)) == ['a.txt']
+
+
+def test_create_temp_file_new(tmpdir):
+    """A new file has the default permissions, given the umask.
+    """
+    path = Path(str(tmpdir)) / 'a.txt'
+    umask = os.umask(0o022)
+    try:
+        _write_and_replace(path, 'new')
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(path.stat().st_mode) == 0o644
@@ -1,13 +1,21 @@
 """Tests for the nbreport.instance module.
 """
 
+import base64
+import hashlib
+import os
 from pathlib import Path
+import shutil
+import threading
 
 import pytest
 import nbformat
+from ruamel.yaml import YAML
 
+from nbreport.blobstore import BlobStore
 from nbreport.instance import ReportInstance
 from nbreport.repo import ReportRepo
+from nbreport.processing import create_instance
 
 
 def test_report_repo(tmpdir, testr_000_path):
@@ -49,6 +57,164 @@ def test_report_repo_overwrite(tmpdir, testr_000_path):
     assert instance2.dirname == instance_dirname
 
 
+def test_render_many(tmpdir, testr_000_path):
+    """Rendering several instances at once is equivalent to rendering each.
+    """
+    repo = ReportRepo(testr_000_path)
+    instances = [
+        ReportInstance.from_report_repo(
+            repo, Path(str(tmpdir)) / 'TESTR-000-{0:d}'.format(i), str(i))
+        for i in (1, 2)]
+
+    ReportInstance.render_many(instances, [{'a': 1}, {'a': 2}])
+
+    for instance, a in zip(instances, (1, 2)):
+        notebook = instance.open_notebook()
+        assert '**TESTR-000-{0}**'.format(instance.config['instance_id']) \
+            in notebook.cells[0].source
+        assert notebook.cells[1].source.startswith(
+            'answer = {0:d} + 32\n'.format(a))
+        assert notebook.metadata['nbreport']['cookiecutter']['a'] == a
+        assert instance.config['cookiecutter']['a'] == a
+
+
+def test_config_parsed_once(tmpdir, testr_002_path, monkeypatch):
+    """Creating and rendering an instance parses the repo's and the
+    instance's nbreport.yaml files once each.
+    """
+    loads = []
+    original_load = YAML.load
+
+    def counting_load(self, stream):
+        loads.append(stream.name)
+        return original_load(self, stream)
+
+    monkeypatch.setattr(YAML, 'load', counting_load)
+    repo = ReportRepo(testr_002_path)
+    instance = create_instance(
+        repo, instance_id='1', template_variables={},
+        instance_path=Path(str(tmpdir)) / 'TESTR-002-1')
+
+    assert sorted(loads) == sorted([str(repo.config_path),
+                                    str(instance.config_path)])
+
+
+def test_instance_reload(tmpdir, testr_000_path):
+    """reload discards the cached configuration and notebook path.
+    """
+    repo = ReportRepo(testr_000_path)
+    instance = ReportInstance.from_report_repo(
+        repo, Path(str(tmpdir)) / 'TESTR-000-1', '1')
+    assert instance.config is instance.config
+    assert instance.ipynb_path.name == 'TESTR-000.ipynb'
+
+    instance.ipynb_path.rename(instance.dirname / 'renamed.ipynb')
+    ReportInstance(instance.dirname).config['ipynb'] = 'renamed.ipynb'
+    assert instance.ipynb_path.name == 'TESTR-000.ipynb'
+    instance.reload()
+    assert instance.ipynb_path.name == 'renamed.ipynb'
+
+
+def test_asset_staging(tmpdir, testr_002_path):
+    """Assets are staged with the strategy from the argument or the repo's
+    configuration, while other files are always copied.
+    """
+    repo_path = Path(str(tmpdir)) / 'TESTR-002'
+    shutil.copytree(str(testr_002_path), str(repo_path))
+    repo = ReportRepo(repo_path)
+
+    instance = ReportInstance.from_report_repo(
+        repo, Path(str(tmpdir)) / 'TESTR-002-1', '1',
+        asset_staging='hardlink')
+    assert os.path.samefile(str(repo_path / 'a/b/4.txt'),
+                            str(instance.dirname / 'a/b/4.txt'))
+    assert not os.path.samefile(str(repo.ipynb_path),
+                                str(instance.ipynb_path))
+
+    repo.config['asset_staging'] = 'symlink'
+    instance = ReportInstance.from_report_repo(
+        repo, Path(str(tmpdir)) / 'TESTR-002-2', '2')
+    assert (instance.dirname / 'a/b/4.txt').is_symlink()
+    assert not instance.config_path.is_symlink()
+
+
+def test_blob_asset_staging(tmpdir, testr_002_path, cache_dir):
+    """Instances created with the blob strategy share their assets through
+    the blob store, and the blobs are reclaimed once the instances are
+    deleted.
+    """
+    repo_path = Path(str(tmpdir)) / 'TESTR-002'
+    shutil.copytree(str(testr_002_path), str(repo_path))
+    repo = ReportRepo(repo_path)
+
+    instances = [
+        ReportInstance.from_report_repo(
+            repo, Path(str(tmpdir)) / 'TESTR-002-{0:d}'.format(i), str(i),
+            asset_staging='blob')
+        for i in range(2)]
+    assert os.path.samefile(str(instances[0].dirname / 'a/b/4.txt'),
+                            str(instances[1].dirname / 'a/b/4.txt'))
+    assert not os.path.samefile(str(repo_path / 'a/b/4.txt'),
+                                str(instances[0].dirname / 'a/b/4.txt'))
+    blob_count = len([path for path in (cache_dir / 'blobs').glob('*/*')
+                      if path.suffix != '.used'])
+    # Identical assets share a blob
+    assert blob_count == len(set(entry.sha256
+                                 for entry in repo.asset_manifest))
+
+    store = BlobStore()
+    shutil.rmtree(str(instances[0].dirname))
+    assert store.gc(min_age=0)['count'] == 0
+    shutil.rmtree(str(instances[1].dirname))
+    assert store.gc(min_age=0)['count'] == blob_count
+
+
+def test_sync(tmpdir, testr_002_path):
+    """Syncing an existing instance stages only the changed assets, deletes
+    removed assets, and keeps the notebook unless its sources changed.
+    """
+    repo_path = Path(str(tmpdir)) / 'TESTR-002'
+    shutil.copytree(str(testr_002_path), str(repo_path))
+    instance_path = Path(str(tmpdir)) / 'TESTR-002-test'
+
+    def sync(context):
+        return ReportInstance.from_report_repo(
+            ReportRepo(repo_path), instance_path, 'test', context=context,
+            overwrite=True, sync=True)
+
+    instance = sync({})
+    # Simulate computed outputs and a file written by the notebook
+    notebook = instance.open_notebook()
+    notebook.metadata['computed'] = True
+    nbformat.write(notebook, str(instance.ipynb_path))
+    (instance_path / 'output.png').write_text('plot')
+    unchanged_inode = (instance_path / '2.txt').stat().st_ino
+
+    (repo_path / '1.txt').write_text('changed')
+    (repo_path / 'a' / 'b' / '4.txt').unlink()
+    instance = sync({})
+    assert (instance_path / '1.txt').read_text() == 'changed'
+    assert not (instance_path / 'a' / 'b').exists()
+    assert (instance_path / 'a' / '3.txt').exists()
+    assert (instance_path / '2.txt').stat().st_ino == unchanged_inode
+    assert (instance_path / 'output.png').exists()
+    assert instance.open_notebook().metadata['computed']
+
+    # A different template context renders the notebook again
+    instance = sync({'a': 'b'})
+    assert 'computed' not in instance.open_notebook().metadata
+    assert instance.config['instance_id'] == 'test'
+
+
+def test_sync_requires_overwrite(tmpdir, testr_000_path):
+    repo = ReportRepo(testr_000_path)
+    instance_path = Path(str(tmpdir)) / 'TESTR-000-test'
+    ReportInstance.from_report_repo(repo, instance_path, 'test', sync=True)
+    with pytest.raises(OSError):
+        ReportInstance.from_report_repo(repo, instance_path, 'test',
+                                        sync=True)
+
+
 def test_instance_not_found():
     """Test creating a ReportInstance when it does not exist.
     """
@@ -73,3 +239,76 @@ def test_asset_copy(tmpdir, testr_002_path):
     assert (instance_dirname / 'a/b/4.txt').exists()
     assert (instance_dirname / 'md/1.md').exists()
     assert (instance_dirname / 'md/2.md').exists()
+
+
+@pytest.mark.parametrize('content_encoding', ['identity', 'gzip', 'zstd'])
+def test_upload_streaming(tmpdir, testr_000_path, fake_registration,
+                          api_server, content_encoding):
+    """Test that a large notebook is uploaded without reading it into
+    memory, measuring the request size at a stand-in API server and the
+    peak RSS of the uploading process.
+    """
+    psutil = pytest.importorskip('psutil')
+    if content_encoding == 'zstd':
+        pytest.importorskip('zstandard')
+
+    repo_path = Path(str(tmpdir)) / 'TESTR-000'
+    shutil.copytree(str(testr_000_path), str(repo_path))
+    repo = ReportRepo(repo_path)
+    fake_registration(repo)
+    instance = create_instance(repo, instance_id='1',
+                               instance_path=Path(str(tmpdir)) / 'instance')
+
+    # A 48 MiB notebook with a large image output, written in chunks so that
+    # it's never in memory
+    with open(str(instance.ipynb_path), 'w') as fp:
+        fp.write('{"cells": [{"cell_type": "code", "execution_count": 1, '
+                 '"metadata": {}, "source": "plot()", "outputs": [{'
+                 '"output_type": "display_data", "metadata": {}, "data": '
+                 '{"image/png": "')
+        for _ in range(48):
+            # Partly compressible, like an image
+            block = os.urandom(2 ** 19) + bytes(2 ** 19)
+            fp.write(base64.b64encode(block)[:2 ** 20].decode('ascii'))
+        fp.write('"}}]}], "metadata": {}, "nbformat": 4, '
+                 '"nbformat_minor": 2}\n')
+    file_size = instance.ipynb_path.stat().st_size
+    with open(str(instance.ipynb_path), 'rb') as fp:
+        file_hash = hashlib.sha256()
+        for chunk in iter(lambda: fp.read(2 ** 20), b''):
+            file_hash.update(chunk)
+
+    process = psutil.Process()
+    start_rss = process.memory_info().rss
+    peak_rss = [start_rss]
+    stop_event = threading.Event()
+
+    def sample():
+        while not stop_event.wait(0.005):
+            peak_rss[0] = max(peak_rss[0], process.memory_info().rss)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        queue_url = instance.upload(
+            github_username='testuser', github_token='mytoken',
+            server=api_server.url, content_encoding=content_encoding)
+    finally:
+        stop_event.set()
+        sampler.join()
+    assert queue_url == 'https://example.com/queue/12345'
+
+    request = api_server.requests[-1]
+    assert request['path'] \
+        == '/nbreport/reports/testr-000/instances/1/notebook'
+    assert request['content'] == file_hash.hexdigest()
+    if content_encoding == 'identity':
+        assert 'Content-Encoding' not in request['headers']
+        assert request['headers']['Content-Length'] == str(file_size)
+        assert request['size'] == file_size
+    else:
+        assert request['headers']['Content-Encoding'] == content_encoding
+        assert request['headers']['Transfer-Encoding'] == 'chunked'
+        assert request['size'] < 0.8 * file_size
+    # The notebook was never held in memory
+    assert peak_rss[0] - start_rss < file_size / 4
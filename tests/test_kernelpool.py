@@ -0,0 +1,88 @@
+"""Tests for the nbreport.kernelpool module.
+"""
+
+from pathlib import Path
+import time
+
+import nbformat
+
+from nbreport.compute import compute_notebook
+from nbreport.kernelpool import KernelPool
+
+
+def _make_notebook(source):
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells.append(nbformat.v4.new_code_cell(source))
+    return notebook
+
+
+def test_kernel_reuse(tmpdir):
+    """A kernel with max_uses > 1 is reused, and its namespace and working
+    directory are reset between notebooks.
+    """
+    with KernelPool(size=1, max_uses=2) as pool:
+        pool.warm()
+
+        nb1 = compute_notebook(
+            _make_notebook('import os\nx = 1\nprint(os.getcwd())'),
+            dirname=str(tmpdir), kernel_pool=pool)
+        assert nb1.cells[0].outputs[0].text.strip() \
+            == str(Path(str(tmpdir)).resolve())
+
+        nb2 = compute_notebook(
+            _make_notebook("print('x' in dir())"),
+            kernel_pool=pool)
+        assert nb2.cells[0].outputs[0].text == 'False\n'
+        assert nb2.cells[0].execution_count == 1
+
+
+def test_kernel_recycle():
+    """A kernel that reaches max_uses is replaced with a new one.
+    """
+    with KernelPool(size=1, max_uses=1, preload=['json']) as pool:
+        pool.warm()
+        source = 'import os\nprint(os.getpid())'
+        nb1 = compute_notebook(_make_notebook(source), kernel_pool=pool)
+        nb2 = compute_notebook(_make_notebook(source), kernel_pool=pool)
+        assert nb1.cells[0].outputs[0].text != nb2.cells[0].outputs[0].text
+
+
+class _FakeKernelManager:
+    """Stands in for a kernel manager whose kernel is always alive.
+    """
+
+    def is_alive(self):
+        return True
+
+    def shutdown_kernel(self, now=False):
+        pass
+
+
+def test_release_refills_in_background(monkeypatch):
+    """Releasing a recycled kernel doesn't wait for its replacement to
+    start, and acquire waits for the replacement instead of starting
+    another kernel.
+    """
+    started = []
+
+    def start_kernel(self, kernel_name):
+        if started:
+            # Replacement kernels are slow to start
+            time.sleep(1.)
+        km = _FakeKernelManager()
+        self._kernel_names[km] = kernel_name
+        self._uses[km] = 0
+        started.append(km)
+        return km
+
+    monkeypatch.setattr(KernelPool, '_start_kernel', start_kernel)
+    with KernelPool(size=1, max_uses=1) as pool:
+        pool.warm()
+        km = pool.acquire()
+
+        start_time = time.perf_counter()
+        pool.release(km)
+        assert time.perf_counter() - start_time < 0.5
+
+        assert pool.acquire() is not km
+        assert len(started) == 2
@@ -0,0 +1,45 @@
+"""Tests for the nbreport.memory module, through compute_notebook.
+"""
+
+from nbconvert.preprocessors import CellExecutionError
+import nbformat
+import pytest
+
+from nbreport.compute import compute_notebook
+
+pytest.importorskip('psutil')
+
+
+def test_memory_sampling():
+    """Test that each cell records its peak and change in RSS.
+    """
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells.append(nbformat.v4.new_code_cell('x = 1'))
+    notebook.cells.append(nbformat.v4.new_code_cell(
+        'import time\n'
+        'data = bytearray(100 * 2 ** 20)\n'
+        'time.sleep(0.3)'))
+
+    notebook = compute_notebook(notebook, memory_interval=0.05)
+
+    first = notebook.cells[0].metadata['nbreport']
+    second = notebook.cells[1].metadata['nbreport']
+    assert first['peak_rss'] > 0
+    assert second['delta_rss'] > 50 * 2 ** 20
+    assert second['peak_rss'] >= first['peak_rss'] + 50 * 2 ** 20
+
+
+def test_memory_limit(tmpdir, monkeypatch):
+    """Test that a cell exceeding the memory limit is interrupted and marked.
+    """
+    monkeypatch.chdir(str(tmpdir))  # errored notebooks are written here
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells.append(nbformat.v4.new_code_cell(
+        'import time\n'
+        'data = bytearray(500 * 2 ** 20)\n'
+        'time.sleep(30)'))
+
+    with pytest.raises(CellExecutionError):
+        compute_notebook(notebook, memory_interval=0.05,
+                         memory_limit=300 * 2 ** 20)
+    assert notebook.cells[0].metadata['nbreport']['memory_limit_exceeded']
@@ -0,0 +1,145 @@
+"""Tests for the nbreport.mirror module, using a local stand-in for a remote
+Git repository.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from pathlib import Path
+
+import git
+
+from nbreport import mirror
+from nbreport.mirror import RepoCache
+
+
+def _push_change(tmpdir, git_remote, filename):
+    """Commit a new file to the remote repository's master branch.
+    """
+    work_repo = git.Repo(str(Path(str(tmpdir)) / 'monorepo'))
+    (Path(work_repo.working_tree_dir) / filename).write_text('new')
+    work_repo.index.add([filename])
+    actor = git.Actor('nbreport', 'nbreport@example.com')
+    work_repo.index.commit('Add {0}'.format(filename), author=actor,
+                           committer=actor)
+    work_repo.git.push(git_remote, 'master')
+
+
+def _list_mirrors(repo_cache):
+    """List the mirror directories in the cache.
+    """
+    return [path for path in repo_cache.directory.iterdir() if path.is_dir()]
+
+
+def test_open(git_remote, tmpdir, cache_dir, caplog):
+    """The first use of a repository clones a mirror, and later uses fetch
+    new commits into the ref's working tree.
+    """
+    caplog.set_level(logging.INFO, logger='nbreport.mirror')
+    repo_cache = RepoCache()
+    assert repo_cache.directory == cache_dir / 'repos'
+
+    with repo_cache.open(git_remote, subdir='tests/TESTR-000') as report_repo:
+        assert report_repo.ipynb_path.exists()
+        worktree_path = report_repo.dirname.parent.parent
+    assert 'Cloned {0}'.format(git_remote) in caplog.text
+    assert worktree_path.parent.parent == repo_cache.get_mirror_dir(
+        git_remote)
+
+    _push_change(tmpdir, git_remote, 'new.txt')
+    caplog.clear()
+    with repo_cache.open(git_remote) as report_repo:
+        assert report_repo.dirname == worktree_path
+        assert (report_repo.dirname / 'new.txt').exists()
+    assert 'Fetched {0}'.format(git_remote) in caplog.text
+    assert len(_list_mirrors(repo_cache)) == 1
+
+
+def test_concurrent_open(git_remote):
+    """Concurrent users of a repository share one mirror.
+    """
+    repo_cache = RepoCache()
+
+    def create(_):
+        with repo_cache.open(git_remote,
+                             subdir='tests/TESTR-000') as report_repo:
+            return report_repo.config['handle']
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        handles = list(executor.map(create, range(8)))
+    assert handles == ['TESTR-000'] * 8
+    assert len(_list_mirrors(repo_cache)) == 1
+
+
+def test_evict(git_remote, tmpdir):
+    """Old or excess mirrors are evicted, unless they're in use.
+    """
+    repo_cache = RepoCache(Path(str(tmpdir)) / 'repos', max_size=0)
+    other_remote = git_remote.replace('remote.git', 'other.git')
+    git.Repo(git_remote[len('file://'):]).clone(
+        other_remote[len('file://'):], bare=True)
+
+    with repo_cache.open(git_remote):
+        pass
+    # The mirror that was just used is kept
+    assert repo_cache.get_mirror_dir(git_remote).exists()
+
+    with repo_cache.open(other_remote):
+        assert repo_cache.evict(max_age=0) == [
+            repo_cache.get_mirror_dir(git_remote)]
+    assert repo_cache.evict(max_age=0) == [
+        repo_cache.get_mirror_dir(other_remote)]
+    assert _list_mirrors(repo_cache) == []
+
+
+def test_open_worktree_changed_while_locking(git_remote, tmpdir,
+                                             monkeypatch):
+    """If another process checks out a different commit while the lock is
+    converted to a shared lock, the working tree is updated again, so that
+    the report repository's commit is the one on disk.
+    """
+    _push_change(tmpdir, git_remote, 'new.txt')
+    repo_cache = RepoCache()
+    flock = mirror._flock
+    calls = []
+
+    def racing_flock(fd, shared=False, blocking=True):
+        if shared and not calls:
+            # Another process updates the working tree in between
+            calls.append(fd)
+            worktree_dirs = list(
+                (repo_cache.get_mirror_dir(git_remote) / 'worktrees')
+                .iterdir())
+            git.Repo(str(worktree_dirs[0])).git.checkout(
+                '--detach', 'HEAD~1')
+        return flock(fd, shared=shared, blocking=blocking)
+
+    monkeypatch.setattr(mirror, '_flock', racing_flock)
+    with repo_cache.open(git_remote) as report_repo:
+        head = git.Repo(str(report_repo.dirname)).head.commit.hexsha
+        assert report_repo.git_commit == head
+        assert (report_repo.dirname / 'new.txt').exists()
+    assert len(calls) == 1
+
+
+def test_open_evicts_once_per_interval(git_remote, monkeypatch):
+    """Opening a repository only evicts mirrors once per eviction
+    interval.
+    """
+    repo_cache = RepoCache(evict_interval=3600.)
+    evictions = []
+    evict = repo_cache._evict
+
+    def counting_evict(*args, **kwargs):
+        evictions.append(args)
+        return evict(*args, **kwargs)
+
+    monkeypatch.setattr(repo_cache, '_evict', counting_evict)
+    for _ in range(3):
+        with repo_cache.open(git_remote):
+            pass
+    assert len(evictions) == 1
+    assert (repo_cache.directory / 'last-evict').exists()
+
+    # An explicit eviction always runs
+    assert repo_cache.evict() == []
+    assert len(evictions) == 2
@@ -0,0 +1,38 @@
+"""Tests for the nbreport.processing module.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from nbreport.processing import read_parameter_matrix
+
+
+def test_read_parameter_matrix_csv(tmpdir):
+    path = Path(str(tmpdir)) / 'matrix.csv'
+    path.write_text('detector,filter\n1,g\n2,r\n')
+    assert read_parameter_matrix(path) == [
+        {'detector': '1', 'filter': 'g'},
+        {'detector': '2', 'filter': 'r'}
+    ]
+
+
+def test_read_parameter_matrix_yaml(tmpdir):
+    path = Path(str(tmpdir)) / 'matrix.yaml'
+    path.write_text('- detector: 1\n  filter: g\n- detector: 2\n')
+    assert read_parameter_matrix(path) == [
+        {'detector': 1, 'filter': 'g'},
+        {'detector': 2}
+    ]
+
+
+@pytest.mark.parametrize('name,content', [
+    ('matrix.csv', 'detector,filter\n1,g,extra\n'),
+    ('matrix.yaml', 'detector: 1\n'),
+    ('matrix.txt', 'detector\n1\n'),
+])
+def test_read_parameter_matrix_invalid(tmpdir, name, content):
+    path = Path(str(tmpdir)) / name
+    path.write_text(content)
+    with pytest.raises(ValueError):
+        read_parameter_matrix(path)
@@ -0,0 +1,98 @@
+"""Tests for the nbreport.profiling module.
+"""
+
+import json
+from pathlib import Path
+
+import nbformat
+
+from nbreport.compute import compute_notebook_file
+from nbreport.profiling import collapsed_to_speedscope
+
+
+def test_collapsed_to_speedscope():
+    lines = [
+        '<module> (/tmp/1.py:1);busy (/tmp/1.py:2) 3\n',
+        '<module> (/tmp/1.py:1) 1\n',
+    ]
+    profile = collapsed_to_speedscope(lines, name='cell', interval=0.5)
+
+    frames = profile['shared']['frames']
+    assert frames[0] == {'name': '<module>', 'file': '/tmp/1.py', 'line': 1}
+    assert frames[1]['name'] == 'busy'
+    assert profile['profiles'][0]['samples'] == [[0, 1], [0]]
+    assert profile['profiles'][0]['weights'] == [1.5, 0.5]
+    assert profile['profiles'][0]['endValue'] == 2.
+
+
+def _write_notebook(path):
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells.append(nbformat.v4.new_code_cell('x = 1'))
+    notebook.cells.append(nbformat.v4.new_code_cell(
+        'import time\n'
+        'def busy():\n'
+        '    end = time.time() + 0.3\n'
+        '    while time.time() < end:\n'
+        '        pass\n'
+        'busy()\n'))
+    notebook.cells[1].metadata['tags'] = ['nbreport-profile']
+    notebook.cells.append(nbformat.v4.new_code_cell(
+        "print([name for name in dir() if 'nbreport' in name])"))
+    nbformat.write(notebook, str(path))
+
+
+def test_profile_tagged_cell(tmpdir):
+    """A cell tagged nbreport-profile gets a collapsed stacks sidecar file.
+    """
+    notebook_path = Path(str(tmpdir)) / 'report.ipynb'
+    _write_notebook(notebook_path)
+
+    compute_notebook_file(notebook_path)
+
+    nb = nbformat.read(str(notebook_path), as_version=nbformat.NO_CONVERT)
+    assert 'profile' not in nb.cells[0].metadata['nbreport']
+    profile_name = nb.cells[1].metadata['nbreport']['profile']
+    assert profile_name == 'report-cell1.collapsed'
+    collapsed = (notebook_path.parent / profile_name).read_text()
+    assert 'busy' in collapsed
+    # Profiler helpers are hidden from the notebook's namespace
+    assert nb.cells[2].outputs[0].text == '[]\n'
+
+
+def test_profile_excludes_kernel_frames(tmpdir):
+    """Stacks start at the cell's code, without the kernel's frames.
+    """
+    notebook_path = Path(str(tmpdir)) / 'report.ipynb'
+    _write_notebook(notebook_path)
+
+    compute_notebook_file(notebook_path)
+
+    collapsed = (notebook_path.parent / 'report-cell1.collapsed').read_text()
+    stacks = [line.rsplit(' ', 1)[0].split(';')
+              for line in collapsed.splitlines()]
+    assert stacks
+    for stack in stacks:
+        assert stack[0].startswith('<module> ')
+        assert all(name.split(' ', 1)[0] in ('<module>', 'busy')
+                   for name in stack)
+    assert not any('ipykernel_launcher' in line or 'kernelbase' in line
+                   for line in collapsed.splitlines())
+
+
+def test_profile_speedscope(tmpdir):
+    """Profile every cell in the speedscope format.
+    """
+    notebook_path = Path(str(tmpdir)) / 'report.ipynb'
+    _write_notebook(notebook_path)
+
+    compute_notebook_file(notebook_path, profile_cells='all',
+                          profile_format='speedscope')
+
+    nb = nbformat.read(str(notebook_path), as_version=nbformat.NO_CONVERT)
+    for index, cell in enumerate(nb.cells):
+        profile_name = cell.metadata['nbreport']['profile']
+        assert profile_name == 'report-cell{}.speedscope.json'.format(index)
+        profile_path = notebook_path.parent / profile_name
+        profile = json.loads(profile_path.read_text())
+        assert profile['profiles'][0]['type'] == 'sampled'
+    assert not list(notebook_path.parent.glob('*.collapsed'))
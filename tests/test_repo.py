@@ -1,7 +1,10 @@
 """Tests for the nbreport.repo module.
 """
 
+import os
 from pathlib import Path
+import shutil
+import stat
 
 import nbformat
 import pytest
@@ -31,6 +34,31 @@ def test_report_repo_from_str(testr_000_path):
     assert repo.dirname == testr_000_path
 
 
+def test_report_repo_template_cache_dir(testr_000_path, tmpdir):
+    """The template cache is stored in the Git directory of a report repo in
+    a Git working tree, and in the report repo itself otherwise.
+    """
+    repo = ReportRepo(testr_000_path)
+    assert repo.template_cache_dir.parts[-4:-2] == ('.git', 'nbreport')
+    assert repo.template_cache_dir.name == 'templates'
+
+    repo = ReportRepo(str(tmpdir))
+    assert repo.template_cache_dir == \
+        Path(str(tmpdir)).resolve() / '.nbreport' / 'templates'
+
+
+def test_report_repo_cache_dir(testr_000_path, testr_002_path):
+    """Report repositories in the same Git working tree have separate cache
+    directories.
+    """
+    cache_dirs = [ReportRepo(path).cache_dir
+                  for path in (testr_000_path, testr_002_path)]
+    assert cache_dirs[0] != cache_dirs[1]
+    assert cache_dirs[0].parent == cache_dirs[1].parent
+    assert cache_dirs[0].name.startswith('TESTR-000-')
+    assert cache_dirs[0] == ReportRepo(testr_000_path).cache_dir
+
+
 def test_report_repo_not_found():
     """Test creating a ReportRepo on a non-existent directory.
     """
@@ -51,6 +79,21 @@ def test_report_repo_git_clone(tmpdir):
     assert repo.ipynb_path.exists()
 
 
+def test_report_repo_reload(testr_002_path, tmpdir):
+    """The repo's configuration and asset paths are cached until reload.
+    """
+    repo_path = Path(str(tmpdir)) / 'TESTR-002'
+    shutil.copytree(str(testr_002_path), str(repo_path))
+    repo = ReportRepo(repo_path)
+    assert repo.config is repo.config
+    asset_paths = repo.asset_paths
+
+    (repo_path / 'a' / '5.txt').write_text('5')
+    assert repo.asset_paths == asset_paths
+    repo.reload()
+    assert repo.dirname / 'a' / '5.txt' in repo.asset_paths
+
+
 def test_report_config_read(testr_000_path):
     """Test reading the ReportConfig using ``/tests/TESTR-000/nbreport.yaml``.
     """
@@ -107,6 +150,84 @@ def test_report_config_write(tmpdir):
     assert 'not-here' not in config
 
 
+def test_report_config_cache(tmpdir, monkeypatch):
+    """The parsed configuration is cached until the file changes.
+    """
+    path = Path(str(tmpdir)) / 'nbreport.yaml'
+    path.write_text('handle: TESTR-000\n')
+    config = ReportConfig(path)
+    assert config['handle'] == 'TESTR-000'
+
+    loads = []
+    original_load = config._yaml.load
+
+    def counting_load(stream):
+        loads.append(stream)
+        return original_load(stream)
+
+    monkeypatch.setattr(config._yaml, 'load', counting_load)
+    assert config['handle'] == 'TESTR-000'
+    assert 'handle' in config
+    assert list(config.keys()) == ['handle']
+    config['title'] = 'Test Report'
+    assert config['title'] == 'Test Report'
+    assert len(loads) == 0
+
+    # Another writer replaces the file
+    ReportConfig(path)['title'] = 'Revised Test Report'
+    assert config['title'] == 'Revised Test Report'
+    assert len(loads) == 1
+
+
+def test_report_config_transaction(tmpdir, monkeypatch):
+    """Changes in a transaction are written once, when it exits, and are
+    discarded if it fails.
+    """
+    path = Path(str(tmpdir)) / 'nbreport.yaml'
+    path.write_text('# Comment\nhandle: TESTR-000\n')
+    config = ReportConfig(path)
+
+    writes = []
+    original_dump = config._yaml.dump
+
+    def counting_dump(data, stream):
+        writes.append(data)
+        return original_dump(data, stream)
+
+    monkeypatch.setattr(config._yaml, 'dump', counting_dump)
+    with config.transaction():
+        config['instance_id'] = '1'
+        with config.transaction():
+            config.update({'instance_handle': 'TESTR-000-1'})
+        assert len(writes) == 0
+        assert config['instance_handle'] == 'TESTR-000-1'
+        assert 'instance_id' not in ReportConfig(path)
+    assert len(writes) == 1
+    assert ReportConfig(path)['instance_handle'] == 'TESTR-000-1'
+    assert path.read_text().startswith('# Comment\n')
+
+    with pytest.raises(RuntimeError):
+        with config.transaction():
+            config['title'] = 'Test Report'
+            raise RuntimeError()
+    assert len(writes) == 1
+    assert 'title' not in config
+    assert 'title' not in ReportConfig(path)
+
+
+def test_report_config_write_keeps_mode(tmpdir):
+    """Rewriting the configuration file keeps its permissions.
+    """
+    path = Path(str(tmpdir)) / 'nbreport.yaml'
+    path.write_text('handle: TESTR-000\n')
+    os.chmod(str(path), 0o640)
+    config = ReportConfig(path)
+    with config.transaction():
+        config['title'] = 'Test Report'
+    assert stat.S_IMODE(path.stat().st_mode) == 0o640
+    assert ReportConfig(path)['title'] == 'Test Report'
+
+
 def test_report_repo_asset_paths(testr_002_path):
     """Test getting asset paths from a repo with lots of them.
     """
@@ -120,3 +241,22 @@ def test_report_repo_asset_paths(testr_002_path):
     assert repo.dirname / 'a/b/4.txt' in asset_paths
     assert repo.dirname / 'md/1.md' in asset_paths
     assert repo.dirname / 'md/2.md' in asset_paths
+
+
+def test_report_repo_asset_manifest(testr_002_path, tmpdir):
+    """The asset manifest respects exclude_assets, and is cached in the
+    repo's cache directory (which isn't itself an asset).
+    """
+    repo_path = Path(str(tmpdir)) / 'TESTR-002'
+    shutil.copytree(str(testr_002_path), str(repo_path))
+    repo = ReportRepo(repo_path)
+    repo.config['exclude_assets'] = ['a/b']
+    (repo.cache_dir / 'templates').mkdir(parents=True)
+    (repo.cache_dir / 'templates' / 'x.txt').write_text('x')
+
+    manifest = repo.asset_manifest
+    assert [entry.path for entry in manifest] == [
+        '1.txt', '2.txt', 'a/3.txt', 'assetmodule.py', 'md/1.md', 'md/2.md']
+    assert repo.asset_paths == [repo.dirname / entry.path
+                                for entry in manifest]
+    assert (repo.cache_dir / 'assets.json').exists()
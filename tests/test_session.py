@@ -0,0 +1,74 @@
+"""Tests for the nbreport.session module.
+"""
+
+from pathlib import Path
+import shutil
+import socket
+import time
+
+import pytest
+import requests
+
+from nbreport.processing import create_instance
+from nbreport.repo import ReportRepo
+from nbreport.session import create_session, get_session
+
+
+def test_reserve_and_upload_reuse_connection(tmpdir, testr_000_path,
+                                             fake_registration, api_server):
+    repo_path = Path(str(tmpdir)) / 'TESTR-000'
+    shutil.copytree(str(testr_000_path), str(repo_path))
+    repo = ReportRepo(repo_path)
+    fake_registration(repo)
+
+    session = create_session(pool_size=2)
+    for number in range(5):
+        instance = create_instance(
+            repo, instance_path=Path(str(tmpdir)) / str(number),
+            github_username='testuser', github_token='mytoken',
+            server=api_server.url, session=session)
+        queue_url = instance.upload(
+            github_username='testuser', github_token='mytoken',
+            server=api_server.url, session=session)
+        assert queue_url == 'https://example.com/queue/12345'
+
+    assert len(api_server.requests) == 10
+    assert api_server.requests[0]['path'] \
+        == '/nbreport/reports/testr-000/instances/'
+    assert api_server.requests[1]['path'] \
+        == '/nbreport/reports/testr-000/instances/1/notebook'
+    # Every request used the same, kept-alive, connection
+    assert {request['connection'] for request in api_server.requests} \
+        == {0}
+
+
+def test_retry(api_server):
+    session = create_session(retries=2, backoff_factor=0.)
+
+    api_server.statuses.extend([503, 503])
+    response = session.get(api_server.url + '/status')
+    assert response.status_code == 202
+    assert len(api_server.requests) == 3
+
+    # POST requests aren't sent again
+    api_server.statuses.extend([503])
+    response = session.post(api_server.url + '/nbreport/reports/')
+    assert response.status_code == 503
+    assert len(api_server.requests) == 4
+
+
+def test_timeout():
+    session = create_session(timeout=0.2, retries=0)
+    # A server that accepts connections, but never responds
+    with socket.socket() as listener:
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        url = 'http://127.0.0.1:{0:d}/'.format(listener.getsockname()[1])
+        start_time = time.monotonic()
+        with pytest.raises(requests.exceptions.ConnectionError):
+            session.get(url)
+        assert time.monotonic() - start_time < 5.
+
+
+def test_get_session():
+    assert get_session() is get_session()
@@ -0,0 +1,76 @@
+"""Tests for the nbreport.snapshot module.
+"""
+
+import os
+import time
+
+import git
+
+from nbreport.instance import ReportInstance
+from nbreport.processing import open_remote_repo
+from nbreport.snapshot import SnapshotCache
+
+
+def test_snapshot(git_remote, tmpdir, cache_dir, monkeypatch):
+    """The first use of a commit saves a read-only snapshot, which later
+    uses open without cloning. Instances record the commit.
+    """
+    snapshot_cache = SnapshotCache()
+    assert snapshot_cache.directory == cache_dir / 'snapshots'
+
+    with open_remote_repo(git_remote, subdir='tests/TESTR-002',
+                          strategy='sparse',
+                          snapshot_cache=snapshot_cache) as report_repo:
+        sha = report_repo.git_commit
+        assert len(sha) == 40
+        assert report_repo.dirname == snapshot_cache.get_snapshot_dir(
+            sha, subdir='tests/TESTR-002')
+        assert not os.access(str(report_repo.ipynb_path), os.W_OK) \
+            or os.getuid() == 0
+        assert not (report_repo.dirname / '.git').exists()
+
+    def fail_clone(*args, **kwargs):
+        raise AssertionError('The repository was cloned')
+
+    monkeypatch.setattr(git.Repo, 'clone_from', fail_clone)
+    with open_remote_repo(git_remote, subdir='tests/TESTR-002',
+                          snapshot_cache=snapshot_cache) as report_repo:
+        assert report_repo.git_commit == sha
+        instance = ReportInstance.from_report_repo(
+            report_repo, tmpdir.join('instance'), '1', context={})
+    assert instance.config['git_commit'] == sha
+    assert (instance.dirname / 'a' / 'b' / '4.txt').exists()
+    assert os.access(str(instance.ipynb_path), os.W_OK)
+
+
+def test_evict(git_remote, tmpdir):
+    snapshot_cache = SnapshotCache(tmpdir.join('snapshots'))
+    with open_remote_repo(git_remote, subdir='tests/TESTR-000',
+                          snapshot_cache=snapshot_cache) as report_repo:
+        path = report_repo.dirname
+
+    assert snapshot_cache.evict() == []
+    old = time.time() - 3600
+    os.utime(str(path), (old, old))
+    assert snapshot_cache.evict(max_age=60) == [path]
+    assert not path.parent.exists()
+
+
+def test_snapshot_cache_dir(git_remote, tmpdir):
+    """The caches of a snapshot's report repository are kept outside of the
+    read-only snapshot, and evicted with it.
+    """
+    snapshot_cache = SnapshotCache(tmpdir.join('snapshots'))
+    with open_remote_repo(git_remote, subdir='tests/TESTR-002',
+                          snapshot_cache=snapshot_cache) as report_repo:
+        path = report_repo.dirname
+        assert report_repo.asset_manifest
+        manifest_path = report_repo.cache_dir / 'assets.json'
+    assert manifest_path.exists()
+    assert path not in manifest_path.parents
+    assert not (path / '.nbreport').exists()
+
+    old = time.time() - 3600
+    os.utime(str(path), (old, old))
+    assert snapshot_cache.evict(max_age=60) == [path]
+    assert not path.parent.exists()
@@ -0,0 +1,134 @@
+"""Tests for the nbreport.staging module.
+"""
+
+import errno
+import logging
+import os
+from pathlib import Path
+
+import pytest
+
+from nbreport.blobstore import BlobStore
+from nbreport.staging import AssetStager
+
+
+@pytest.fixture
+def source_files(tmpdir):
+    """Two asset files in a repository directory.
+    """
+    repo_dir = Path(str(tmpdir)) / 'repo'
+    (repo_dir / 'a').mkdir(parents=True)
+    paths = [repo_dir / '1.txt', repo_dir / 'a' / '2.txt']
+    for path in paths:
+        path.write_text(path.name)
+    return paths
+
+
+def _stage(stager, source_files):
+    dest_dir = source_files[0].parent.parent / 'instance'
+    files = [(path, dest_dir / path.relative_to(source_files[0].parent))
+             for path in source_files]
+    counts = stager.stage(files)
+    for source, dest in files:
+        assert dest.read_text() == source.read_text()
+    return counts, files
+
+
+def test_copy(source_files):
+    counts, files = _stage(AssetStager('copy'), source_files)
+    assert counts == {'copy': 2}
+    for source, dest in files:
+        assert not os.path.samefile(str(source), str(dest))
+
+
+def test_hardlink(source_files):
+    counts, files = _stage(AssetStager('hardlink'), source_files)
+    assert counts == {'hardlink': 2}
+    for source, dest in files:
+        assert os.path.samefile(str(source), str(dest))
+        assert not dest.is_symlink()
+
+
+def test_symlink(source_files):
+    counts, files = _stage(AssetStager('symlink'), source_files)
+    assert counts == {'symlink': 2}
+    for source, dest in files:
+        assert dest.is_symlink()
+        assert os.path.samefile(str(source), str(dest))
+
+
+def test_reflink(source_files):
+    """Reflinks fall back to copies on filesystems without them.
+    """
+    counts, files = _stage(AssetStager('reflink'), source_files)
+    assert list(counts.values()) == [2]
+    for source, dest in files:
+        assert not os.path.samefile(str(source), str(dest))
+
+
+def test_blob(source_files, tmpdir):
+    """Blob staging links files from the blob store.
+    """
+    store = BlobStore(Path(str(tmpdir)) / 'blobs')
+    stager = AssetStager('blob', blob_store=store)
+    counts, files = _stage(stager, source_files)
+    assert counts == {'blob': 2}
+    for source, dest in files:
+        blob_path = store.blob_path(store.add(source))
+        assert os.path.samefile(str(blob_path), str(dest))
+        assert not os.path.samefile(str(source), str(dest))
+
+
+def test_fallback(source_files, monkeypatch):
+    """Files are copied when hard links aren't supported, and hard links are
+    only tried once per pair of devices.
+    """
+    attempts = []
+
+    def fail_link(source, dest):
+        attempts.append(dest)
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+    monkeypatch.setattr(os, 'link', fail_link)
+    counts, _ = _stage(AssetStager('hardlink', jobs=1), source_files)
+    assert counts == {'copy': 2}
+    assert len(attempts) == 1
+
+
+def test_replace_existing(source_files):
+    """Staging replaces an existing file in the instance.
+    """
+    stager = AssetStager('hardlink')
+    _stage(stager, source_files)
+    source_files[0].unlink()
+    source_files[0].write_text('new')
+    _stage(stager, source_files)
+
+
+def test_parallel_stage(tmpdir, caplog):
+    """Many files in nested directories are staged concurrently, and the
+    throughput is logged.
+    """
+    caplog.set_level(logging.INFO, logger='nbreport.staging')
+    repo_dir = Path(str(tmpdir)) / 'repo'
+    instance_dir = Path(str(tmpdir)) / 'instance'
+    files = []
+    for i in range(50):
+        source = repo_dir / 'd{0:d}'.format(i % 5) / 'e' \
+            / '{0:d}.txt'.format(i)
+        source.parent.mkdir(parents=True, exist_ok=True)
+        source.write_text(str(i) * 1000)
+        files.append((source, instance_dir / source.relative_to(repo_dir)))
+
+    counts = AssetStager('copy', jobs=4).stage(files)
+
+    assert counts == {'copy': 50}
+    for source, dest in files:
+        assert dest.read_text() == source.read_text()
+    assert 'Staged 50 files' in caplog.text
+    assert 'files/s' in caplog.text
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        AssetStager('teleport')
@@ -4,8 +4,10 @@
 import nbformat
 import pytest
 
-from nbreport.templating import (render_cell, render_notebook,
-                                 load_template_environment)
+from nbreport.templating import (render_cell, render_notebook, render_many,
+                                 load_template_environment,
+                                 load_template_context, TemplateCache,
+                                 index_notebook_templates)
 
 
 def test_render_cell_markdown():
@@ -92,3 +94,154 @@ def test_load_empty_template_environment():
     """
     context, jinja_env = load_template_environment()
     assert len(context['cookiecutter'].keys()) == 0
+
+
+def test_template_cache_memory():
+    """Compiled templates are reused across renders and environments, and
+    the least-recently used template is evicted when the cache is full.
+    """
+    cache = TemplateCache(max_entries=2)
+    source = '# {{ cookiecutter.title }}\n'
+
+    for title in ('First', 'Second'):
+        context, jinja_env = load_template_environment(
+            extra_context={'title': title})
+        cell = render_cell(nbformat.v4.new_markdown_cell(source), context,
+                           jinja_env, template_cache=cache)
+        assert cell.source == '# {0}\n'.format(title)
+    assert len(cache) == 1
+
+    context, jinja_env = load_template_environment(
+        extra_context={'title': 'Third'})
+    cache.get_template('a', jinja_env)
+    cache.get_template('b', jinja_env)
+    assert len(cache) == 2
+
+
+def test_template_cache_disk(tmpdir, monkeypatch):
+    """Compiled templates are loaded from the on-disk cache by a new cache
+    instance, without compiling them again.
+    """
+    directory = tmpdir / 'templates'
+    source = 'answer = {{ cookiecutter.a }} + {{ cookiecutter.b }}\n'
+    context, jinja_env = load_template_environment(
+        extra_context={'a': '10', 'b': '32'})
+
+    cache = TemplateCache(directory=str(directory), max_size=2 ** 20)
+    template = cache.get_template(source, jinja_env)
+    assert template.render(**context) == 'answer = 10 + 32\n'
+    assert len(directory.listdir()) == 1
+
+    def fail_compile(*args, **kwargs):
+        raise AssertionError('Template was compiled again.')
+
+    monkeypatch.setattr(jinja_env, 'compile', fail_compile)
+    cache = TemplateCache(directory=str(directory), max_size=2 ** 20)
+    template = cache.get_template(source, jinja_env)
+    assert template.render(**context) == 'answer = 10 + 32\n'
+
+    cache.clear()
+    assert len(cache) == 0
+    assert len(directory.listdir()) == 0
+
+
+def test_template_cache_disk_eviction(tmpdir):
+    """The on-disk cache is bounded in size.
+    """
+    directory = tmpdir / 'templates'
+    _, jinja_env = load_template_environment()
+
+    cache = TemplateCache(directory=str(directory), max_size=1)
+    cache.get_template('a', jinja_env)
+    cache.get_template('b', jinja_env)
+    assert len(directory.listdir()) == 0
+
+
+def _make_templated_notebook():
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells.append(
+        nbformat.v4.new_markdown_cell('# {{ cookiecutter.title }}\n'))
+    notebook.cells.append(nbformat.v4.new_code_cell('answer = 42\n'))
+    notebook.cells.append(nbformat.v4.new_code_cell(
+        "{% for i in range(2) %}{{ cookiecutter['a'] }}{{ instance_id }}"
+        "{{ cookiecutter.b.upper() }}{% endfor %}\n"))
+    notebook.cells.append(nbformat.v4.new_raw_cell('{# comment #}'))
+    return notebook
+
+
+def test_index_notebook_templates():
+    """The index lists the templated cells and the variables they reference,
+    and is cached for identical notebooks.
+    """
+    _, jinja_env = load_template_environment()
+    index = index_notebook_templates(_make_templated_notebook(), jinja_env)
+
+    assert index.templated_cells == [0, 2, 3]
+    assert index.cell_variables == {
+        0: {'cookiecutter.title'},
+        2: {'cookiecutter.a', 'cookiecutter.b', 'instance_id'},
+        3: set()
+    }
+    assert index is index_notebook_templates(_make_templated_notebook(),
+                                             jinja_env)
+
+
+def test_template_index_context_checks():
+    """Undefined and unused variables are found by comparing the index to the
+    template context.
+    """
+    context, jinja_env = load_template_environment(
+        extra_context={'title': 'Hello', 'a': '1', 'c': '3',
+                       '_extensions': []})
+    index = index_notebook_templates(_make_templated_notebook(), jinja_env)
+
+    assert index.find_undefined_variables(context) == [
+        'cookiecutter.b', 'instance_id']
+    assert index.find_unused_variables(context) == ['cookiecutter.c']
+
+
+def test_render_notebook_templated_cells_only(caplog):
+    """Only templated cells are rendered, and undefined variables are logged
+    before rendering.
+    """
+    context, jinja_env = load_template_environment(
+        extra_context={'title': 'Hello'})
+    notebook = nbformat.v4.new_notebook()
+    notebook.cells.append(
+        nbformat.v4.new_markdown_cell('# {{ cookiecutter.title }}\n'))
+    # Jinja would normalize this cell's newlines if it were rendered
+    notebook.cells.append(nbformat.v4.new_code_cell('answer = 42\r\n'))
+    notebook.cells.append(
+        nbformat.v4.new_code_cell('{% if false %}{{ missing }}{% endif %}'))
+
+    render_notebook(notebook, context, jinja_env)
+
+    assert notebook.cells[0].source == '# Hello\n'
+    assert notebook.cells[1].source == 'answer = 42\r\n'
+    assert notebook.cells[2].source == ''
+    assert 'missing' in caplog.text
+
+
+def test_render_many():
+    """A notebook is rendered for each context, sharing its untemplated cells
+    and compiling its templates once.
+    """
+    notebook = _make_templated_notebook()
+    contexts = [
+        load_template_context(
+            extra_context={'title': title, 'a': '1', 'b': 'x'},
+            system_context={'instance_id': title})
+        for title in ('first', 'second', 'third')]
+    cache = TemplateCache()
+
+    rendered = list(render_many(notebook, contexts, template_cache=cache))
+
+    assert len(cache) == 3
+    assert [nb.cells[0].source for nb in rendered] == [
+        '# first\n', '# second\n', '# third\n']
+    assert rendered[1].cells[2].source == '1secondX1secondX\n'
+    for nb in rendered:
+        assert nb.cells[1] is notebook.cells[1]
+        assert nb.metadata is not notebook.metadata
+    # The template notebook isn't modified
+    assert notebook.cells[0].source == '# {{ cookiecutter.title }}\n'